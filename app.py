@@ -1,23 +1,77 @@
 import os
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import io
+import mmap
+import multiprocessing
+import platform
+import ast
+import codecs
+import contextvars
+import ctypes
+import difflib
+import hashlib
+import heapq
+import queue
+import shutil
+import signal
+import sqlite3
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import textwrap
+import threading
+import time
+import types
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from groq import Groq  # official Groq client
 from dotenv import load_dotenv
+from validators import check_file_syntax
 import json
 import re
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from time import sleep
 from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception
 from fastapi.middleware.cors import CORSMiddleware
 
+try:
+    import fcntl  # POSIX advisory file locks
+except ImportError:
+    fcntl = None
+
+try:
+    import resource  # POSIX resource limits for the startup sandbox
+except ImportError:
+    resource = None
+
+try:
+    import redis  # optional shared backend for multi-host deployments
+except ImportError:
+    redis = None
+
+try:
+    import yaml  # optional, used to validate generated YAML
+except ImportError:
+    yaml = None
+
 # -----------------------------
 # Load API key
 # -----------------------------
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
 
-client = Groq(api_key=groq_api_key)
+client = Groq(api_key=groq_api_key) if groq_api_key else None  # without a key only template generation works
 app = FastAPI(title="Syncro API", version="1.0.0")
 
 # Add CORS middleware
@@ -35,8 +89,45 @@ app.add_middleware(
 DEFAULT_MODEL = "llama-3.3-70b-versatile"  # Primary model
 BACKUP_MODEL = "deepseek-r1-distill-llama-70b"             # Fallback model
 
+# SDLC stages in execution order
+STAGE_ORDER = [
+    "Requirements_GatheringAnd_Analysis",
+    "Design",
+    "Implementation_Development",
+    "Testing_Quality_Assurance",
+    "Deployment",
+    "Maintenance",
+    "Execution_And_Startup"
+]
+
+# Text files from earlier stages that are fed into later stages as context
+CONTEXT_FILE_SUFFIXES = ['.md', '.txt', '.py', '.sql', '.yaml', '.yml', '.json', '.puml']
+STAGE_METADATA_FILE = "stage_metadata.json"
+
+# Inputs each stage is built from, relative to the project folder. The breakdown's
+# per-stage required_files are checked on top of these; nothing is generated for them.
+STAGE_INPUT_MANIFESTS = {
+    "Requirements_GatheringAnd_Analysis": ["description.md"],
+    "Design": [
+        "description.md",
+        "Requirements_GatheringAnd_Analysis/Requirements_GatheringAnd_Analysis.md"
+    ],
+    "Implementation_Development": [
+        "Requirements_GatheringAnd_Analysis/Requirements_GatheringAnd_Analysis.md",
+        "Design/Design.md"
+    ],
+    "Testing_Quality_Assurance": [
+        "Requirements_GatheringAnd_Analysis/Requirements_GatheringAnd_Analysis.md",
+        "Design/Design.md",
+        "Implementation_Development/Implementation_Development.md"
+    ],
+    "Deployment": ["Design/Design.md", "Implementation_Development/Implementation_Development.md"],
+    "Maintenance": ["Implementation_Development/Implementation_Development.md", "Deployment/Deployment.md"],
+    "Execution_And_Startup": ["Implementation_Development/Implementation_Development.md", "Deployment/Deployment.md"]
+}
+
 # Output directory configuration
-OUTPUT_BASE_DIR = Path("/sync_space/output")  # Docker volume mount path
+OUTPUT_BASE_DIR = Path(os.getenv("OUTPUT_BASE_DIR", "/sync_space/output"))  # Docker volume mount path
 OUTPUT_BASE_DIR.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
 
 # -----------------------------
@@ -44,6 +135,10 @@ OUTPUT_BASE_DIR.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
 # -----------------------------
 class ProjectRequest(BaseModel):
     project_description: str
+    generate_name: bool = True  # False skips the LLM and names the project from keywords
+    generation_mode: Optional[Literal["llm", "template", "auto"]] = None  # None uses GENERATION_MODE
+    priority: Optional[Literal["interactive", "pipeline", "batch"]] = None  # LLM scheduling class, default interactive
+    user: Optional[str] = None  # fair-share tenant for LLM scheduling
 
 class SubtaskRequest(BaseModel):
     id: int
@@ -52,6 +147,353 @@ class SubtaskRequest(BaseModel):
     how_to_build: str
     Agent_Name: str
     project_name: str  # folder name for saving
+    force: bool = False  # regenerate even if the stage inputs are unchanged
+    mode: Literal["full", "update"] = "full"  # "update" patches existing stage files instead of rewriting them
+    benchmark: bool = False  # Testing stage only: emit and run a load harness for the Design API contract
+    required_files: List[str] = []  # from the breakdown; checked against the project, never generated
+    generation_mode: Optional[Literal["llm", "template", "auto"]] = None  # None uses GENERATION_MODE
+    run_id: Optional[str] = Field(None, pattern=r"^[\w-]{1,64}$")  # subscribe to /runs/{run_id}/events for progress
+    priority: Optional[Literal["interactive", "pipeline", "batch"]] = None  # LLM scheduling class, default interactive
+    user: Optional[str] = None  # fair-share tenant for LLM scheduling; defaults to the project
+
+# -----------------------------
+# Prompt templates
+# -----------------------------
+# Static instructions go in the system message and per-request values in the
+# user message, so every call of a template shares a byte-identical prefix
+# that provider-side prompt caching (or a local KV cache) can reuse.
+PROMPT_TEMPLATES = {}
+
+class PromptTemplate:
+    """A system/user prompt pair whose system part never changes between calls"""
+
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = textwrap.dedent(system).strip()
+        self.user = textwrap.dedent(user).strip()
+        self.prefix_hash = hashlib.sha256(self.system.encode('utf-8')).hexdigest()
+        PROMPT_TEMPLATES[self.prefix_hash] = self
+
+    def render(self, **values) -> list:
+        """Build the chat messages; only the user message is filled in"""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**values)}
+        ]
+
+BREAKDOWN_PROMPT = PromptTemplate(
+    "breakdown",
+    system="""
+    As a Technical Project Manager, break down the project given by the user into clear, actionable implementation stages.
+
+    For each stage, provide precise, implementation-focused details. Return a JSON array where each object has this structure:
+    {
+        "id": "task_number",
+        "title": "stage_name",  # Must exactly match one of the predefined stages
+        "description": "specific_actionable_tasks",
+        "how_to_build": "step_by_step_guide",
+        "Agent_Name": "role",
+        "required_files": ["file_list"],
+        "dependencies": ["dependencies"],
+        "acceptance_criteria": ["criteria"]
+    }
+
+    Generate tasks for EXACTLY these stages with these EXACT titles (do not modify these titles):
+
+    1. "Requirements_GatheringAnd_Analysis" (Requirements Analyst)
+       - Requirements gathering and documentation
+       - User stories and acceptance criteria
+       - System specifications analysis
+
+    2. "Design" (System Architect)
+       - System architecture design
+       - Database schema design
+       - API contract specification
+
+    3. "Implementation_Development" (Senior Developer)
+       - Core functionality development
+       - Integration implementation
+       - Code structure organization
+
+    4. "Testing_Quality_Assurance" (QA Engineer)
+       - Test planning and scenarios
+       - Test automation implementation
+       - Performance testing metrics
+
+    5. "Deployment" (DevOps Engineer)
+       - Infrastructure configuration
+       - Deployment pipeline setup
+       - Monitoring implementation
+
+    6. "Maintenance" (SRE)
+       - System monitoring setup
+       - Backup procedures
+       - Update protocol implementation
+
+    7. "Execution_And_Startup" (DevOps Engineer)
+       - Startup scripts creation
+       - Running instructions
+       - Quick start guide
+       - Environment setup automation
+
+    Important:
+    - Use EXACTLY these titles in the 'title' field of each task
+    - Do not modify or reformat the titles
+    - Ensure each task title matches its corresponding endpoint
+    - Maintain the exact spelling and underscore format
+
+    Make all descriptions:
+    - Direct and actionable
+    - Technology-specific
+    - With measurable outcomes
+    - Including clear deliverables
+
+    Format each 'how_to_build' with:
+    1. Prerequisites
+    2. Step-by-step commands
+    3. Code snippets
+    4. Configuration examples
+    5. Validation steps
+    """,
+    user="""
+    Project: {project_description}
+    """
+)
+
+PROJECT_NAME_PROMPT = PromptTemplate(
+    "project_name",
+    system="""
+    Generate a unique, memorable, and professional project name for the project description given by the user. The name must be:
+    - Maximum 3 words
+    - No special characters or symbols
+    - Only use letters, numbers, and single spaces
+    - Easy to remember
+    - Related to the project's purpose
+    Return only the name, nothing else.
+    """,
+    user="""
+    Project description: '{project_description}'
+    """
+)
+
+STAGE_DOCUMENT_PROMPT = PromptTemplate(
+    "stage_document",
+    system="""
+    You are an agent in a software delivery team. The user gives you your role, the project,
+    your task and the files produced by the earlier stages.
+
+    CRITICAL: Build upon the previous stage files provided. Reference and use the content from previous stages to ensure continuity and consistency.
+    Make sure your implementation:
+    1. Aligns with requirements from previous stages
+    2. Uses the same naming conventions and structure
+    3. References specific details from previous documents
+    4. Ensures the final project folder will work as a cohesive whole
+
+    Create a detailed markdown document that includes all necessary information, code, diagrams, and specifications.
+    Focus on production-ready, maintainable, and secure solutions.
+    Format your response in clear sections with proper markdown headings.
+    """,
+    user="""
+    You are the {agent_name} working on:
+
+    Project: {project_name}
+    Task ID: {task_id}
+    Title: {title}
+    Description: {description}
+
+    Additional Implementation Guidelines:
+    {how_to_build}
+
+    Required Files Present:
+    {required_files}
+
+    Required Files Not Available (do not assume their contents):
+    {missing_files}
+    {previous_context}
+    """
+)
+
+RELATED_FILES_INSTRUCTIONS = """
+    Generate the necessary implementation files for the task given by the user. For each file, provide:
+    1. The file name with appropriate extension
+    2. The complete file content
+
+    Format your response as:
+    [FILE: filename.ext]
+    content...
+    [END FILE]
+    [FILE: another_file.ext]
+    content...
+    [END FILE]
+
+    CRITICAL INSTRUCTIONS:
+    - Review and reference the previous stage files provided
+    - Ensure consistency with naming conventions, schemas, and APIs from previous stages
+    - Build implementations that work with the existing structure
+    - Use actual values and names from previous documents (e.g., database schema, API endpoints)
+
+    Include appropriate files based on the stage:
+    - Requirements_GatheringAnd_Analysis: Use .md, .yaml, .txt files for requirements and user stories
+    - Design: Use .puml (PlantUML), .sql, .yaml files for architecture and schemas
+    - Implementation_Development: Use .py, .js, .ts, .java files for actual code implementation
+    - Testing_Quality_Assurance: Use _test.py, .spec.js, test_*.py files for test suites
+    - Deployment: Use Dockerfile, docker-compose.yml, .conf, .sh files for deployment
+    - Maintenance: Use .sh, .bat, monitoring configs, backup scripts
+    - Execution_And_Startup: Use start.sh, start.bat, run.py, README_RUN.md, setup_env.sh, QUICK_START.md
+
+    Ensure each file follows best practices and includes:
+    - Proper documentation
+    - Error handling
+    - Logging where appropriate
+    - Configuration options
+    - Security considerations
+    - REFERENCES to previous stage artifacts (schemas, APIs, requirements)
+    """
+
+RELATED_FILES_TASK = """
+    Based on this task:
+    Title: {title}
+    Description: {description}
+    Implementation Details: {how_to_build}
+
+    Original Documentation:
+    {base_content}
+    {previous_files_context}
+    """
+
+RELATED_FILES_PROMPT = PromptTemplate("related_files", system=RELATED_FILES_INSTRUCTIONS, user=RELATED_FILES_TASK)
+
+# Execution_And_Startup gets its own fixed prefix rather than a variable block mid-prompt
+EXECUTION_FILES_PROMPT = PromptTemplate(
+    "execution_files",
+    system=RELATED_FILES_INSTRUCTIONS + """
+    FOR EXECUTION_AND_STARTUP STAGE - MANDATORY FILES TO GENERATE:
+
+    You MUST generate these files:
+    1. start.sh - Bash script to start the application on Unix/Linux/Mac
+    2. start.bat - Batch script to start the application on Windows
+    3. run.py - Cross-platform Python script to run the application
+    4. setup_env.sh - Environment setup script for Unix/Linux/Mac
+    5. setup_env.bat - Environment setup script for Windows
+    6. README_RUN.md - Comprehensive guide on how to run the application
+    7. QUICK_START.md - Quick start guide (1-2 minute setup)
+
+    Analyze the previous stage files to determine:
+    - Entry point: Look in Implementation_Development for main.py, app.py, index.js, etc.
+    - Dependencies: Check requirements.txt, package.json, Dockerfile
+    - Database: Check Design/database_schema.sql for DB initialization
+    - Ports: Check Deployment files for port configurations
+    - Environment variables: Check Deployment/.env or docker-compose.yml
+
+    Make the scripts ACTUALLY WORK with the specific project files generated.
+    Use real file names, real commands, and real configuration from previous stages.
+    """,
+    user=RELATED_FILES_TASK
+)
+
+UPDATE_FILES_PROMPT = PromptTemplate(
+    "update_files",
+    system="""
+    The user gives you a task, its updated documentation, the previous stage files and the
+    CURRENT FILES IN THIS STAGE.
+
+    Update the current files so they are consistent with the documentation and the
+    previous stage files. Do NOT repeat files in full. For each file that needs changes,
+    output search/replace edits:
+    [EDIT: filename.ext]
+    <<<<<<< SEARCH
+    exact lines copied from the current file
+    =======
+    replacement lines
+    >>>>>>> REPLACE
+    [END EDIT]
+
+    Rules:
+    - Each SEARCH must copy the current file exactly and match only one place
+    - Use several SEARCH/REPLACE pairs in one EDIT block for several changes
+    - Omit files that need no changes
+    - For a brand new file use [FILE: filename.ext] content [END FILE]
+    """,
+    user="""
+    Based on this task:
+    Title: {title}
+    Description: {description}
+    Implementation Details: {how_to_build}
+
+    Updated Documentation:
+    {base_content}
+    {previous_files_context}
+
+    CURRENT FILES IN THIS STAGE:
+    {current_context}
+    """
+)
+
+REGENERATE_FILE_PROMPT = PromptTemplate(
+    "regenerate_file",
+    system="""
+    The user gives you stage documentation and the current version of one file.
+    Rewrite that file so it matches the documentation. Return only the
+    complete file in this format:
+    [FILE: filename.ext]
+    content...
+    [END FILE]
+    """,
+    user="""
+    Task: {title}
+    Description: {description}
+
+    Stage documentation:
+    {base_content}
+
+    Current version of {filename}:
+    {current_content}
+    {problem}
+
+    Rewrite {filename} now.
+    """
+)
+
+# Per-process counters; each worker reports its own share
+PROMPT_STATS_LOCK = threading.Lock()
+PROMPT_STATS = {}
+
+def find_prompt_template(messages: list) -> Optional[PromptTemplate]:
+    """Return the template whose system message starts these messages, if any"""
+    if not messages or messages[0].get("role") != "system":
+        return None
+    return PROMPT_TEMPLATES.get(hashlib.sha256(messages[0]["content"].encode('utf-8')).hexdigest())
+
+def record_prompt_usage(messages: list, usage=None):
+    """Count how often a prompt prefix repeats and what the provider reported as cached"""
+    template = find_prompt_template(messages)
+    name = template.name if template else "untemplated"
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    details = getattr(usage, "prompt_tokens_details", None)
+
+    with PROMPT_STATS_LOCK:
+        stats = PROMPT_STATS.setdefault(name, {
+            "calls": 0, "prefix_reuses": 0, "prefix_chars": 0, "prompt_chars": 0,
+            "prompt_tokens": 0, "cached_tokens": 0
+        })
+        if template and stats["calls"] > 0:
+            stats["prefix_reuses"] += 1
+        stats["calls"] += 1
+        stats["prefix_chars"] += len(template.system) if template else 0
+        stats["prompt_chars"] += prompt_chars
+        stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        stats["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+
+@app.get("/metrics/prompts")
+async def prompt_metrics():
+    """Prefix-reuse statistics for the prompt templates in this worker"""
+    with PROMPT_STATS_LOCK:
+        templates = {name: dict(stats) for name, stats in PROMPT_STATS.items()}
+    for stats in templates.values():
+        stats["reuse_rate"] = round(stats["prefix_reuses"] / stats["calls"], 3) if stats["calls"] else 0.0
+        stats["cacheable_fraction"] = round(stats["prefix_chars"] / stats["prompt_chars"], 3) if stats["prompt_chars"] else 0.0
+        stats["provider_cache_rate"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else None
+    return {"worker_pid": os.getpid(), "templates": templates}
 
 # -----------------------------
 # JSON Parser
@@ -226,27 +668,167 @@ def extract_json_array(text: str) -> list:
     except json.JSONDecodeError:
         return []
 
+# -----------------------------
+# Artifact store
+# -----------------------------
+# Generated files live once in a content-addressed blob store; project and stage paths
+# are hard links to the blobs. Writes never modify a blob: they link a (new) blob into
+# place with an atomic rename, so other paths sharing the old content are unaffected.
+# Blobs are read-only; scripts are stored as separate executable blobs, so no mode is
+# ever changed on a shared inode. Files rewritten in place (metadata) stay private, and
+# detach_from_store() copies a linked file out before it is edited in place.
+BLOB_DIR = OUTPUT_BASE_DIR / ".blobs"
+BLOB_MODE = 0o444  # read-only, so an accidental in-place write fails instead of changing every link
+EXECUTABLE_BLOB_MODE = 0o555
+PRIVATE_FILE_MODE = 0o644
+EXECUTABLE_FILE_MODE = 0o755
+EXECUTABLE_SUFFIXES = {'.sh'}  # stored executable; the same bytes under another name are a different blob
+DEDUPE_SKIP_FILES = {STAGE_METADATA_FILE, "project_info.json"}  # rewritten in place, never shared
+
+def blob_path(digest: str, executable: bool = False) -> Path:
+    return BLOB_DIR / digest[:2] / (digest[2:] + ("x" if executable else ""))
+
+def store_blob(data: bytes, executable: bool = False) -> Path:
+    """Store content once, returning the blob path"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest, executable)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.parent / f".{digest}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(temp_path, EXECUTABLE_BLOB_MODE if executable else BLOB_MODE)
+    os.replace(temp_path, path)  # a concurrent writer of the same content ends up with the same bytes
+    return path
+
+def link_into_place(source: Path, target: Path):
+    """Atomically make target a hard link to source"""
+    if target.exists() and os.path.samefile(source, target):
+        return  # rename() between links to the same inode is a no-op and would strand the temp link
+    temp_path = target.parent / f".{target.name}.{uuid.uuid4().hex}.tmp"
+    os.link(source, temp_path)
+    try:
+        os.replace(temp_path, target)
+    except OSError:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+def is_shareable(file_stat: os.stat_result) -> bool:
+    """Whether a file may share its inode with other paths"""
+    return stat.S_ISREG(file_stat.st_mode) and stat.S_IMODE(file_stat.st_mode) in (BLOB_MODE, EXECUTABLE_BLOB_MODE)
+
+def write_private_file(file_path: Path, data: bytes, mode: int = PRIVATE_FILE_MODE):
+    """Atomically write a file with its own inode"""
+    temp_path = file_path.parent / f".{file_path.name}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, file_path)
+
+def write_artifact(file_path: Path, data: bytes):
+    """Write a generated file through the blob store, falling back to a plain file"""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    executable = file_path.suffix in EXECUTABLE_SUFFIXES
+    try:
+        link_into_place(store_blob(data, executable), file_path)
+        return
+    except OSError as e:
+        # Hard links need one filesystem and a link count below the limit
+        print(f"Blob store unavailable for {file_path.name}, writing a plain file: {str(e)}")
+    write_private_file(file_path, data, EXECUTABLE_FILE_MODE if executable else PRIVATE_FILE_MODE)
+
+def detach_from_store(file_path: Path, mode: Optional[int] = None):
+    """Give a linked file its own writable inode before its bytes or mode change in place"""
+    file_stat = file_path.stat()
+    if file_stat.st_nlink > 1 or is_shareable(file_stat):
+        if mode is None:
+            mode = EXECUTABLE_FILE_MODE if file_stat.st_mode & stat.S_IXUSR else PRIVATE_FILE_MODE
+        write_private_file(file_path, file_path.read_bytes(), mode)
+    elif mode is not None:
+        os.chmod(file_path, mode)
+
+def dedupe_existing_files() -> dict:
+    """Move files written before the blob store into it, replacing duplicates with links"""
+    summary = {"files": 0, "linked": 0, "reclaimed_bytes": 0}
+    for dirpath, dirnames, filenames in os.walk(OUTPUT_BASE_DIR):
+        # Stage paths are symlinks into .versions, which is walked directly instead
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') or d == VERSIONS_DIR]
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            if filename.startswith('.') or filename in DEDUPE_SKIP_FILES or path.is_symlink():
+                continue
+            try:
+                file_stat = path.stat()
+                executable = path.suffix in EXECUTABLE_SUFFIXES
+                mode = stat.S_IMODE(file_stat.st_mode)
+                if file_stat.st_nlink > 1 and mode == (EXECUTABLE_BLOB_MODE if executable else BLOB_MODE):
+                    continue  # already in the store (scripts linked read-only by an older release are relinked)
+                if file_stat.st_mode & 0o111 and not executable:
+                    continue  # other executables stay private; a blob's mode is shared by every link
+                summary["files"] += 1
+                blob = blob_path(hash_file(path), executable)
+                if blob.exists():
+                    link_into_place(blob, path)
+                    summary["linked"] += 1
+                    summary["reclaimed_bytes"] += file_stat.st_size
+                else:
+                    # Store a copy rather than adopting the file's inode, so nothing else
+                    # holding that inode (an open editor, another link) turns read-only
+                    link_into_place(store_blob(path.read_bytes(), executable), path)
+            except OSError as e:
+                print(f"Could not dedupe {path}: {str(e)}")
+    return summary
+
+def blob_store_stats() -> dict:
+    """Unique bytes in the blob store against the bytes its links would take as copies"""
+    blobs = unique_bytes = linked_bytes = 0
+    if BLOB_DIR.is_dir():
+        for path in BLOB_DIR.glob('??/*'):
+            if path.name.startswith('.'):
+                continue
+            file_stat = path.stat()
+            blobs += 1
+            unique_bytes += file_stat.st_size
+            linked_bytes += file_stat.st_size * max(file_stat.st_nlink - 1, 0)
+    return {
+        "blobs": blobs,
+        "unique_bytes": unique_bytes,
+        "linked_bytes": linked_bytes,
+        "saved_bytes": max(linked_bytes - unique_bytes, 0)
+    }
+
+@app.get("/storage")
+def get_storage_stats():
+    """How much space content addressing saves"""
+    return blob_store_stats()
+
+@app.post("/storage/dedupe")
+def dedupe_storage():
+    """One-off migration of existing output into the blob store"""
+    with get_state_store().lock("storage-maintenance", timeout=60):
+        summary = dedupe_existing_files()
+    return {**summary, **blob_store_stats()}
+
 def save_content_to_file(file_path: Path, content: str, file_type: str) -> bool:
     """Save content to file with appropriate formatting and error handling"""
     try:
         # Ensure directory exists
         file_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Format content based on file type
+        # Format content based on file type. No generation time goes into the bytes (the
+        # stage metadata has it), so identical output is stored as one blob.
         if file_type == 'md':
             formatted_content = f"# {file_path.stem}\n\n{content}"
-        elif file_type in ['py', 'sql']:
-            formatted_content = f"# Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n{content}"
-        elif file_type in ['yaml', 'yml']:
-            formatted_content = f"# Generated configuration\n# Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n{content}"
         else:
             formatted_content = content
 
-        # Write content to file with appropriate encoding
-        with open(file_path, 'w', encoding='utf-8', newline='\n') as f:
-            f.write(formatted_content)
-            f.flush()  # Ensure content is written to disk
-            os.fsync(f.fileno())  # Force flush to disk
+        # Identical content is stored once and linked into place
+        write_artifact(file_path, formatted_content.encode('utf-8'))
         
         return True
     except Exception as e:
@@ -342,8 +924,6 @@ python {entry_point}
     # Generate README_RUN.md
     readme_content = f"""# How to Run This Project
 
-**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
 ## 🚀 Quick Start (Recommended)
 
 ### For {project_type.upper()} Project
@@ -552,7 +1132,6 @@ For detailed information about each stage:
 
 - Entry Point: `{entry_point}`
 - Project Type: {project_type.upper()}
-- Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 Enjoy your project! 🎉
 """
@@ -638,8 +1217,7 @@ pytest  # or the test command for your project
 ---
 
 **Project:** {project_dir.name if project_dir else 'Unknown'}  
-**Entry Point:** `{entry_point}`  
-**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+**Entry Point:** `{entry_point}`
 """
 
     # Generate setup_env.sh
@@ -801,8 +1379,7 @@ venv\\Scripts\\activate.bat  # Windows
 ---
 
 **Entry Point:** `{entry_point}`  
-**Project Type:** {project_type.upper()}  
-**Last Updated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+**Project Type:** {project_type.upper()}
 """
     
     # Save files
@@ -810,12 +1387,6 @@ venv\\Scripts\\activate.bat  # Windows
         start_sh_path = stage_dir / "start.sh"
         if save_content_to_file(start_sh_path, start_sh_content, 'sh'):
             files_created.append(str(start_sh_path))
-            # Make executable on Unix-like systems
-            try:
-                import stat
-                os.chmod(start_sh_path, os.stat(start_sh_path).st_mode | stat.S_IEXEC)
-            except Exception:
-                pass
         
         start_bat_path = stage_dir / "start.bat"
         if save_content_to_file(start_bat_path, start_bat_content, 'bat'):
@@ -836,12 +1407,6 @@ venv\\Scripts\\activate.bat  # Windows
         setup_sh_path = stage_dir / "setup_env.sh"
         if save_content_to_file(setup_sh_path, setup_env_sh, 'sh'):
             files_created.append(str(setup_sh_path))
-            # Make executable
-            try:
-                import stat
-                os.chmod(setup_sh_path, os.stat(setup_sh_path).st_mode | stat.S_IEXEC)
-            except Exception:
-                pass
         
         setup_bat_path = stage_dir / "setup_env.bat"
         if save_content_to_file(setup_bat_path, setup_env_bat, 'bat'):
@@ -852,14 +1417,364 @@ venv\\Scripts\\activate.bat  # Windows
     
     return files_created
 
-def generate_related_files(subtask: SubtaskRequest, base_content: str) -> dict:
+# -----------------------------
+# Template generation
+# -----------------------------
+# Deterministic, LLM-free output for every stage, built from the breakdown data alone.
+# Used for load testing without a model, as the degraded path when the LLM fails
+# ("auto" mode) and for instant previews. The implementation is a standard-library
+# JSON API, so the generated project runs in the sandbox without installing anything.
+GENERATION_MODES = ("llm", "template", "auto")
+GENERATION_MODE = os.getenv("GENERATION_MODE") or ("llm" if groq_api_key else "template")
+TEMPLATE_GENERATOR = "template-v1"  # stands in for the model name in stage fingerprints
+TEMPLATE_IGNORED_SEGMENTS = {"bin", "usr", "etc", "tmp", "var", "home", "dev", "proc", "opt", "api", "v1", "v2"}
+
+def resolve_generation_mode(requested: Optional[str]) -> str:
+    mode = requested or GENERATION_MODE
+    return mode if mode in GENERATION_MODES else "llm"
+
+def template_resources(*texts: str) -> list:
+    """Resource names from URL paths mentioned in the breakdown ("/hello", "/users/{id}")"""
+    resources = []
+    for text in texts:
+        for segment in re.findall(r'(?<![\w./:])/([A-Za-z][A-Za-z0-9_-]*)', text or ""):
+            name = re.sub(r'[^a-z0-9_]', '_', segment.lower())
+            if name not in TEMPLATE_IGNORED_SEGMENTS and name not in resources:
+                resources.append(name)
+    return resources[:5] or ["items"]
+
+def template_sentences(text: str) -> list:
+    return [s.strip() for s in re.split(r'(?<=[.!?])\s+|\n+', text or "") if len(s.strip()) > 3]
+
+def template_steps(text: str) -> list:
+    return [re.sub(r'^\s*(?:\d+[.)]|[-*])\s*', '', line).strip() for line in (text or "").splitlines() if line.strip()]
+
+def template_context(request: SubtaskRequest, project_dir: Path, previous_stage_data: dict) -> dict:
+    info = read_json_file(project_dir / "project_info.json")
+    project_description = info.get("original_description") or request.description
+    return {
+        "request": request,
+        "project": project_dir.name,
+        "project_description": project_description,
+        "resources": template_resources(project_description, request.description, request.how_to_build),
+        "stories": template_sentences(project_description),
+        "steps": template_steps(request.how_to_build),
+        "previous_files": sorted(previous_stage_data.get('hashes', {}))
+    }
+
+def template_header(context: dict, heading: str) -> list:
+    request = context["request"]
+    return [
+        f"## {heading}", "",
+        f"- **Project:** {context['project']}",
+        f"- **Stage:** {request.title}",
+        f"- **Owner:** {request.Agent_Name}", "",
+        "## Objective", "", request.description, ""
+    ]
+
+def template_plan(context: dict) -> list:
+    lines = ["## Plan", ""]
+    lines += [f"{index}. {step}" for index, step in enumerate(context["steps"], 1)] or ["1. Follow the stage description."]
+    if context["previous_files"]:
+        lines += ["", "## Inputs", ""] + [f"- `{path}`" for path in context["previous_files"]]
+    return lines + [""]
+
+def template_requirements(context: dict) -> tuple:
+    stories = context["stories"] or [context["project_description"]]
+    lines = template_header(context, "Requirements") + ["## User Stories", ""]
+    for index, story in enumerate(stories, 1):
+        lines.append(f"- **US-{index}:** As a user, I want the system to {story[0].lower() + story[1:].rstrip('.')}.")
+    lines += ["", "## Functional Requirements", ""]
+    for resource in context["resources"]:
+        lines += [f"- FR: Clients can list, create and fetch `{resource}` records over HTTP."]
+    lines += ["- FR: A `/health` endpoint reports service status.", "",
+              "## Non-Functional Requirements", "",
+              "- Responses are JSON.", "- The service starts with no external dependencies.", "",
+              "## Acceptance Criteria", ""]
+    lines += [f"- [ ] US-{index} is demonstrably met" for index in range(1, len(stories) + 1)]
+    requirements = {
+        "project": context["project"],
+        "user_stories": [{"id": f"US-{i}", "story": s} for i, s in enumerate(stories, 1)],
+        "resources": context["resources"]
+    }
+    return "\n".join(lines + [""] + template_plan(context)), {"requirements.json": json.dumps(requirements, indent=2)}
+
+def template_design(context: dict) -> tuple:
+    resources = context["resources"]
+    lines = template_header(context, "Architecture") + [
+        "A single stateless HTTP service exposes one JSON collection per resource.", "",
+        "```", "client --> HTTP API --> in-memory store (schema.sql for persistent deployments)", "```", "",
+        "## Endpoints", "", "| Method | Path | Description |", "|---|---|---|",
+        "| GET | /health | Service status |"
+    ]
+    paths = {"/health": {"get": {"summary": "Service status", "responses": {"200": {"description": "OK"}}}}}
+    tables = []
+    for resource in resources:
+        lines += [f"| GET | /{resource} | List {resource} |", f"| POST | /{resource} | Create a {resource} record |",
+                  f"| GET | /{resource}/{{id}} | Fetch one {resource} record |"]
+        paths[f"/{resource}"] = {
+            "get": {"summary": f"List {resource}", "responses": {"200": {"description": "OK"}}},
+            "post": {"summary": f"Create a {resource} record", "responses": {"201": {"description": "Created"}}}
+        }
+        paths[f"/{resource}/{{id}}"] = {"get": {
+            "summary": f"Fetch one {resource} record",
+            "parameters": [{"name": "id", "in": "path", "required": True, "schema": {"type": "integer"}}],
+            "responses": {"200": {"description": "OK"}, "404": {"description": "Not found"}}
+        }}
+        tables.append(f"CREATE TABLE {resource} (\n    id INTEGER PRIMARY KEY,\n    name TEXT NOT NULL,\n"
+                      f"    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP\n);")
+    lines += ["", "## Data Model", ""] + [f"- `{resource}` (id, name, created_at)" for resource in resources]
+    contract = {
+        "openapi": "3.0.3",
+        "info": {"title": context["project"], "version": "1.0.0"},
+        "servers": [{"url": "http://localhost:8000"}],
+        "paths": paths
+    }
+    return "\n".join(lines + [""] + template_plan(context)), {
+        "openapi.json": json.dumps(contract, indent=2),
+        "schema.sql": "\n\n".join(tables)
+    }
+
+TEMPLATE_APP = '''"""__PROJECT__ HTTP API (standard library only)"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESOURCES = __RESOURCES__
+STORE = {name: {1: {"id": 1, "name": "example"}} for name in RESOURCES}
+STORE_LOCK = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self):
+        return [part for part in self.path.split("?")[0].split("/") if part]
+
+    def do_GET(self):
+        parts = self.route()
+        if not parts:
+            return self.send_json(200, {"service": "__PROJECT__", "resources": RESOURCES})
+        if parts == ["health"]:
+            return self.send_json(200, {"status": "ok"})
+        if parts[0] in STORE and len(parts) == 1:
+            with STORE_LOCK:
+                return self.send_json(200, list(STORE[parts[0]].values()))
+        if parts[0] in STORE and len(parts) == 2 and parts[1].isdigit():
+            with STORE_LOCK:
+                item = STORE[parts[0]].get(int(parts[1]))
+            return self.send_json(200, item) if item else self.send_json(404, {"error": "not found"})
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts = self.route()
+        if len(parts) != 1 or parts[0] not in STORE:
+            return self.send_json(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            return self.send_json(400, {"error": "invalid JSON"})
+        if not isinstance(body, dict) or not body.get("name"):
+            return self.send_json(422, {"error": "name is required"})
+        with STORE_LOCK:
+            item = {"id": max(STORE[parts[0]], default=0) + 1, "name": str(body["name"])}
+            STORE[parts[0]][item["id"]] = item
+        self.send_json(201, item)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(port):
+    return ThreadingHTTPServer(("0.0.0.0", port), Handler)
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", "8000"))
+    print(f"Listening on port {port}")
+    create_server(port).serve_forever()
+'''
+
+TEMPLATE_TESTS = '''"""Tests for the __PROJECT__ API"""
+import json
+import os
+import sys
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_app_dir():
+    """app.py next to this file (flattened layout) or in an ancestor's Implementation_Development"""
+    for depth in range(5):
+        directory = os.path.join(HERE, *[".."] * depth)
+        for candidate in (directory, os.path.join(directory, "Implementation_Development")):
+            if os.path.isfile(os.path.join(candidate, "app.py")):
+                return os.path.abspath(candidate)
+    return HERE
+
+
+sys.path.insert(0, find_app_dir())
+
+import app  # noqa: E402
+
+
+class ApiTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = app.create_server(0)
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_health(self):
+        self.assertEqual(self.request("GET", "/health"), (200, {"status": "ok"}))
+
+    def test_create_and_fetch(self):
+        for resource in app.RESOURCES:
+            status, created = self.request("POST", f"/{resource}", {"name": "test"})
+            self.assertEqual(status, 201)
+            self.assertEqual(self.request("GET", f"/{resource}/{created['id']}"), (200, created))
+
+    def test_rejects_missing_name(self):
+        for resource in app.RESOURCES:
+            self.assertEqual(self.request("POST", f"/{resource}", {})[0], 422)
+
+    def test_unknown_path(self):
+        self.assertEqual(self.request("GET", "/does-not-exist")[0], 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
+'''
+
+def template_implementation(context: dict) -> tuple:
+    lines = template_header(context, "Implementation") + [
+        "`app.py` serves every resource from the design as a JSON collection using only the",
+        "Python standard library. Run it with `python app.py` (port from `PORT`, default 8000).", "",
+        "## Modules", "", "- `app.py`: request routing, validation and the in-memory store", ""
+    ]
+    code = (TEMPLATE_APP.replace("__PROJECT__", context["project"])
+            .replace("__RESOURCES__", json.dumps(context["resources"])))
+    return "\n".join(lines + template_plan(context)), {
+        "app.py": code,
+        "requirements.txt": "# No third-party packages required"
+    }
+
+def template_testing(context: dict) -> tuple:
+    lines = template_header(context, "Test Plan") + [
+        "| Case | Expectation |", "|---|---|",
+        "| GET /health | 200 with status ok |",
+        "| POST then GET each resource | 201, then the same record |",
+        "| POST without name | 422 |",
+        "| Unknown path | 404 |", "",
+        "Run with `python -m unittest test_app.py`.", ""
+    ]
+    return "\n".join(lines + template_plan(context)), {
+        "test_app.py": TEMPLATE_TESTS.replace("__PROJECT__", context["project"])
+    }
+
+def template_deployment(context: dict) -> tuple:
+    service = sanitize_project_name(context["project"]).lower()
+    lines = template_header(context, "Deployment") + [
+        "The service ships as one container built from `Implementation_Development/`.", "",
+        "```bash", "docker compose -f Deployment/docker-compose.yml up -d --build", "```", ""
+    ]
+    dockerfile = "\n".join([
+        "FROM python:3.11-slim", "WORKDIR /app", "COPY Implementation_Development/ /app/",
+        "ENV PORT=8000", "EXPOSE 8000",
+        'HEALTHCHECK CMD python -c "import urllib.request; urllib.request.urlopen(\'http://localhost:8000/health\')"',
+        'CMD ["python", "app.py"]'
+    ])
+    compose = "\n".join([
+        "services:", f"  {service}:", "    build:", "      context: ..", "      dockerfile: Deployment/Dockerfile",
+        "    ports:", '      - "8000:8000"', "    restart: unless-stopped"
+    ])
+    return "\n".join(lines + template_plan(context)), {"Dockerfile": dockerfile, "docker-compose.yml": compose}
+
+def template_maintenance(context: dict) -> tuple:
+    lines = template_header(context, "Operations Runbook") + [
+        "- `healthcheck.sh` exits non-zero when `/health` does not answer.",
+        "- `backup.sh` archives the project folder with a timestamp.", "",
+        "## Updates", "", "1. Rebuild the container.", "2. Run the Testing stage suite.", "3. Redeploy.", ""
+    ]
+    healthcheck = "\n".join([
+        "#!/bin/bash", 'URL="${1:-http://localhost:8000/health}"',
+        'curl -fsS "$URL" > /dev/null || { echo "unhealthy: $URL"; exit 1; }', 'echo "healthy"'
+    ])
+    backup = "\n".join([
+        "#!/bin/bash", "set -e", 'DEST="${BACKUP_DIR:-./backups}"', 'mkdir -p "$DEST"',
+        'tar -czf "$DEST/backup_$(date +%Y%m%d_%H%M%S).tar.gz" --exclude="$DEST" .', 'echo "backup written to $DEST"'
+    ])
+    return "\n".join(lines + template_plan(context)), {"healthcheck.sh": healthcheck, "backup.sh": backup}
+
+def template_execution(context: dict) -> tuple:
+    lines = template_header(context, "Running the Project") + [
+        "Start with `./start.sh` (or `start.bat`). See `README_RUN.md` for details.", ""
+    ]
+    return "\n".join(lines + template_plan(context)), {}  # scripts come from generate_execution_fallback_files
+
+STAGE_TEMPLATES = {
+    "Requirements_GatheringAnd_Analysis": template_requirements,
+    "Design": template_design,
+    "Implementation_Development": template_implementation,
+    "Testing_Quality_Assurance": template_testing,
+    "Deployment": template_deployment,
+    "Maintenance": template_maintenance,
+    "Execution_And_Startup": template_execution
+}
+
+def render_stage_template(request: SubtaskRequest, project_dir: Path, previous_stage_data: dict) -> tuple:
+    """(stage document, {filename: content}) for a stage, without the LLM"""
+    builder = STAGE_TEMPLATES.get(request.title, template_execution)
+    return builder(template_context(request, project_dir, previous_stage_data))
+
+def write_template_files(request: SubtaskRequest, stage_dir: Path, project_dir: Path, previous_stage_data: dict) -> list:
+    """Write a stage's template files, returning their paths"""
+    _, files = render_stage_template(request, project_dir, previous_stage_data)
+    files_created = []
+    for index, (filename, content) in enumerate(files.items(), 1):
+        file_path = stage_dir / filename
+        if save_content_to_file(file_path, content, file_path.suffix.lstrip('.')):
+            files_created.append(str(file_path))
+            emit_progress("file_written", file=filename, index=index, total=len(files))
+    if request.title == "Execution_And_Startup":
+        files_created.extend(generate_execution_fallback_files(stage_dir, project_dir, previous_stage_data))
+    return files_created
+
+def generate_related_files(subtask: SubtaskRequest, base_content: str, previous_stage_data: dict = None,
+                           stage_dir: Path = None, generation_mode: str = "llm") -> dict:
     """Generate related files based on subtask type and description"""
     project_dir = OUTPUT_BASE_DIR / sanitize_project_name(subtask.project_name)
-    stage_dir = project_dir / sanitize_project_name(subtask.title)
+    stage_dir = stage_dir or project_dir / sanitize_project_name(subtask.title)
     files_created = []
 
-    # Collect previous stage files
-    previous_stage_data = collect_previous_stage_files(project_dir, subtask.title)
+    # Collect previous stage files (unless the caller already did)
+    if previous_stage_data is None:
+        previous_stage_data = collect_previous_stage_files(project_dir, subtask.title)
     
     # Build context from previous files
     previous_files_context = ""
@@ -877,108 +1792,42 @@ def generate_related_files(subtask: SubtaskRequest, base_content: str) -> dict:
             if len(content) > 1500:
                 previous_files_context += "[... truncated ...]\n"
 
-    # Special handling for Execution_And_Startup stage
-    execution_specific_instructions = ""
-    if subtask.title == "Execution_And_Startup":
-        execution_specific_instructions = """
-    
-    FOR EXECUTION_AND_STARTUP STAGE - MANDATORY FILES TO GENERATE:
-    
-    You MUST generate these files:
-    1. start.sh - Bash script to start the application on Unix/Linux/Mac
-    2. start.bat - Batch script to start the application on Windows
-    3. run.py - Cross-platform Python script to run the application
-    4. setup_env.sh - Environment setup script for Unix/Linux/Mac
-    5. setup_env.bat - Environment setup script for Windows
-    6. README_RUN.md - Comprehensive guide on how to run the application
-    7. QUICK_START.md - Quick start guide (1-2 minute setup)
-    
-    Analyze the previous stage files to determine:
-    - Entry point: Look in Implementation_Development for main.py, app.py, index.js, etc.
-    - Dependencies: Check requirements.txt, package.json, Dockerfile
-    - Database: Check Design/database_schema.sql for DB initialization
-    - Ports: Check Deployment files for port configurations
-    - Environment variables: Check Deployment/.env or docker-compose.yml
-    
-    Make the scripts ACTUALLY WORK with the specific project files generated.
-    Use real file names, real commands, and real configuration from previous stages.
-    """
-
-    # File generation prompt
-    prompt = f"""
-    Based on this task:
-    Title: {subtask.title}
-    Description: {subtask.description}
-    Implementation Details: {subtask.how_to_build}
-    
-    Original Documentation:
-    {base_content}
-    {previous_files_context}
-    {execution_specific_instructions}
-
-    CRITICAL INSTRUCTIONS:
-    - Review and reference the previous stage files listed above
-    - Ensure consistency with naming conventions, schemas, and APIs from previous stages
-    - Build implementations that work with the existing structure
-    - Use actual values and names from previous documents (e.g., database schema, API endpoints)
-    
-    Generate the necessary implementation files. For each file, provide:
-    1. The file name with appropriate extension
-    2. The complete file content
-    
-    Format your response as:
-    [FILE: filename.ext]
-    content...
-    [END FILE]
-    [FILE: another_file.ext]
-    content...
-    [END FILE]
-
-    Include appropriate files based on the stage:
-    - Requirements_GatheringAnd_Analysis: Use .md, .yaml, .txt files for requirements and user stories
-    - Design: Use .puml (PlantUML), .sql, .yaml files for architecture and schemas
-    - Implementation_Development: Use .py, .js, .ts, .java files for actual code implementation
-    - Testing_Quality_Assurance: Use _test.py, .spec.js, test_*.py files for test suites
-    - Deployment: Use Dockerfile, docker-compose.yml, .conf, .sh files for deployment
-    - Maintenance: Use .sh, .bat, monitoring configs, backup scripts
-    - Execution_And_Startup: Use start.sh, start.bat, run.py, README_RUN.md, setup_env.sh, QUICK_START.md
-    
-    Ensure each file follows best practices and includes:
-    - Proper documentation
-    - Error handling
-    - Logging where appropriate
-    - Configuration options
-    - Security considerations
-    - REFERENCES to previous stage artifacts (schemas, APIs, requirements)
-    """
+    # File generation prompt; Execution_And_Startup has its own static instructions
+    template = EXECUTION_FILES_PROMPT if subtask.title == "Execution_And_Startup" else RELATED_FILES_PROMPT
+    messages = template.render(
+        title=subtask.title,
+        description=subtask.description,
+        how_to_build=subtask.how_to_build,
+        base_content=base_content,
+        previous_files_context=previous_files_context
+    )
     
     try:
         # Adjust max_tokens based on stage
         max_tokens = 4000 if subtask.title == "Execution_And_Startup" else 2000
         
-        # Get file suggestions from LLM
-        response = make_llm_call(
-            messages=[{"role": "user", "content": prompt}],
-            model=DEFAULT_MODEL,
-            temperature=0.3,
-            max_tokens=max_tokens
-        )
-        
-        # Parse response and create files
-        file_blocks = re.findall(r'\[FILE: (.*?)\](.*?)\[END FILE\]', 
-                               response, re.DOTALL)
-        
-        for filename, content in file_blocks:
-            filename = filename.strip()
-            content = content.strip()
-            file_path = stage_dir / filename
-            
-            # Get file extension
-            file_ext = Path(filename).suffix.lstrip('.')
+        existing_files = list_existing_stage_files(stage_dir, subtask.title) if subtask.mode == "update" else []
+        update_summary = None
+        if generation_mode == "template":
+            files_created = write_template_files(subtask, stage_dir, project_dir, previous_stage_data)
+        elif existing_files:
+            # Update mode: ask for edits to the current files instead of full rewrites
+            files_created, update_summary = update_related_files(
+                subtask, stage_dir, existing_files, base_content, previous_files_context, max_tokens
+            )
+        else:
+            # Get file suggestions from LLM
+            emit_progress("generating_files")
+            response = make_llm_call(
+                messages=messages,
+                model=DEFAULT_MODEL,
+                temperature=0.3,
+                max_tokens=max_tokens,
+                token_budget=STAGE_TOKEN_BUDGETS.get(subtask.title)
+            )
             
-            # Save the file
-            if save_content_to_file(file_path, content, file_ext):
-                files_created.append(str(file_path))
+            # Parse response and create files
+            files_created = write_file_blocks(stage_dir, response)
         
         # Fallback: Ensure critical files exist for Execution_And_Startup
         if subtask.title == "Execution_And_Startup" and len(files_created) < 3:
@@ -986,29 +1835,35 @@ def generate_related_files(subtask: SubtaskRequest, base_content: str) -> dict:
                 stage_dir, project_dir, previous_stage_data
             ))
         
-        return {
+        result = {
             "stage": subtask.title,
             "project_folder": str(project_dir),
             "files_created": files_created,
+            "generated_by": "template" if generation_mode == "template" else "llm",
             "status": "completed"
         }
+        if update_summary is not None:
+            result["update_summary"] = update_summary
+        return result
 
     except Exception as e:
         print(f"Error generating related files: {str(e)}")
         
-        # Try fallback for Execution_And_Startup even on error
-        if subtask.title == "Execution_And_Startup":
+        # Fall back to templates in auto mode; Execution_And_Startup always gets its scripts
+        if generation_mode == "auto" or subtask.title == "Execution_And_Startup":
             try:
-                print("Attempting fallback file generation for Execution_And_Startup...")
-                fallback_files = generate_execution_fallback_files(
-                    stage_dir, project_dir, previous_stage_data
-                )
+                print(f"Attempting template file generation for {subtask.title}...")
+                if generation_mode == "auto":
+                    fallback_files = write_template_files(subtask, stage_dir, project_dir, previous_stage_data)
+                else:
+                    fallback_files = generate_execution_fallback_files(stage_dir, project_dir, previous_stage_data)
                 if fallback_files:
                     return {
                         "stage": subtask.title,
                         "project_folder": str(project_dir),
                         "files_created": fallback_files,
                         "status": "completed_with_fallback",
+                        "generated_by": "template",
                         "warning": f"Used fallback generation due to error: {str(e)}"
                     }
             except Exception as fallback_error:
@@ -1020,123 +1875,1464 @@ def generate_related_files(subtask: SubtaskRequest, base_content: str) -> dict:
             "status": "failed"
         }
 
+# -----------------------------
+# Artifact reading
+# -----------------------------
+# Generated files can be arbitrarily large; read them through mmap, looking only at the
+# bytes actually needed instead of loading whole files.
+ARTIFACT_PREFIX_BYTES = 8192  # covers the largest per-file excerpt sent to the LLM
+ARTIFACT_SAMPLE_BYTES = 4096  # per sample when checking for binary content
+ARTIFACT_HASH_BLOCK = 1024 * 1024
+ARTIFACT_MAX_READ_BYTES = int(os.getenv("ARTIFACT_MAX_READ_BYTES", str(5 * 1024 * 1024)))  # cap on full reads
+
+@contextmanager
+def mapped_file(path: Path):
+    """Read-only mapping of a file (empty bytes for an empty file, which mmap refuses)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def looks_binary(data) -> bool:
+    """NUL bytes in samples from the start, middle and end of the data"""
+    size = len(data)
+    if size <= 3 * ARTIFACT_SAMPLE_BYTES:
+        return data.find(b'\x00') != -1
+    starts = (0, size // 2 - ARTIFACT_SAMPLE_BYTES // 2, size - ARTIFACT_SAMPLE_BYTES)
+    return any(data.find(b'\x00', start, start + ARTIFACT_SAMPLE_BYTES) != -1 for start in starts)
+
+def stream_hash(data) -> str:
+    """sha256 of a buffer, fed in blocks without copying it"""
+    digest = hashlib.sha256()
+    view = memoryview(data)
+    try:
+        for start in range(0, len(view), ARTIFACT_HASH_BLOCK):
+            digest.update(view[start:start + ARTIFACT_HASH_BLOCK])
+    finally:
+        view.release()
+    return digest.hexdigest()
+
+def hash_file(path: Path) -> str:
+    with mapped_file(path) as data:
+        return stream_hash(data)
+
+# Older saves put the time of writing at the top of .py/.sql/.yaml files. Stage inputs
+# are hashed without it, so identical content always has the same hash.
+DATED_HEADER_PATTERN = re.compile(rb'\A(?:# Generated on: [^\n]*\n\n|# Generated configuration\n# Date: [^\n]*\n\n)')
+DATED_HEADER_MAX_BYTES = 128
+
+def content_hash(data) -> str:
+    """sha256 of a generated file's content, skipping a dated header at its top"""
+    match = DATED_HEADER_PATTERN.match(bytes(data[:DATED_HEADER_MAX_BYTES]))
+    if not match:
+        return stream_hash(data)
+    view = memoryview(data)
+    content = view[match.end():]
+    try:
+        return stream_hash(content)
+    finally:
+        content.release()
+        view.release()
+
+def hash_content_file(path: Path) -> str:
+    with mapped_file(path) as data:
+        return content_hash(data)
+
+def read_artifact(path: Path, prefix_bytes: int = ARTIFACT_PREFIX_BYTES) -> dict:
+    """Size, binary flag, content hash and decoded text prefix of a file"""
+    with mapped_file(path) as data:
+        size = len(data)
+        binary = looks_binary(data)
+        text = None
+        if not binary:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            text = decoder.decode(data[:prefix_bytes], final=size <= prefix_bytes)
+        return {
+            "size": size,
+            "binary": binary,
+            "sha256": content_hash(data),
+            "text": text,
+            "truncated": size > prefix_bytes
+        }
+
+def read_artifact_text(path: Path, limit: int = ARTIFACT_MAX_READ_BYTES) -> str:
+    """Whole text of a file, refusing binary files and files over the size cap"""
+    size = path.stat().st_size
+    if size > limit:
+        raise ValueError(f"{path.name} is {size} bytes, over the {limit} byte limit")
+    with mapped_file(path) as data:
+        if looks_binary(data):
+            raise ValueError(f"{path.name} is binary")
+        return bytes(data).decode('utf-8')
+
+# -----------------------------
+# Stage memoization
+# -----------------------------
+# Bump when prompts or output handling change so old outputs are not reused
+STAGE_FINGERPRINT_VERSION = 3
+STAGE_FINGERPRINT_FIELDS = {
+    "id", "title", "description", "how_to_build", "Agent_Name", "project_name", "benchmark", "required_files"
+}
+# Stored with the stage so a rebuild runs the way the original build did
+STAGE_REPLAY_FIELDS = STAGE_FINGERPRINT_FIELDS | {"generation_mode", "mode", "priority", "user"}
+
+def stage_generator_id(request: SubtaskRequest) -> str:
+    """What writes a stage's content: the model, the templates or the offline batch stand-in"""
+    if resolve_generation_mode(request.generation_mode) == "template":
+        return TEMPLATE_GENERATOR
+    batcher = BULK_BATCHER.get()
+    if batcher is not None and isinstance(batcher.api, LocalBatchAPI):
+        return LOCAL_BATCH_GENERATOR
+    return DEFAULT_MODEL
+
+def compute_stage_fingerprint(request: SubtaskRequest, previous_stage_data: dict) -> str:
+    """Hash of everything a stage's output depends on: request, model and upstream files"""
+    digest = hashlib.sha256()
+    inputs = {
+        "version": STAGE_FINGERPRINT_VERSION,
+        "model": stage_generator_id(request),
+        "request": request.model_dump(include=STAGE_FINGERPRINT_FIELDS)
+    }
+    digest.update(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+    for relative_path in sorted(previous_stage_data['hashes']):
+        digest.update(f"\0{relative_path}\0".encode('utf-8'))
+        digest.update(bytes.fromhex(previous_stage_data['hashes'][relative_path]))
+    return digest.hexdigest()
+
+def load_memoized_stage(stage_dir: Path, input_fingerprint: str):
+    """Return stored stage metadata if it was produced from identical inputs and is intact"""
+    metadata = read_json_file(stage_dir / STAGE_METADATA_FILE)
+    if metadata.get("input_fingerprint") != input_fingerprint:
+        return None
+    if not str(metadata.get("status", "")).startswith("completed"):
+        return None
+    files_generated = metadata.get("files_generated", [])
+    if not files_generated or not all(Path(f).exists() for f in files_generated):
+        return None
+    return metadata
+
+# -----------------------------
+# Downstream invalidation
+# -----------------------------
+def hash_text(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def hash_stage_files(project_dir: Path) -> dict:
+    """Current content hash of every context file in every stage, keyed by relative path"""
+    hashes = {}
+    for stage in STAGE_ORDER:
+        stage_dir = project_dir / sanitize_project_name(stage)
+        if not stage_dir.is_dir():
+            continue
+        for file_path in stage_dir.rglob('*'):
+            if (file_path.is_file() and file_path.name != STAGE_METADATA_FILE
+                    and file_path.suffix in CONTEXT_FILE_SUFFIXES):
+                try:
+                    hashes[str(file_path.relative_to(project_dir))] = hash_content_file(file_path)
+                except OSError:
+                    continue
+    return hashes
+
+def stage_of_path(relative_path: str) -> str:
+    return Path(relative_path).parts[0]
+
+def build_stage_graph(project_dir: Path) -> dict:
+    """Stage dependency graph from the previous_files_referenced recorded by each stage"""
+    graph = {}
+    for stage in STAGE_ORDER:
+        metadata = read_json_file(project_dir / sanitize_project_name(stage) / STAGE_METADATA_FILE)
+        if not metadata:
+            continue
+        referenced = metadata.get("previous_files_referenced", [])
+        graph[stage] = {
+            "depends_on": sorted({stage_of_path(p) for p in referenced},
+                                 key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else 99),
+            "files_referenced": len(referenced),
+            "stale": metadata.get("stale", False)
+        }
+    return graph
+
+def find_stale_stages(project_dir: Path, after_stage: str = None) -> list:
+    """Built stages whose referenced upstream files changed since they were generated.
+
+    Only stages after after_stage are considered when it is given. Stages built
+    before input hashes were recorded cannot be checked and are skipped.
+    """
+    current_hashes = hash_stage_files(project_dir)
+    start = STAGE_ORDER.index(after_stage) + 1 if after_stage in STAGE_ORDER else 0
+    stale = []
+    for index in range(start, len(STAGE_ORDER)):
+        stage = STAGE_ORDER[index]
+        metadata = read_json_file(project_dir / sanitize_project_name(stage) / STAGE_METADATA_FILE)
+        recorded = metadata.get("previous_files_hashes")
+        if recorded is None:
+            continue
+        upstream = set(STAGE_ORDER[:index])
+        current = {path: digest for path, digest in current_hashes.items() if stage_of_path(path) in upstream}
+        # Stages built before the dated header was left out of input hashes recorded raw hashes
+        changed = sorted(p for p in recorded if p in current and current[p] != recorded[p]
+                         and hash_file(project_dir / p) != recorded[p])
+        removed = sorted(p for p in recorded if p not in current)
+        added = sorted(p for p in current if p not in recorded)
+        if changed or removed or added:
+            stale.append({
+                "stage": stage,
+                "changed": changed,
+                "removed": removed,
+                "added": added,
+                "upstream_stages": sorted({stage_of_path(p) for p in changed + removed + added},
+                                          key=STAGE_ORDER.index)
+            })
+    return stale
+
+def mark_stage_stale(project_dir: Path, entry: dict):
+    """Flag a stage as stale in its metadata and in the catalog"""
+    stage_dir = project_dir / sanitize_project_name(entry["stage"])
+    metadata_file = stage_dir / STAGE_METADATA_FILE
+    metadata = read_json_file(metadata_file)
+    metadata["stale"] = True
+    metadata["stale_reason"] = {key: entry[key] for key in ("changed", "removed", "added", "upstream_stages")}
+    metadata["status"] = "stale"
+    try:
+        write_json_file(metadata_file, metadata)
+    except Exception as e:
+        print(f"Failed to mark {entry['stage']} stale: {str(e)}")
+    catalog_record_stage(project_dir, entry["stage"], "stale")
+
+def invalidate_downstream(project_dir: Path, changed_stage: str = None) -> list:
+    """Mark every downstream stage whose referenced inputs changed; untouched stages are left alone"""
+    stale = find_stale_stages(project_dir, after_stage=changed_stage)
+    for entry in stale:
+        mark_stage_stale(project_dir, entry)
+    return stale
+
+def rebuild_stale_stages(project_dir: Path) -> list:
+    """Rebuild stale stages in order, re-checking after each so unaffected stages are skipped"""
+    results = []
+    for stage in STAGE_ORDER:
+        stale = {entry["stage"]: entry for entry in find_stale_stages(project_dir)}
+        if stage not in stale:
+            continue
+        metadata = read_json_file(project_dir / sanitize_project_name(stage) / STAGE_METADATA_FILE)
+        if not metadata.get("request"):
+            results.append({"stage": stage, "status": "skipped", "error": "No stored request to rebuild from"})
+            continue
+        result = execute_subtask(SubtaskRequest(**metadata["request"]))
+        results.append({key: result.get(key) for key in ("stage", "status", "cached", "error")})
+    return results
+
+# -----------------------------
+# Patch-based regeneration
+# -----------------------------
+UPDATE_MODE_MAX_CONTEXT_CHARS = 24000  # current-file content sent along with an update request
+
+FILE_BLOCK_PATTERN = re.compile(r'\[FILE: (.*?)\](.*?)\[END FILE\]', re.DOTALL)
+EDIT_BLOCK_PATTERN = re.compile(r'\[EDIT: (.*?)\](.*?)\[END EDIT\]', re.DOTALL)
+SEARCH_REPLACE_PATTERN = re.compile(
+    r'<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE', re.DOTALL
+)
+
+def write_file_blocks(stage_dir: Path, response: str) -> list:
+    """Save every [FILE: name] ... [END FILE] block in an LLM response"""
+    files_created = []
+    blocks = FILE_BLOCK_PATTERN.findall(response)
+    for index, (filename, content) in enumerate(blocks, 1):
+        filename = filename.strip()
+        content = content.strip()
+        file_path = stage_dir / filename
+        
+        # Get file extension
+        file_ext = Path(filename).suffix.lstrip('.')
+        
+        # Save the file
+        if save_content_to_file(file_path, content, file_ext):
+            files_created.append(str(file_path))
+            emit_progress("file_written", file=filename, index=index, total=len(blocks))
+    return files_created
+
+def strip_generated_header(content: str, file_type: str, stem: str) -> str:
+    """Remove the header save_content_to_file adds (or, for older files, added), so it is not duplicated on re-save"""
+    if file_type == 'md':
+        prefix = f"# {stem}\n\n"
+        return content[len(prefix):] if content.startswith(prefix) else content
+    if file_type in ['py', 'sql']:
+        return re.sub(r'\A# Generated on: [^\n]*\n\n', '', content)
+    if file_type in ['yaml', 'yml']:
+        return re.sub(r'\A# Generated configuration\n# Date: [^\n]*\n\n', '', content)
+    return content
+
+def list_existing_stage_files(stage_dir: Path, stage: str) -> list:
+    """Generated files already in a stage directory, excluding the stage document and metadata"""
+    if not stage_dir.is_dir():
+        return []
+    skip = {STAGE_METADATA_FILE, f"{sanitize_project_name(stage)}.md"}
+    return sorted(
+        p for p in stage_dir.rglob('*')
+        if p.is_file() and p.name not in skip and '__pycache__' not in p.parts
+    )
+
+def apply_search_replace(content: str, edits: list) -> str:
+    """Apply SEARCH/REPLACE pairs in order; each SEARCH must match exactly once"""
+    for search, replace in edits:
+        count = content.count(search)
+        if count == 0 and search.strip():
+            # Tolerate differing leading/trailing blank lines around the block
+            search = search.strip('\n')
+            count = content.count(search)
+        if count != 1:
+            raise ValueError(f"SEARCH block matched {count} times: {search[:60]!r}")
+        content = content.replace(search, replace, 1)
+    return content
+
+def validate_file_content(filename: str, content: str):
+    """Raise ValueError if patched content no longer parses"""
+    error = check_file_syntax(filename, content)["error"]
+    if error:
+        raise ValueError(f"{filename} is not valid after patching: {error}")
+
+def regenerate_file_in_full(subtask: SubtaskRequest, base_content: str, filename: str, current_content: str,
+                            problem: str = "") -> str:
+    """Ask for one complete file; used when its patch does not apply or it fails validation"""
+    messages = REGENERATE_FILE_PROMPT.render(
+        title=subtask.title,
+        description=subtask.description,
+        base_content=base_content[:6000],
+        filename=filename,
+        current_content=current_content[:8000],
+        problem=f"Problem to fix: {problem}" if problem else ""
+    )
+    response = make_llm_call(
+        messages=messages,
+        model=DEFAULT_MODEL,
+        temperature=0.3,
+        max_tokens=2000
+    )
+    blocks = FILE_BLOCK_PATTERN.findall(response)
+    if not blocks:
+        raise ValueError(f"No content returned for {filename}")
+    return blocks[0][1].strip()
+
+def update_related_files(subtask: SubtaskRequest, stage_dir: Path, existing_files: list,
+                         base_content: str, previous_files_context: str, max_tokens: int) -> tuple:
+    """Update existing stage files with search/replace edits, falling back per file to a full rewrite"""
+    current = {}
+    current_context = ""
+    for file_path in existing_files:
+        relative = file_path.relative_to(stage_dir).as_posix()
+        try:
+            raw = read_artifact_text(file_path)
+        except (OSError, UnicodeDecodeError, ValueError):
+            continue
+        current[relative] = strip_generated_header(raw, file_path.suffix.lstrip('.'), file_path.stem)
+        block = f"\n[CURRENT FILE: {relative}]\n{current[relative]}\n[END CURRENT FILE]\n"
+        if len(current_context) + len(block) <= UPDATE_MODE_MAX_CONTEXT_CHARS:
+            current_context += block
+
+    messages = UPDATE_FILES_PROMPT.render(
+        title=subtask.title,
+        description=subtask.description,
+        how_to_build=subtask.how_to_build,
+        base_content=base_content,
+        previous_files_context=previous_files_context,
+        current_context=current_context
+    )
+
+    response = make_llm_call(
+        messages=messages,
+        model=DEFAULT_MODEL,
+        temperature=0.2,
+        max_tokens=max_tokens
+    )
+
+    summary = {"patched": [], "regenerated": [], "new": [], "unchanged": [], "failed": []}
+    files_created = []
+    for filename, body in EDIT_BLOCK_PATTERN.findall(response):
+        filename = filename.strip()
+        file_path = stage_dir / filename
+        file_ext = Path(filename).suffix.lstrip('.')
+        if filename not in current:
+            summary["failed"].append({"file": filename, "error": "Edit targets a file that does not exist"})
+            continue
+        try:
+            patched = apply_search_replace(current[filename], SEARCH_REPLACE_PATTERN.findall(body))
+            validate_file_content(filename, patched)
+            outcome = "patched"
+        except ValueError as e:
+            print(f"Patch for {filename} did not apply ({str(e)}), regenerating in full")
+            try:
+                patched = regenerate_file_in_full(subtask, base_content, filename, current[filename])
+                outcome = "regenerated"
+            except Exception as regen_error:
+                summary["failed"].append({"file": filename, "error": str(regen_error)})
+                continue
+        if save_content_to_file(file_path, patched, file_ext):
+            files_created.append(str(file_path))
+            summary[outcome].append(filename)
+            emit_progress("file_written", file=filename, outcome=outcome)
+
+    # Any complete files are either new files or full rewrites the model chose to send
+    new_files = write_file_blocks(stage_dir, response)
+    files_created.extend(new_files)
+    summary["new"] = [Path(f).relative_to(stage_dir).as_posix() for f in new_files]
+
+    touched = set(summary["patched"] + summary["regenerated"] + summary["new"])
+    summary["unchanged"] = [name for name in current if name not in touched]
+    # Unchanged files are still part of the stage output
+    files_created.extend(str(stage_dir / name) for name in summary["unchanged"])
+    return files_created, summary
+
+# -----------------------------
+# Generated file validation
+# -----------------------------
+VALIDATED_SUFFIXES = {'.py', '.json', '.yaml', '.yml', '.sql'}
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS") or min(4, os.cpu_count() or 1))
+VALIDATION_TIMEOUT = 30  # seconds for one stage's files together
+# Workers start from a clean interpreter: forking a threaded server can copy held locks
+VALIDATION_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+VALIDATION_CACHE_TTL = 7 * 24 * 3600
+VALIDATOR_VERSION = 1  # bump when the checks change so cached results are ignored
+VALIDATION_AUTO_REPAIR = os.getenv("VALIDATION_AUTO_REPAIR", "1") != "0"
+
+# Requirement names that import under a different module name
+PACKAGE_IMPORT_NAMES = {
+    "pyyaml": "yaml", "python_dotenv": "dotenv", "scikit_learn": "sklearn", "pillow": "pil",
+    "beautifulsoup4": "bs4", "psycopg2_binary": "psycopg2", "opencv_python": "cv2",
+    "python_jose": "jose", "pyjwt": "jwt", "python_multipart": "multipart"
+}
+
+_validation_executor = None
+_validation_executor_pid = None
+_validation_executor_lock = threading.Lock()
+
+def get_validation_executor() -> ProcessPoolExecutor:
+    """Per-process pool; a forked worker must not reuse its parent's pool"""
+    global _validation_executor, _validation_executor_pid
+    with _validation_executor_lock:
+        if _validation_executor is None or _validation_executor_pid != os.getpid():
+            _validation_executor = ProcessPoolExecutor(
+                max_workers=VALIDATION_WORKERS,
+                mp_context=multiprocessing.get_context(VALIDATION_START_METHOD)
+            )
+            _validation_executor_pid = os.getpid()
+        return _validation_executor
+
+def recycle_validation_executor(executor: ProcessPoolExecutor):
+    """Replace a pool whose workers are stuck; the next batch starts a fresh one"""
+    global _validation_executor
+    with _validation_executor_lock:
+        if _validation_executor is executor:
+            _validation_executor = None
+    # shutdown() cannot interrupt a running task, so the stuck workers are terminated
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+def known_import_names(project_dir: Path) -> set:
+    """Module names an import may resolve to: stdlib, project modules and listed requirements"""
+    known = {name.lower() for name in sys.stdlib_module_names}
+    for path in project_dir.rglob('*.py'):
+        known.add(path.stem.lower())
+        known.update(part.lower() for part in path.relative_to(project_dir).parts[:-1])
+    for requirements in project_dir.rglob('requirements*.txt'):
+        try:
+            lines = read_artifact_text(requirements).splitlines()
+        except (OSError, UnicodeDecodeError, ValueError):
+            continue
+        for line in lines:
+            match = re.match(r'\s*([A-Za-z0-9][A-Za-z0-9._-]*)', line)
+            if match and not line.lstrip().startswith(('#', '-')):
+                name = re.sub(r'[-.]', '_', match.group(1).lower())
+                known.add(PACKAGE_IMPORT_NAMES.get(name, name))
+    return known
+
+def validate_generated_files(project_dir: Path, file_paths: list) -> dict:
+    """Check generated files in parallel, reusing results for content already seen"""
+    store = get_state_store()
+    results = {}
+    pending = {}
+    skipped = []
+    cached_count = 0
+    for path_str in file_paths:
+        path = Path(path_str)
+        if path.suffix.lower() not in VALIDATED_SUFFIXES or not path.is_file():
+            continue
+        if path.stat().st_size > ARTIFACT_MAX_READ_BYTES:
+            skipped.append(Path(path_str).relative_to(project_dir).as_posix())
+            continue
+        try:
+            raw = read_artifact_text(path)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            results[path_str] = {"error": f"Unreadable: {str(e)}", "imports": []}
+            continue
+        content = strip_generated_header(raw, path.suffix.lstrip('.'), path.stem)
+        key = f"validation:{VALIDATOR_VERSION}:{path.suffix.lower()}:{hash_text(content)}"
+        cached = store.cache_get(key)
+        if cached is not None:
+            results[path_str] = cached
+            cached_count += 1
+        else:
+            pending[path_str] = (key, path.name, content)
+
+    if pending:
+        try:
+            executor = get_validation_executor()
+            futures = {
+                path_str: executor.submit(check_file_syntax, name, content)
+                for path_str, (key, name, content) in pending.items()
+            }
+            # One deadline for the whole batch, however many files are stuck
+            done, not_done = wait_futures(futures.values(), timeout=VALIDATION_TIMEOUT)
+            for path_str, future in futures.items():
+                if future in not_done:
+                    results[path_str] = {"error": "Validation timed out", "imports": [], "timed_out": True}
+                elif future.exception() is None:
+                    results[path_str] = future.result()
+            if not_done:
+                print(f"Validation timed out for {len(not_done)} file(s), restarting the pool")
+                recycle_validation_executor(executor)
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Validation pool unavailable, checking in process: {str(e)}")
+        # Files the pool failed on (it broke or another batch recycled it) are checked here
+        for path_str, (key, name, content) in pending.items():
+            if path_str not in results:
+                results[path_str] = check_file_syntax(name, content)
+        for path_str, (key, name, content) in pending.items():
+            if not results[path_str].get("timed_out"):
+                store.cache_set(key, results[path_str], ttl=VALIDATION_CACHE_TTL)
+
+    known = known_import_names(project_dir)
+    report = {"checked": len(results), "cached": cached_count, "valid": [], "invalid": [], "warnings": [],
+              "skipped_too_large": skipped}
+    for path_str, result in sorted(results.items()):
+        relative = Path(path_str).relative_to(project_dir).as_posix()
+        if result["error"]:
+            report["invalid"].append({"file": relative, "error": result["error"]})
+        else:
+            report["valid"].append(relative)
+        unresolved = [name for name in result["imports"] if name.lower() not in known]
+        if unresolved:
+            report["warnings"].append({"file": relative, "unresolved_imports": unresolved})
+    return report
+
+def repair_queue_name(project_dir: Path, stage: str) -> str:
+    return f"repair:{project_dir.name}:{stage}"
+
+def queue_repairs(project_dir: Path, stage: str, invalid: list) -> list:
+    """Queue one regeneration job per broken file"""
+    store = get_state_store()
+    return [store.enqueue(repair_queue_name(project_dir, stage), entry) for entry in invalid]
+
+def run_repairs(subtask: SubtaskRequest, base_content: str, project_dir: Path) -> dict:
+    """Regenerate the files queued for this stage, keeping a rewrite only if it parses"""
+    store = get_state_store()
+    summary = {"repaired": [], "failed": []}
+    while True:
+        claimed = store.claim(repair_queue_name(project_dir, subtask.title))
+        if claimed is None:
+            break
+        job_id, payload = claimed
+        file_path = project_dir / payload["file"]
+        try:
+            current = strip_generated_header(
+                read_artifact_text(file_path), file_path.suffix.lstrip('.'), file_path.stem
+            )
+            rewritten = regenerate_file_in_full(
+                subtask, base_content, stage_relative_path(project_dir, file_path), current,
+                problem=payload["error"]
+            )
+            error = check_file_syntax(file_path.name, rewritten)["error"]
+            if error:
+                raise ValueError(f"Rewrite is still invalid: {error}")
+            if not save_content_to_file(file_path, rewritten, file_path.suffix.lstrip('.')):
+                raise OSError(f"Could not save {payload['file']}")
+            store.finish(job_id, "done")
+            summary["repaired"].append(payload["file"])
+            emit_progress("file_repaired", file=payload["file"])
+        except Exception as e:
+            print(f"Repair of {payload['file']} failed: {str(e)}")
+            store.finish(job_id, "failed", {"error": str(e)})
+            summary["failed"].append({"file": payload["file"], "error": str(e)})
+    return summary
+
+def validate_and_repair(subtask: SubtaskRequest, base_content: str, project_dir: Path, file_paths: list,
+                        repair: bool = True) -> dict:
+    """Validate generated files and regenerate only the broken ones"""
+    validation = validate_generated_files(project_dir, file_paths)
+    if validation["invalid"] and VALIDATION_AUTO_REPAIR and repair:
+        queue_repairs(project_dir, subtask.title, validation["invalid"])
+        repairs = run_repairs(subtask, base_content, project_dir)
+        if repairs["repaired"]:
+            validation = validate_generated_files(project_dir, file_paths)
+        validation["repairs"] = repairs
+    return validation
+
+@app.post("/projects/{project_name}/stages/{stage}/repair")
+def repair_stage(project_name: str, stage: str):
+    """Re-validate a stage and regenerate only its broken files"""
+    project_dir = resolve_project_dir(project_name)
+    if stage not in STAGE_ORDER:
+        raise HTTPException(status_code=404, detail=f"Unknown stage: {stage}")
+    stage_dir = project_dir / sanitize_project_name(stage)
+    metadata = read_json_file(stage_dir / STAGE_METADATA_FILE)
+    if not metadata.get("request"):
+        raise HTTPException(status_code=409, detail="Stage has not been generated yet")
+    subtask = SubtaskRequest(**metadata["request"])
+    document = stage_dir / f"{sanitize_project_name(stage)}.md"
+    base_content = strip_generated_header(document.read_text(encoding='utf-8'), 'md', document.stem) if document.is_file() else ""
+
+    try:
+        with get_state_store().lock(f"stage:{project_dir.name}:{stage}"):
+            validation = validate_and_repair(subtask, base_content, project_dir, metadata.get("files_generated", []))
+            metadata["validation"] = validation
+            write_json_file(stage_dir / STAGE_METADATA_FILE, metadata)
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail="This stage is being generated. Try again when it finishes.")
+    return {"project": project_dir.name, "stage": stage, "validation": validation}
+
+# -----------------------------
+# Startup sandbox
+# -----------------------------
+# Runs the generated startup in a scratch copy of the project with resource limits and
+# no network, and measures how long it takes to listen on a port (or exit).
+SANDBOX_ENABLED = os.getenv("SANDBOX_ENABLED", "0") == "1"  # run after every Execution_And_Startup build
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "60"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "60"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "1024"))
+SANDBOX_SLOW_SECONDS = float(os.getenv("SANDBOX_SLOW_SECONDS", "30"))
+SANDBOX_REQUIRE_ISOLATION = os.getenv("SANDBOX_REQUIRE_ISOLATION", "1") != "0"
+SANDBOX_OUTPUT_TAIL = 2000
+SANDBOX_POLL_INTERVAL = 0.1
+
+# Stages whose files make up the runnable tree, later stages overriding earlier ones
+SANDBOX_STAGES = ["Implementation_Development", "Deployment", "Execution_And_Startup"]
+
+_network_isolation = None
+
+def network_isolation_available() -> bool:
+    """Whether `unshare -rn` works here (unprivileged user + network namespaces)"""
+    global _network_isolation
+    if _network_isolation is None:
+        try:
+            _network_isolation = bool(shutil.which("unshare")) and subprocess.run(
+                ["unshare", "-rn", "true"], capture_output=True, timeout=10
+            ).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            _network_isolation = False
+    return _network_isolation
+
+def build_sandbox_workspace(project_dir: Path, workspace: Path):
+    """Flatten the implementation, deployment and startup stages into one runnable tree"""
+    for stage in SANDBOX_STAGES:
+        stage_dir = project_dir / sanitize_project_name(stage)
+        if stage_dir.is_dir():
+            shutil.copytree(
+                stage_dir, workspace, dirs_exist_ok=True,
+                ignore=shutil.ignore_patterns(STAGE_METADATA_FILE, '.*')
+            )
+
+def sandbox_command(workspace: Path) -> Optional[list]:
+    if (workspace / "start.sh").is_file():
+        return ["bash", "start.sh"]
+    if (workspace / "run.py").is_file():
+        return [sys.executable, "run.py"]
+    return None
+
+def limit_sandbox_resources():
+    """Runs in the child before exec"""
+    resource.setrlimit(resource.RLIMIT_CPU, (SANDBOX_CPU_SECONDS, SANDBOX_CPU_SECONDS))
+    memory = SANDBOX_MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (256 * 1024 * 1024, 256 * 1024 * 1024))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+def session_pids(session_id: int) -> list:
+    """All live processes in a session, i.e. the sandboxed process tree"""
+    pids = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[3]) == session_id and fields[0] != "Z":
+            pids.append(int(entry.name))
+    return pids
+
+def session_rss_bytes(pids: list) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except (OSError, ValueError):
+            continue
+    return total
+
+def listening_ports(root_pid: int, pids: list) -> list:
+    """TCP ports the process tree is listening on, read from /proc inside its namespace"""
+    inodes = set()
+    for pid in pids:
+        try:
+            for fd in Path(f"/proc/{pid}/fd").iterdir():
+                target = os.readlink(fd)
+                if target.startswith("socket:["):
+                    inodes.add(target[8:-1])
+        except OSError:
+            continue
+    ports = set()
+    for table in ("tcp", "tcp6"):
+        try:
+            lines = Path(f"/proc/{root_pid}/net/{table}").read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 9 and fields[3] == "0A" and fields[9] in inodes:  # 0A = LISTEN
+                ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+    return sorted(ports)
+
+def tail_file(path: Path, limit: int = SANDBOX_OUTPUT_TAIL) -> str:
+    try:
+        with open(path, 'rb') as f:
+            f.seek(max(0, path.stat().st_size - limit))
+            return f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ""
+
+def sandbox_unavailable_reason() -> Optional[str]:
+    if resource is None or not Path("/proc/self/stat").exists():
+        return "Sandbox needs Linux"
+    if not network_isolation_available() and SANDBOX_REQUIRE_ISOLATION:
+        return "Network namespaces are unavailable; set SANDBOX_REQUIRE_ISOLATION=0 to run anyway"
+    return None
+
+def run_sandboxed(command: list, cwd: Path, workspace: Path, timeout: float,
+                  stop_when_listening: bool = True, output_tail: int = SANDBOX_OUTPUT_TAIL) -> dict:
+    """Run a command under the sandbox limits, polling its process tree until ready, exit or timeout"""
+    isolated = network_isolation_available()
+    env = {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "HOME": str(workspace),
+        "LANG": "C.UTF-8",
+        "PYTHONUNBUFFERED": "1",
+        # Fail fast instead of retrying against an unreachable index
+        "PIP_NO_INDEX": "1",
+        "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+        "npm_config_offline": "true"
+    }
+    with open(workspace / "stdout.log", 'wb') as stdout, open(workspace / "stderr.log", 'wb') as stderr:
+        started = time.monotonic()
+        process = subprocess.Popen(
+            (["unshare", "-rn"] if isolated else []) + command,
+            cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=stdout, stderr=stderr,
+            start_new_session=True, preexec_fn=limit_sandbox_resources
+        )
+        peak_rss = 0
+        status, ports, ready_at = "timeout", [], None
+        try:
+            while time.monotonic() - started < timeout:
+                pids = session_pids(process.pid)
+                peak_rss = max(peak_rss, session_rss_bytes(pids))
+                ports = listening_ports(process.pid, pids) if stop_when_listening else []
+                if ports:
+                    status, ready_at = "ready", time.monotonic()
+                    break
+                if process.poll() is not None:
+                    status, ready_at = ("exited" if process.returncode == 0 else "failed"), time.monotonic()
+                    break
+                sleep(SANDBOX_POLL_INTERVAL)
+        finally:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+
+    return {
+        "command": " ".join(command),
+        "network_isolated": isolated,
+        "status": status,
+        "time_to_ready": round(ready_at - started, 3) if ready_at else None,
+        "exit_code": process.returncode if status in ("exited", "failed") else None,
+        "listening_ports": ports,
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+        "stdout_tail": tail_file(workspace / "stdout.log", output_tail),
+        "stderr_tail": tail_file(workspace / "stderr.log")
+    }
+
+def run_startup_sandbox(project_dir: Path) -> dict:
+    """Start the generated project in a sandbox and measure time-to-ready and peak memory"""
+    result = {
+        "ran_at": datetime.now().isoformat(),
+        "limits": {"timeout_seconds": SANDBOX_TIMEOUT, "cpu_seconds": SANDBOX_CPU_SECONDS,
+                   "memory_mb": SANDBOX_MEMORY_MB},
+        "network_isolated": False
+    }
+    reason = sandbox_unavailable_reason()
+    if reason:
+        return {**result, "status": "skipped", "flag": None, "error": reason}
+
+    workspace = Path(tempfile.mkdtemp(prefix="syncro-sandbox-"))
+    try:
+        build_sandbox_workspace(project_dir, workspace / "app")
+        command = sandbox_command(workspace / "app")
+        if command is None:
+            return {**result, "status": "failed", "flag": "broken", "error": "No start.sh or run.py to run"}
+        result.update(run_sandboxed(command, workspace / "app", workspace, SANDBOX_TIMEOUT))
+        if result["status"] in ("failed", "timeout"):
+            result["flag"] = "broken"
+        elif result["time_to_ready"] > SANDBOX_SLOW_SECONDS:
+            result["flag"] = "slow"
+        else:
+            result["flag"] = "ok"
+        return result
+    except Exception as e:
+        print(f"Sandbox run failed for {project_dir.name}: {str(e)}")
+        return {**result, "status": "error", "flag": "broken", "error": str(e)}
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def record_sandbox_result(project_dir: Path, sandbox: dict):
+    """Store a sandbox run in the Execution_And_Startup metadata and flag the project in the catalog"""
+    metadata_file = project_dir / sanitize_project_name("Execution_And_Startup") / STAGE_METADATA_FILE
+    metadata = read_json_file(metadata_file)
+    if metadata:
+        metadata["sandbox"] = sandbox
+        write_json_file(metadata_file, metadata)
+    if sandbox.get("flag"):
+        catalog_flag_startup(project_dir, sandbox["flag"])
+
+@app.post("/projects/{project_name}/sandbox")
+def sandbox_project(project_name: str):
+    """Run the project's generated startup in the sandbox and record the result"""
+    project_dir = resolve_project_dir(project_name)
+    if not (project_dir / sanitize_project_name("Execution_And_Startup")).is_dir():
+        raise HTTPException(status_code=409, detail="Execution_And_Startup has not been generated yet")
+    try:
+        with get_state_store().lock(f"stage:{project_dir.name}:Execution_And_Startup"):
+            sandbox = run_startup_sandbox(project_dir)
+            record_sandbox_result(project_dir, sandbox)
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail="This stage is being generated. Try again when it finishes.")
+    return {"project": project_dir.name, "sandbox": sandbox}
+
+# -----------------------------
+# Benchmark harness
+# -----------------------------
+# The Testing stage can emit a load script for the GET endpoints in the Design stage's
+# API contract. It uses only the standard library so it runs in the offline sandbox.
+BENCHMARK_FILE = "benchmark_harness.py"
+BENCHMARK_DURATION = float(os.getenv("BENCHMARK_DURATION", "10"))  # seconds per endpoint
+BENCHMARK_CONCURRENCY = int(os.getenv("BENCHMARK_CONCURRENCY", "8"))
+BENCHMARK_DEFAULT_PORTS = [8000, 5000, 3000, 8080]
+API_CONTRACT_PATTERN = re.compile(r'(api|openapi|swagger)[\w-]*\.(ya?ml|json)$', re.IGNORECASE)
+
+BENCHMARK_HARNESS_TEMPLATE = '''#!/usr/bin/env python3
+"""HTTP load benchmark for the GET endpoints in the Design stage's API contract.
+
+Standard library only, so it runs without installing anything:
+    python benchmark_harness.py --base-url http://localhost:8000
+    python benchmark_harness.py --start "bash start.sh"   # start the app first
+
+The last line of output is BENCHMARK_RESULT followed by the JSON results.
+"""
+import argparse
+import fcntl
+import json
+import shlex
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ENDPOINTS = __ENDPOINTS__
+PORTS = __PORTS__
+
+
+def bring_up_loopback():
+    """A fresh network namespace starts with lo down; bring it up if we are allowed to"""
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        request = struct.pack("16sh", b"lo", 0)
+        flags = struct.unpack("16sh", fcntl.ioctl(sock, 0x8913, request))[1]  # SIOCGIFFLAGS
+        fcntl.ioctl(sock, 0x8914, struct.pack("16sh", b"lo", flags | 1))  # SIOCSIFFLAGS, IFF_UP
+    except OSError:
+        pass
+
+
+def wait_for_port(ports, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for port in ports:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    return port
+            except OSError:
+                continue
+        time.sleep(0.2)
+    return None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[index] * 1000, 2)
+
+
+def load_endpoint(url, duration, concurrency):
+    latencies, statuses, errors = [], {}, [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=10) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0] + sum(count for status, count in statuses.items() if status >= 500),
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="URL of a running app; found by probing ports if omitted")
+    parser.add_argument("--start", help="command that starts the app before the benchmark")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    app = None
+    if args.start:
+        bring_up_loopback()
+        app = subprocess.Popen(shlex.split(args.start), stdout=sys.stderr, stderr=sys.stderr,
+                               stdin=subprocess.DEVNULL, start_new_session=True)
+    try:
+        base_url = args.base_url
+        if not base_url:
+            port = wait_for_port(PORTS, args.startup_timeout)
+            if port is None:
+                print("BENCHMARK_RESULT " + json.dumps({"status": "failed", "error": "App never opened a port"}))
+                return 1
+            base_url = "http://127.0.0.1:%d" % port
+        results = []
+        for endpoint in ENDPOINTS:
+            result = load_endpoint(base_url.rstrip("/") + endpoint["path"], args.duration, args.concurrency)
+            results.append(dict(endpoint, **result))
+            print("%s %s: %s req/s, p95 %s ms" % (endpoint["method"], endpoint["path"],
+                  result["throughput_rps"], result["latency_ms"]["p95"]), file=sys.stderr)
+        print("BENCHMARK_RESULT " + json.dumps({
+            "status": "completed",
+            "base_url": base_url,
+            "duration_seconds": args.duration,
+            "concurrency": args.concurrency,
+            "endpoints": results,
+            "mean_throughput_rps": round(sum(r["throughput_rps"] for r in results) / max(len(results), 1), 2)
+        }))
+        return 0
+    finally:
+        if app is not None:
+            try:
+                app.send_signal(signal.SIGTERM)
+                app.wait(timeout=5)
+            except Exception:
+                app.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+'''
+
+def find_api_contract(project_dir: Path) -> Optional[dict]:
+    """Parse the first OpenAPI/Swagger document in the Design stage"""
+    design_dir = project_dir / sanitize_project_name("Design")
+    if not design_dir.is_dir():
+        return None
+    for path in sorted(design_dir.rglob('*')):
+        if not path.is_file() or not API_CONTRACT_PATTERN.search(path.name):
+            continue
+        try:
+            text = strip_generated_header(read_artifact_text(path), path.suffix.lstrip('.'), path.stem)
+            document = json.loads(text) if path.suffix == '.json' else (yaml.safe_load(text) if yaml else None)
+        except Exception as e:
+            print(f"Could not parse API contract {path.name}: {str(e)}")
+            continue
+        if isinstance(document, dict) and isinstance(document.get("paths"), dict):
+            return document
+    return None
+
+def contract_benchmark_targets(contract: Optional[dict]) -> tuple:
+    """GET endpoints (path parameters filled with 1) and candidate ports from an API contract"""
+    if not contract:
+        return [{"method": "GET", "path": "/"}], BENCHMARK_DEFAULT_PORTS
+    prefix, ports = "", []
+    if contract.get("basePath"):  # Swagger 2
+        prefix = str(contract["basePath"])
+    port_match = re.search(r':(\d+)$', str(contract.get("host", "")))
+    servers = contract.get("servers") or []  # OpenAPI 3
+    if servers and isinstance(servers[0], dict):
+        server = re.match(r'(?:\w+://)?[^/:]*(?::(\d+))?(/.*)?$', str(servers[0].get("url", "")))
+        if server:
+            port_match = port_match or (server if server.group(1) else None)
+            prefix = prefix or (server.group(2) or "")
+    if port_match:
+        ports.append(int(port_match.group(1)))
+    endpoints = []
+    for path, operations in contract["paths"].items():
+        if isinstance(operations, dict) and "get" in operations:
+            endpoints.append({"method": "GET", "path": prefix.rstrip('/') + re.sub(r'\{[^}]+\}', '1', str(path))})
+    ports += [port for port in BENCHMARK_DEFAULT_PORTS if port not in ports]
+    return endpoints or [{"method": "GET", "path": prefix or "/"}], ports
+
+def write_benchmark_harness(project_dir: Path, stage_dir: Path) -> Path:
+    """Write the load script for the Design stage's API contract into the stage directory"""
+    endpoints, ports = contract_benchmark_targets(find_api_contract(project_dir))
+    harness = (BENCHMARK_HARNESS_TEMPLATE
+               .replace("__ENDPOINTS__", json.dumps(endpoints, indent=4))
+               .replace("__PORTS__", json.dumps(ports)))
+    stage_dir.mkdir(parents=True, exist_ok=True)
+    path = stage_dir / BENCHMARK_FILE
+    write_artifact(path, harness.encode('utf-8'))
+    return path
+
+def guess_app_command(workspace: Path) -> Optional[str]:
+    """How to start the app: the generated startup script, else the implementation entry point"""
+    command = sandbox_command(workspace)
+    if command:
+        return " ".join(command)
+    for entry_point in ("main.py", "app.py", "server.py", "run.py"):
+        if (workspace / entry_point).is_file():
+            return f"{sys.executable} {entry_point}"
+    return None
+
+def run_benchmark(project_dir: Path) -> dict:
+    """Start the app and run the Testing stage's harness against it inside the sandbox"""
+    result = {"ran_at": datetime.now().isoformat()}
+    reason = sandbox_unavailable_reason()
+    if reason:
+        return {**result, "status": "skipped", "error": reason}
+    harness = project_dir / sanitize_project_name("Testing_Quality_Assurance") / BENCHMARK_FILE
+    if not harness.is_file():
+        return {**result, "status": "skipped", "error": f"No {BENCHMARK_FILE} in the Testing stage"}
+
+    workspace = Path(tempfile.mkdtemp(prefix="syncro-benchmark-"))
+    try:
+        build_sandbox_workspace(project_dir, workspace / "app")
+        start = guess_app_command(workspace / "app")
+        if start is None:
+            return {**result, "status": "failed", "error": "No startup script or entry point to run"}
+        shutil.copy2(harness, workspace / "app" / BENCHMARK_FILE)
+        command = [sys.executable, BENCHMARK_FILE, "--start", start,
+                   "--duration", str(BENCHMARK_DURATION), "--concurrency", str(BENCHMARK_CONCURRENCY),
+                   "--startup-timeout", str(SANDBOX_TIMEOUT)]
+        endpoints = len(contract_benchmark_targets(find_api_contract(project_dir))[0])
+        run = run_sandboxed(command, workspace / "app", workspace,
+                            SANDBOX_TIMEOUT + BENCHMARK_DURATION * endpoints + 30,
+                            stop_when_listening=False, output_tail=256 * 1024)
+        lines = [line for line in run["stdout_tail"].splitlines() if line.startswith("BENCHMARK_RESULT ")]
+        if not lines:
+            return {**result, "status": "failed", "error": f"Harness {run['status']} without results",
+                    "stderr_tail": run["stderr_tail"]}
+        return {**result, **json.loads(lines[-1][len("BENCHMARK_RESULT "):]),
+                "network_isolated": run["network_isolated"], "peak_rss_mb": run["peak_rss_mb"]}
+    except Exception as e:
+        print(f"Benchmark failed for {project_dir.name}: {str(e)}")
+        return {**result, "status": "error", "error": str(e)}
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+@app.post("/projects/{project_name}/benchmark")
+def benchmark_project(project_name: str):
+    """Re-run the Testing stage's benchmark harness and store the numbers in its metadata"""
+    project_dir = resolve_project_dir(project_name)
+    stage_dir = project_dir / sanitize_project_name("Testing_Quality_Assurance")
+    if not (stage_dir / BENCHMARK_FILE).is_file():
+        raise HTTPException(status_code=409, detail="The Testing stage was not built with benchmark enabled")
+    try:
+        with get_state_store().lock(f"stage:{project_dir.name}:Testing_Quality_Assurance"):
+            benchmark = run_benchmark(project_dir)
+            metadata = read_json_file(stage_dir / STAGE_METADATA_FILE)
+            if metadata:
+                metadata["benchmark"] = benchmark
+                write_json_file(stage_dir / STAGE_METADATA_FILE, metadata)
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail="This stage is being generated. Try again when it finishes.")
+    return {"project": project_dir.name, "benchmark": benchmark}
+
+# -----------------------------
+# Stage versions
+# -----------------------------
+# Each build is written into <project>/.versions/<stage>/vNNNN. The stage path itself is
+# a relative symlink to the committed version, replaced atomically once the build is
+# complete, so readers never see a half-written stage and older versions stay intact.
+VERSIONS_DIR = ".versions"
+
+def stage_versions_dir(project_dir: Path, stage: str) -> Path:
+    return project_dir / VERSIONS_DIR / sanitize_project_name(stage)
+
+def version_number(version_dir: Path) -> int:
+    match = re.fullmatch(r'v(\d+)', version_dir.name)
+    return int(match.group(1)) if match else 0
+
+def list_stage_versions(project_dir: Path, stage: str) -> list:
+    """Version directories of a stage, oldest first"""
+    versions_dir = stage_versions_dir(project_dir, stage)
+    if not versions_dir.is_dir():
+        return []
+    return sorted((p for p in versions_dir.iterdir() if p.is_dir() and version_number(p)), key=version_number)
+
+def current_stage_version(project_dir: Path, stage: str) -> Optional[Path]:
+    stage_dir = project_dir / sanitize_project_name(stage)
+    if not stage_dir.is_symlink():
+        return None
+    return project_dir / os.readlink(stage_dir)
+
+def point_stage_at(project_dir: Path, stage: str, version_dir: Path):
+    """Atomically switch the stage path to a version"""
+    stage_dir = project_dir / sanitize_project_name(stage)
+    temp_link = project_dir / f".{stage_dir.name}.{uuid.uuid4().hex}.link"
+    os.symlink(os.path.relpath(version_dir, project_dir), temp_link)
+    os.replace(temp_link, stage_dir)
+
+def adopt_stage_directory(project_dir: Path, stage: str):
+    """Turn a plain stage directory from before versioning into version 1"""
+    stage_dir = project_dir / sanitize_project_name(stage)
+    if stage_dir.is_dir() and not stage_dir.is_symlink():
+        version_dir = stage_versions_dir(project_dir, stage) / "v0001"
+        version_dir.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(stage_dir, version_dir)
+        point_stage_at(project_dir, stage, version_dir)
+
+def begin_stage_version(project_dir: Path, stage: str, carry_over: bool = False) -> Path:
+    """Create the next version directory, optionally hard-linking the current version's files into it"""
+    adopt_stage_directory(project_dir, stage)
+    versions_dir = stage_versions_dir(project_dir, stage)
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    existing = list_stage_versions(project_dir, stage)
+    number = version_number(existing[-1]) + 1 if existing else 1
+    while True:
+        version_dir = versions_dir / f"v{number:04d}"
+        try:
+            version_dir.mkdir()
+            break
+        except FileExistsError:
+            number += 1
+
+    current = current_stage_version(project_dir, stage)
+    if carry_over and current is not None and current.is_dir():
+        # Links are free; every later write replaces a link instead of editing the shared file.
+        # Private files (scripts, plain fallbacks) are copied so each version owns its own.
+        for source in current.rglob('*'):
+            if not source.is_file() or source.name == STAGE_METADATA_FILE:
+                continue
+            target = version_dir / source.relative_to(current)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if is_shareable(source.stat()):
+                try:
+                    os.link(source, target)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(source, target)
+    return version_dir
+
+def link_unchanged_files(previous: Optional[Path], version_dir: Path) -> int:
+    """Hard-link files a full rebuild wrote unchanged to the previous version's copies"""
+    linked = 0
+    if previous is None or not previous.is_dir():
+        return linked
+    for target in version_dir.rglob('*'):
+        if target.name == STAGE_METADATA_FILE or target.is_symlink() or not target.is_file():
+            continue
+        source = previous / target.relative_to(version_dir)
+        try:
+            source_stat, target_stat = source.stat(), target.stat()
+        except OSError:
+            continue
+        if (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+            continue  # already the same blob
+        if (not is_shareable(source_stat) or source_stat.st_size != target_stat.st_size
+                or stat.S_IMODE(source_stat.st_mode) != stat.S_IMODE(target_stat.st_mode)):
+            continue
+        try:
+            if hash_file(source) == hash_file(target):
+                link_into_place(source, target)
+                linked += 1
+        except OSError:
+            continue
+    return linked
+
+def discard_stage_version(version_dir: Path):
+    shutil.rmtree(version_dir, ignore_errors=True)
+
+def stage_relative_path(project_dir: Path, file_path: Path) -> str:
+    """Path of a file inside its stage, whether given through the stage path or a version directory"""
+    parts = file_path.relative_to(project_dir).parts
+    return Path(*parts[3:] if parts[0] == VERSIONS_DIR else parts[1:]).as_posix()
+
+def rebase_paths(value, version_dir: Path, stage_dir: Path, project_dir: Path):
+    """Rewrite absolute and project-relative paths inside a version to the stable stage path"""
+    replacements = [
+        (str(version_dir), str(stage_dir)),
+        (version_dir.relative_to(project_dir).as_posix(), stage_dir.relative_to(project_dir).as_posix())
+    ]
+
+    def rebase(item):
+        if isinstance(item, str):
+            for old, new in replacements:
+                if item == old or item.startswith(old + '/'):
+                    return new + item[len(old):]
+            return item
+        if isinstance(item, list):
+            return [rebase(entry) for entry in item]
+        if isinstance(item, dict):
+            return {key: rebase(entry) for key, entry in item.items()}
+        return item
+
+    return rebase(value)
+
+def version_file_hashes(version_dir: Path) -> dict:
+    """Content hash per file; hard-linked files share an inode, so hash each inode once"""
+    hashes, by_inode = {}, {}
+    for path in sorted(version_dir.rglob('*')):
+        if not path.is_file() or path.name == STAGE_METADATA_FILE:
+            continue
+        inode = path.stat().st_ino
+        if inode not in by_inode:
+            by_inode[inode] = hash_file(path)
+        hashes[path.relative_to(version_dir).as_posix()] = by_inode[inode]
+    return hashes
+
+def diff_versions(old_dir: Path, new_dir: Path, path: str = None) -> dict:
+    """Files added, removed and changed between two versions, or a unified diff of one file"""
+    if path:
+        old_file, new_file = old_dir / path, new_dir / path
+        old_text = read_artifact_text(old_file).splitlines(keepends=True) if old_file.is_file() else []
+        new_text = read_artifact_text(new_file).splitlines(keepends=True) if new_file.is_file() else []
+        return {"path": path, "diff": "".join(difflib.unified_diff(
+            old_text, new_text, f"{old_dir.name}/{path}", f"{new_dir.name}/{path}"
+        ))}
+    old_hashes, new_hashes = version_file_hashes(old_dir), version_file_hashes(new_dir)
+    return {
+        "added": sorted(set(new_hashes) - set(old_hashes)),
+        "removed": sorted(set(old_hashes) - set(new_hashes)),
+        "changed": sorted(p for p in set(old_hashes) & set(new_hashes) if old_hashes[p] != new_hashes[p]),
+        "unchanged": sorted(p for p in set(old_hashes) & set(new_hashes) if old_hashes[p] == new_hashes[p])
+    }
+
+def resolve_stage_version(project_dir: Path, stage: str, version: Optional[int]) -> Path:
+    """A version directory by number (current if None), or 404"""
+    if stage not in STAGE_ORDER:
+        raise HTTPException(status_code=404, detail=f"Unknown stage: {stage}")
+    if version is None:
+        current = current_stage_version(project_dir, stage)
+        if current is None:
+            raise HTTPException(status_code=404, detail=f"{stage} has no versions")
+        return current
+    version_dir = stage_versions_dir(project_dir, stage) / f"v{version:04d}"
+    if not (version_dir / STAGE_METADATA_FILE).is_file():
+        raise HTTPException(status_code=404, detail=f"{stage} has no completed version {version}")
+    return version_dir
+
+@app.get("/projects/{project_name}/stages/{stage}/versions")
+def get_stage_versions(project_name: str, stage: str):
+    """Completed versions of a stage, oldest first"""
+    project_dir = resolve_project_dir(project_name)
+    if stage not in STAGE_ORDER:
+        raise HTTPException(status_code=404, detail=f"Unknown stage: {stage}")
+    current = current_stage_version(project_dir, stage)
+    versions = []
+    for version_dir in list_stage_versions(project_dir, stage):
+        metadata = read_json_file(version_dir / STAGE_METADATA_FILE)
+        if not metadata:
+            continue  # build in progress or abandoned
+        versions.append({
+            "version": version_number(version_dir),
+            "timestamp": metadata.get("timestamp"),
+            "status": metadata.get("status"),
+            "files": len(metadata.get("files_generated", [])),
+            "current": current is not None and version_dir.name == current.name
+        })
+    return {"project": project_dir.name, "stage": stage, "versions": versions}
+
+@app.get("/projects/{project_name}/stages/{stage}/diff")
+def get_stage_diff(project_name: str, stage: str, from_version: int, to_version: int = None, path: str = None):
+    """Compare two versions of a stage (to_version defaults to the current one)"""
+    project_dir = resolve_project_dir(project_name)
+    old_dir = resolve_stage_version(project_dir, stage, from_version)
+    new_dir = resolve_stage_version(project_dir, stage, to_version)
+    if path:
+        resolve_project_file(new_dir if (new_dir / path).exists() else old_dir, path)  # refuse traversal
+    try:
+        diff = diff_versions(old_dir, new_dir, path)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"project": project_dir.name, "stage": stage, "from_version": version_number(old_dir),
+            "to_version": version_number(new_dir), **diff}
+
+@app.post("/projects/{project_name}/stages/{stage}/rollback")
+def rollback_stage(project_name: str, stage: str, version: int):
+    """Make an earlier version current again; stages built from the replaced one become stale"""
+    project_dir = resolve_project_dir(project_name)
+    version_dir = resolve_stage_version(project_dir, stage, version)
+    try:
+        with get_state_store().lock(f"stage:{project_dir.name}:{stage}"):
+            point_stage_at(project_dir, stage, version_dir)
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail="This stage is being generated. Try again when it finishes.")
+    metadata = read_json_file(version_dir / STAGE_METADATA_FILE)
+    catalog_record_stage(project_dir, stage, metadata.get("status", "completed"))
+    invalidated = [entry["stage"] for entry in invalidate_downstream(project_dir, stage)]
+    return {"project": project_dir.name, "stage": stage, "version": version, "invalidated_stages": invalidated}
+
 # Modify execute_subtask to include related files generation
 def collect_previous_stage_files(project_dir: Path, current_stage: str) -> dict:
     """Collect files and their contents from previous stages"""
-    stage_order = [
-        "Requirements_GatheringAnd_Analysis",
-        "Design",
-        "Implementation_Development",
-        "Testing_Quality_Assurance",
-        "Deployment",
-        "Maintenance",
-        "Execution_And_Startup"
-    ]
-    
     try:
-        current_index = stage_order.index(current_stage)
+        current_index = STAGE_ORDER.index(current_stage)
     except ValueError:
         current_index = 0
     
     previous_files = {}
+    file_hashes = {}
     file_summaries = []
     
     # Collect files from all previous stages
-    for stage in stage_order[:current_index]:
+    for stage in STAGE_ORDER[:current_index]:
         stage_dir = project_dir / sanitize_project_name(stage)
         if stage_dir.exists():
             for file_path in stage_dir.rglob('*'):
-                if file_path.is_file():
+                if file_path.is_file() and file_path.name != STAGE_METADATA_FILE:
                     try:
-                        # Read file content for text files
-                        if file_path.suffix in ['.md', '.txt', '.py', '.sql', '.yaml', '.yml', '.json', '.puml']:
-                            content = file_path.read_text(encoding='utf-8')
+                        # Only the start of each text file is ever sent to the LLM
+                        if file_path.suffix in CONTEXT_FILE_SUFFIXES:
+                            artifact = read_artifact(file_path)
                             relative_path = file_path.relative_to(project_dir)
-                            previous_files[str(relative_path)] = content
+                            # Binary files still count as inputs, they are just not shown to the LLM
+                            file_hashes[str(relative_path)] = artifact["sha256"]
+                            if artifact["binary"]:
+                                continue
+                            previous_files[str(relative_path)] = artifact["text"]
                             
                             # Create summary for prompt
-                            file_summaries.append(f"- {relative_path} ({len(content)} chars)")
+                            file_summaries.append(f"- {relative_path} ({artifact['size']} bytes)")
                     except Exception as e:
                         print(f"Could not read file {file_path}: {str(e)}")
     
     return {
-        "files": previous_files,
+        "files": previous_files,  # text prefixes of up to ARTIFACT_PREFIX_BYTES
+        "hashes": file_hashes,  # sha256 of the full files, without a dated header
         "summary": "\n".join(file_summaries) if file_summaries else "No previous files found",
         "count": len(previous_files)
     }
 
 def execute_subtask(request: SubtaskRequest):
-    """Execute subtask with improved file handling and required files check"""
-    
-    def check_required_files(project_dir: Path, required_files: list) -> tuple[bool, list, list]:
-        """Check for required files and create placeholders if needed"""
-        missing_files = []
-        created_files = []
-        
-        for file in required_files:
-            if not file:  # Skip empty strings
-                continue
-            file_path = project_dir / file.strip()
-            
-            if not file_path.exists():
-                # Create placeholder files with template content
-                template_content = generate_template_content(file, request)
-                if save_content_to_file(file_path, template_content, file_path.suffix[1:]):
-                    created_files.append(str(file_path))
-                else:
-                    missing_files.append(file)
-                    
-        return len(missing_files) == 0, missing_files, created_files
-
-    # Modified prompt to get clearer file list
-    prompt = f"""
-    Based on this task, list only the input files needed before implementation.
-    Return ONLY a JSON array of filenames, nothing else.
-    
-    Task: {request.title}
-    Description: {request.description}
-    
-    Example format:
-    ["config.yaml", "schema.sql", "requirements.txt"]
-    """
+    """Run a stage while holding its project/stage lock, shared across workers"""
+    lock_name = f"stage:{sanitize_project_name(request.project_name)}:{request.title}"
+    run_id = request.run_id or uuid.uuid4().hex
+    if request.run_id and get_state_store().read_events(run_id):
+        return {"stage": request.title, "status": "failed", "error": f"run_id {run_id} was already used"}
+    with track_run(run_id, stage=request.title, project=sanitize_project_name(request.project_name)):
+        try:
+            with get_state_store().lock(lock_name), track_continuations(), \
+                    llm_priority(request.priority, request.user or sanitize_project_name(request.project_name)):
+                result = run_subtask(request)
+        except LockTimeout:
+            result = {
+                "stage": request.title,
+                "status": "busy",
+                "error": "This stage is already being generated. Try again when it finishes.",
+                "retry": True
+            }
+    finish_run(run_id, result)
+    return {**result, "run_id": run_id}
 
+def run_subtask(request: SubtaskRequest):
+    """Execute subtask with improved file handling and required files check"""
+    version_dir = None
     try:
-        # Get required files list
-        files_response = make_llm_call(
-            messages=[{"role": "user", "content": prompt}],
-            model=DEFAULT_MODEL,  # Updated from hardcoded model name
-            temperature=0.2,
-            max_tokens=500
-        )
-        
-        # Parse required files with improved handling
-        files_response = files_response.strip()
-        required_files = extract_json_array(files_response)
-        
-        # Log the response and parsed files for debugging
-        print(f"Files response: {files_response}")
-        print(f"Parsed required files: {required_files}")
-        
-        # Check if required files exist
         project_dir = OUTPUT_BASE_DIR / sanitize_project_name(request.project_name)
-        files_exist, missing_files, created_files = check_required_files(project_dir, required_files)
-        
-        if created_files:
-            print(f"Created placeholder files: {', '.join(created_files)}")
-        
-        if not files_exist:
-            return {
-                "stage": request.title,
-                "status": "warning",
-                "message": f"Created placeholder files for: {', '.join(created_files)}",
-                "missing_files": missing_files,
-                "project_folder": str(project_dir),
-                "files_created": created_files
-            }
+        stage_dir = project_dir / sanitize_project_name(request.title)
 
         # Collect previous stage files and content
         previous_stage_data = collect_previous_stage_files(project_dir, request.title)
-        
+        emit_progress("context_collected", files=previous_stage_data['count'])
+
+        # Unchanged inputs mean unchanged output: return the stored stage instantly
+        input_fingerprint = compute_stage_fingerprint(request, previous_stage_data)
+        generation_mode = resolve_generation_mode(request.generation_mode)
+        if not request.force:
+            memoized = load_memoized_stage(stage_dir, input_fingerprint)
+            # Template output stored as a fallback is rebuilt once the LLM is asked for again
+            if memoized and memoized.get("generated_by") == "template" and generation_mode != "template":
+                memoized = None
+            if memoized:
+                print(f"Stage {request.title} unchanged, returning stored result")
+                emit_progress("memoized", files=len(memoized["files_generated"]))
+                return {
+                    "stage": request.title,
+                    "project_folder": str(project_dir),
+                    "files_created": memoized["files_generated"],
+                    "required_files_checked": memoized.get("required_files_checked", []),
+                    "required_files_missing": memoized.get("required_files_missing", []),
+                    "previous_files_referenced": memoized.get("previous_files_referenced", [])[:10],
+                    "input_fingerprint": input_fingerprint,
+                    "validation": memoized.get("validation"),
+                    "benchmark": memoized.get("benchmark"),
+                    "generated_by": memoized.get("generated_by", "llm"),
+                    "cached": True,
+                    "status": "completed"
+                }
+
+        # Required inputs come from the stage manifest and the breakdown, not another LLM call
+        required_files, missing_files = check_required_files(project_dir, request, previous_stage_data)
+        if missing_files:
+            print(f"Stage {request.title} inputs not available yet: {', '.join(missing_files)}")
+        emit_progress("required_files_checked", required=required_files, missing=missing_files)
+
         # Build context from previous files
         previous_context = ""
         if previous_stage_data['count'] > 0:
@@ -1154,70 +3350,130 @@ def execute_subtask(request: SubtaskRequest):
                     previous_context += "\n[... content truncated ...]\n"
 
         # Continue with existing implementation
-        implementation_prompt = f"""
-        You are the {request.Agent_Name} working on:
-        
-        Project: {request.project_name}
-        Task ID: {request.id}
-        Title: {request.title}
-        Description: {request.description}
-        
-        Additional Implementation Guidelines:
-        {request.how_to_build}
-        
-        Required Files Present:
-        {', '.join(required_files)}
-        {previous_context}
-        
-        CRITICAL: Build upon the previous stage files listed above. Reference and use the content from previous stages to ensure continuity and consistency.
-        Make sure your implementation:
-        1. Aligns with requirements from previous stages
-        2. Uses the same naming conventions and structure
-        3. References specific details from previous documents
-        4. Ensures the final project folder will work as a cohesive whole
-        
-        Create a detailed markdown document that includes all necessary information, code, diagrams, and specifications.
-        Focus on production-ready, maintainable, and secure solutions.
-        Format your response in clear sections with proper markdown headings.
-        """
+        implementation_messages = STAGE_DOCUMENT_PROMPT.render(
+            agent_name=request.Agent_Name,
+            project_name=request.project_name,
+            task_id=request.id,
+            title=request.title,
+            description=request.description,
+            how_to_build=request.how_to_build,
+            required_files=', '.join(f for f in required_files if f not in missing_files) or "None",
+            missing_files=', '.join(missing_files) or "None",
+            previous_context=previous_context
+        )
 
         # Main implementation call
-        output = make_llm_call(
-            messages=[{"role": "user", "content": implementation_prompt}],
-            model=DEFAULT_MODEL,  # Updated from hardcoded model name
-            temperature=0.3,
-            max_tokens=2000
-        )
+        if generation_mode == "template":
+            output = render_stage_template(request, project_dir, previous_stage_data)[0]
+        else:
+            try:
+                output = make_llm_call(
+                    messages=implementation_messages,
+                    model=DEFAULT_MODEL,  # Updated from hardcoded model name
+                    temperature=0.3,
+                    max_tokens=2000
+                )
+            except Exception as e:
+                if generation_mode != "auto":
+                    raise
+                print(f"LLM unavailable for {request.title} ({str(e)}), using templates")
+                generation_mode = "template"
+                output = render_stage_template(request, project_dir, previous_stage_data)[0]
         
         output = output.strip()
-        stage_dir = project_dir / sanitize_project_name(request.title)
-        file_path = stage_dir / f"{sanitize_project_name(request.title)}.md"
+        emit_progress("document_generated", characters=len(output), generated_by=generation_mode)
+        # Build into a new version; the stage path switches to it only once it is complete
+        version_dir = begin_stage_version(project_dir, request.title, carry_over=request.mode == "update")
+        file_path = version_dir / f"{sanitize_project_name(request.title)}.md"
         
         if save_content_to_file(file_path, output, 'md'):
-            related_files_result = generate_related_files(request, output)
+            related_files_result = generate_related_files(
+                request, output, previous_stage_data, version_dir, generation_mode
+            )
+            if request.title == "Testing_Quality_Assurance" and request.benchmark:
+                harness_path = write_benchmark_harness(project_dir, version_dir)
+                related_files_result.setdefault("files_created", []).append(str(harness_path))
+            emit_progress("validating", files=len(related_files_result.get("files_created", [])))
+            validation = validate_and_repair(
+                request, output, project_dir, related_files_result.get("files_created", []),
+                repair=generation_mode != "template"
+            )
+            emit_progress("validated", valid=len(validation.get("valid", [])), invalid=len(validation.get("invalid", [])),
+                          repaired=len((validation.get("repairs") or {}).get("repaired", [])))
+            sandbox = None
+            benchmark = None
             
             # Save metadata about stage dependencies
             metadata = {
+                "version": version_number(version_dir),
                 "stage": request.title,
+                "status": related_files_result.get("status", "completed"),
                 "timestamp": datetime.now().isoformat(),
+                "input_fingerprint": input_fingerprint,
+                "generated_by": related_files_result.get("generated_by", generation_mode),
+                "request": {
+                    **request.model_dump(include=STAGE_REPLAY_FIELDS),
+                    # The mode asked for, before any template fallback, pinned against later default changes
+                    "generation_mode": resolve_generation_mode(request.generation_mode)
+                },
+                "required_files_checked": required_files,
+                "required_files_missing": missing_files,
                 "previous_files_referenced": list(previous_stage_data['files'].keys()),
+                "previous_files_hashes": previous_stage_data['hashes'],
                 "previous_files_count": previous_stage_data['count'],
-                "files_generated": [str(file_path)] + related_files_result.get("files_created", [])
+                "files_generated": [str(file_path)] + related_files_result.get("files_created", []),
+                "continuations": dict(LLM_CONTINUATIONS.get() or {}),
+                "validation": validation
             }
             
-            metadata_file = stage_dir / "stage_metadata.json"
-            try:
-                with open(metadata_file, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2)
-            except Exception as e:
-                print(f"Failed to save metadata: {str(e)}")
+            # Record paths as seen through the stage path, not the version directory
+            metadata = rebase_paths(metadata, version_dir, stage_dir, project_dir)
+            related_files_result = rebase_paths(related_files_result, version_dir, stage_dir, project_dir)
+            validation = metadata["validation"]
+            file_path = stage_dir / file_path.name
+            metadata_file = stage_dir / STAGE_METADATA_FILE
+            if request.mode != "update":
+                # Update mode started from links already; a full rebuild shares what it left unchanged
+                link_unchanged_files(current_stage_version(project_dir, request.title), version_dir)
+            write_json_file(version_dir / STAGE_METADATA_FILE, metadata)
+            point_stage_at(project_dir, request.title, version_dir)
+            emit_progress("version_committed", version=metadata["version"])
+            version_dir = None  # committed
+
+            catalog_record_stage(project_dir, request.title, related_files_result.get("status", "completed"))
+
+            if request.title == "Testing_Quality_Assurance" and request.benchmark:
+                emit_progress("benchmark_started")
+                benchmark = run_benchmark(project_dir)
+                emit_progress("benchmark_finished", status=benchmark.get("status"))
+                metadata["benchmark"] = benchmark
+                write_json_file(metadata_file, metadata)
+
+            if request.title == "Execution_And_Startup" and SANDBOX_ENABLED:
+                emit_progress("sandbox_started")
+                sandbox = run_startup_sandbox(project_dir)
+                emit_progress("sandbox_finished", status=sandbox.get("status"), flag=sandbox.get("flag"))
+                record_sandbox_result(project_dir, sandbox)
+
+            # Downstream stages built from the old version of this stage are now out of date
+            invalidated = [entry["stage"] for entry in invalidate_downstream(project_dir, request.title)]
             
             return {
                 "stage": request.title,
                 "project_folder": str(project_dir),
                 "files_created": [str(file_path)] + related_files_result.get("files_created", []),
                 "required_files_checked": required_files,
+                "required_files_missing": missing_files,
                 "previous_files_referenced": list(previous_stage_data['files'].keys())[:10],  # Limit to first 10 for display
+                "input_fingerprint": input_fingerprint,
+                "version": metadata["version"],
+                "generated_by": metadata["generated_by"],
+                "cached": False,
+                "invalidated_stages": invalidated,
+                "update_summary": related_files_result.get("update_summary"),
+                "validation": validation,
+                "sandbox": sandbox,
+                "benchmark": benchmark,
                 "status": "completed"
             }
         else:
@@ -1238,116 +3494,134 @@ def execute_subtask(request: SubtaskRequest):
             "error": str(e),
             "status": "failed"
         }
-
-def generate_template_content(filename: str, request: SubtaskRequest) -> str:
-    """Generate template content for different file types"""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    base_template = f"# Generated for project: {request.project_name}\n# Created on: {timestamp}\n\n"
-    
-    if filename.endswith('.md'):
-        return f"{base_template}# {Path(filename).stem}\n\n## Overview\n\n## Details\n"
-    
-    elif filename.endswith('.txt'):
-        return f"{base_template}Project: {request.project_name}\nStage: {request.title}\n"
-    
-    elif filename.endswith('.csv'):
-        return "ID,Title,Description,Status,Priority\n"
-    
-    elif filename.endswith('.docx'):
-        return f"{base_template}This is a placeholder for {filename}. Please replace with actual content."
-    
-    return f"{base_template}Placeholder content for {filename}"
+    finally:
+        if version_dir is not None:
+            discard_stage_version(version_dir)  # never committed; the previous version stays current
+
+def check_required_files(project_dir: Path, request: SubtaskRequest, previous_stage_data: dict) -> tuple:
+    """Return (required, missing) inputs for a stage; bare names match any earlier-stage file"""
+    required = list(dict.fromkeys(
+        STAGE_INPUT_MANIFESTS.get(request.title, []) + [f.strip() for f in request.required_files if f.strip()]
+    ))
+    available_names = {Path(path).name for path in previous_stage_data['hashes']}
+    missing = [
+        file for file in required
+        if not (project_dir / file).is_file() and Path(file).name not in available_names
+    ]
+    return required, missing
 
 # -----------------------------
-# API Endpoints
+# Project naming
 # -----------------------------
-@app.post("/breakdown")
-def breakdown_project(request: ProjectRequest):
-    prompt = f"""
-    As a Technical Project Manager, break down this project into clear, actionable implementation stages:
-
-    Project: {request.project_description}
-
-    For each stage, provide precise, implementation-focused details. Return a JSON array where each object has this structure:
-    {{
-        "id": "task_number",
-        "title": "stage_name",  # Must exactly match one of the predefined stages
-        "description": "specific_actionable_tasks",
-        "how_to_build": "step_by_step_guide",
-        "Agent_Name": "role",
-        "required_files": ["file_list"],
-        "dependencies": ["dependencies"],
-        "acceptance_criteria": ["criteria"]
-    }}
-
-    Generate tasks for EXACTLY these stages with these EXACT titles (do not modify these titles):
-
-    1. "Requirements_GatheringAnd_Analysis" (Requirements Analyst)
-       - Requirements gathering and documentation
-       - User stories and acceptance criteria
-       - System specifications analysis
-
-    2. "Design" (System Architect)
-       - System architecture design
-       - Database schema design
-       - API contract specification
+NAME_GENERATION_TIMEOUT = 15  # seconds to wait for the LLM name once the breakdown is done
+NAME_STOPWORDS = {
+    "a", "an", "the", "and", "or", "for", "with", "to", "of", "in", "on", "at", "by",
+    "from", "that", "this", "is", "are", "be", "it", "its", "as", "into", "using", "use",
+    "create", "build", "make", "develop", "implement", "write", "simple", "basic",
+    "application", "app", "project", "system", "which", "where", "should", "will", "can",
+    "my", "our", "we", "i", "you", "want", "need", "like", "some", "all", "new"
+}
+NAME_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="naming")
+
+def derive_project_name(project_description: str, max_words: int = 3) -> str:
+    """Instant, LLM-free project name built from the description's leading keywords"""
+    words = re.findall(r"[A-Za-z][A-Za-z0-9]*(?:-[A-Za-z0-9]+)*", project_description)
+    keywords = []
+    for word in words:
+        if len(word) < 2 or word.lower() in NAME_STOPWORDS or word.lower() in (k.lower() for k in keywords):
+            continue
+        keywords.append(word if word.isupper() else word.capitalize())
+        if len(keywords) == max_words:
+            break
+    return " ".join(keywords) or "Unnamed Project"
 
-    3. "Implementation_Development" (Senior Developer)
-       - Core functionality development
-       - Integration implementation
-       - Code structure organization
+def generate_project_name(project_description: str) -> str:
+    """Ask the LLM for a short project name, falling back to the keyword name"""
+    messages = PROJECT_NAME_PROMPT.render(project_description=project_description)
 
-    4. "Testing_Quality_Assurance" (QA Engineer)
-       - Test planning and scenarios
-       - Test automation implementation
-       - Performance testing metrics
-
-    5. "Deployment" (DevOps Engineer)
-       - Infrastructure configuration
-       - Deployment pipeline setup
-       - Monitoring implementation
+    try:
+        generated_name = make_llm_call(
+            messages=messages,
+            model=DEFAULT_MODEL,
+            temperature=0.7,
+            max_tokens=50
+        ).strip()
+        if generated_name:
+            return generated_name
+    except Exception as e:
+        print(f"Failed to generate project name: {str(e)}")
+    return derive_project_name(project_description)
+
+def create_project(project_description: str, generated_name: str) -> str:
+    """Reserve a unique project folder and write its project_info.json and description.md"""
+    sanitized_name = sanitize_project_name(generated_name)
+    project_info = {
+        "original_description": project_description,
+        "generated_name": generated_name,
+        "created_at": datetime.now().isoformat(),
+        "sanitized_name": sanitized_name
+    }
+    unique_name = catalog_reserve_project_name(sanitized_name)
+    project_info = {"name": unique_name, **project_info}
+    project_dir = OUTPUT_BASE_DIR / unique_name
 
-    6. "Maintenance" (SRE)
-       - System monitoring setup
-       - Backup procedures
-       - Update protocol implementation
+    with open(project_dir / "project_info.json", 'w', encoding='utf-8') as f:
+        json.dump(project_info, f, indent=2)
+    with open(project_dir / "description.md", 'w', encoding='utf-8') as f:
+        f.write(f"# {unique_name}\n\n## Project Description\n\n{project_description}")
 
-    7. "Execution_And_Startup" (DevOps Engineer)
-       - Startup scripts creation
-       - Running instructions
-       - Quick start guide
-       - Environment setup automation
+    catalog_register_project(project_dir, project_info)
+    return unique_name
 
-    Important:
-    - Use EXACTLY these titles in the 'title' field of each task
-    - Do not modify or reformat the titles
-    - Ensure each task title matches its corresponding endpoint
-    - Maintain the exact spelling and underscore format
+# -----------------------------
+# API Endpoints
+# -----------------------------
+@app.post("/breakdown")
+def breakdown_project(request: ProjectRequest):
+    """Break a project into stages and name it; both LLM calls run concurrently"""
+    with llm_priority(request.priority, request.user):
+        return run_project_breakdown(request)
+
+def run_project_breakdown(request: ProjectRequest) -> dict:
+    template_mode = resolve_generation_mode(request.generation_mode) == "template"
+    if request.generate_name and not template_mode:
+        # The naming thread inherits the caller's scheduling class and tenant
+        name_future = NAME_EXECUTOR.submit(contextvars.copy_context().run, generate_project_name,
+                                           request.project_description)
+    else:
+        name_future = None
+
+    # Template mode uses the standard stage definitions; generation fills in the project details
+    subtasks = ensure_all_stages([]) if template_mode else run_breakdown(request.project_description)
+
+    generated_name = None
+    if name_future is not None:
+        try:
+            generated_name = name_future.result(timeout=NAME_GENERATION_TIMEOUT)
+        except FutureTimeoutError:
+            print("Project name generation timed out, using keyword name")
+    if not generated_name:
+        generated_name = derive_project_name(request.project_description)
 
-    Make all descriptions:
-    - Direct and actionable
-    - Technology-specific
-    - With measurable outcomes
-    - Including clear deliverables
+    project_name = create_project(request.project_description, generated_name)
+    return {
+        "project": request.project_description,
+        "project_name": project_name,
+        "subtasks": subtasks
+    }
 
-    Format each 'how_to_build' with:
-    1. Prerequisites
-    2. Step-by-step commands
-    3. Code snippets
-    4. Configuration examples
-    5. Validation steps
-    """
+def run_breakdown(project_description: str) -> list:
+    """Ask the LLM to break a project description into the seven SDLC stages"""
+    messages = BREAKDOWN_PROMPT.render(project_description=project_description)
 
     try:
-        completion = client.chat.completions.create(
+        response_text = make_llm_call(
+            messages=messages,
             model=DEFAULT_MODEL,
-            messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
             max_tokens=2000,
-            top_p=0.9,
+            top_p=0.9
         )
-
-        response_text = completion.choices[0].message.content
         subtasks = parse_llm_json(response_text)
         
         # Ensure all 7 stages are present
@@ -1355,15 +3629,130 @@ def breakdown_project(request: ProjectRequest):
         
         print(f"Breakdown complete: {len(subtasks)} stages generated")
         
-        return {"project": request.project_description, "subtasks": subtasks}
+        return subtasks
         
     except Exception as e:
         print(f"Error in breakdown: {str(e)}")
         # Return all stages with default descriptions as fallback
-        return {
-            "project": request.project_description,
-            "subtasks": ensure_all_stages([])
-        }
+        return ensure_all_stages([])
+
+# -----------------------------
+# Batch breakdown
+# -----------------------------
+# Backlogs of descriptions are broken down from a JSONL file, either uploaded as the
+# request body or read from BATCH_INPUT_DIR. Only `concurrency` lines are in flight
+# at a time and results stream back as they finish, so memory does not grow with the
+# batch. Every LLM call still goes through the shared per-minute limiter.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+BATCH_INPUT_DIR = Path(os.getenv("BATCH_INPUT_DIR", Path(__file__).resolve().parent))
+BATCH_INPUT_SUFFIXES = {".jsonl", ".ndjson"}
+BATCH_SPOOL_BYTES = 1024 * 1024  # uploads larger than this are spooled to disk
+
+def parse_batch_line(line_number: int, line: str) -> tuple:
+    """Return (item_id, ProjectRequest) for one JSONL line; raises ValueError if unusable"""
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(item, dict):
+        raise ValueError("each line must be a JSON object")
+    item_id = item.get("id") or item.get("request_id") or line_number
+    # Backlog entries carry a title and body instead of a description
+    description = item.get("project_description") or item.get("description") or "\n\n".join(
+        str(item[key]).strip() for key in ("title", "body") if item.get(key)
+    )
+    if not description:
+        raise ValueError("no project_description, description or title/body")
+    options = {key: item[key] for key in ("generate_name", "generation_mode") if key in item}
+    return item_id, ProjectRequest(project_description=description, **options)
+
+def iter_batch_lines(source):
+    """Yield (line_number, text) for the non-blank lines of a binary JSONL stream"""
+    for line_number, raw in enumerate(source, 1):
+        line = raw.decode("utf-8", errors="replace").strip()
+        if line:
+            yield line_number, line
+
+def run_batch_item(line_number: int, line: str, tenant: str) -> dict:
+    """Break down one batch line, reporting failures in the result instead of raising"""
+    item_id = line_number
+    try:
+        item_id, project_request = parse_batch_line(line_number, line)
+        # The whole batch is one tenant in the batch class, however many projects it creates
+        result = breakdown_project(project_request.model_copy(update={"priority": "batch", "user": tenant}))
+        return {"line": line_number, "id": item_id, "status": "completed",
+                "project_name": result["project_name"], "subtasks": result["subtasks"]}
+    except Exception as e:
+        print(f"Batch line {line_number} failed: {str(e)}")
+        return {"line": line_number, "id": item_id, "status": "failed", "error": str(e)}
+
+def stream_batch(source, concurrency: int, tenant: str):
+    """Run a JSONL batch with at most `concurrency` lines in flight, yielding NDJSON as each finishes"""
+    started = time.monotonic()
+    counts = {"completed": 0, "failed": 0}
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    pending = set()
+    lines = iter_batch_lines(source)
+    try:
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < concurrency:
+                next_line = next(lines, None)
+                if next_line is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(run_batch_item, *next_line, tenant))
+            if not pending:
+                break
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                counts[result["status"]] += 1
+                yield json.dumps(result) + "\n"
+        yield json.dumps({
+            "status": "batch_completed",
+            "total": counts["completed"] + counts["failed"],
+            **counts,
+            "elapsed_seconds": round(time.monotonic() - started, 3)
+        }) + "\n"
+    finally:
+        # A disconnected client stops the batch; lines already running finish on their own
+        executor.shutdown(wait=False, cancel_futures=True)
+        source.close()
+
+def open_batch_input(path: str):
+    """Open a JSONL file under BATCH_INPUT_DIR"""
+    base = BATCH_INPUT_DIR.resolve()
+    file_path = (base / path).resolve()
+    if not file_path.is_relative_to(base) or file_path.suffix.lower() not in BATCH_INPUT_SUFFIXES:
+        raise HTTPException(status_code=400, detail=f"path must be a .jsonl file under {base}")
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail=f"Batch file not found: {path}")
+    return open(file_path, 'rb')
+
+@app.post("/breakdown/batch")
+async def breakdown_batch(
+    request: Request,
+    path: Optional[str] = None,
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY),
+    user: Optional[str] = None
+):
+    """Break down every line of a JSONL body or file, streaming one JSON result per line"""
+    tenant = user or f"batch-{uuid.uuid4().hex[:8]}"
+    if path:
+        source = open_batch_input(path)
+    else:
+        source = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+        async for chunk in request.stream():
+            source.write(chunk)
+        if not source.tell():
+            source.close()
+            raise HTTPException(status_code=400, detail="Send JSONL in the request body or pass ?path=")
+        source.seek(0)
+
+    return StreamingResponse(stream_batch(source, concurrency, tenant), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
 
 # -----------------------------
 # Endpoints for all SDLC stages
@@ -1413,6 +3802,1468 @@ async def health_check():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# -----------------------------
+# Project file browser
+# -----------------------------
+FILE_PAGE_SIZE_MAX = 200
+FILE_CHUNK_DEFAULT_BYTES = 64 * 1024
+FILE_CHUNK_MAX_BYTES = 1024 * 1024
+
+def classify_file(file_name: str) -> str:
+    """Group a generated file into a display category"""
+    file_type = Path(file_name).suffix.lower()
+    if '_test' in file_name or file_name.startswith('test_') or file_name.endswith('.spec.js'):
+        return 'Tests'
+    elif file_name in ['start.sh', 'start.bat', 'run.py', 'setup_env.sh', 'setup_env.bat']:
+        return 'Startup Scripts'
+    elif file_name in ['README_RUN.md', 'QUICK_START.md', 'HOW_TO_RUN.md']:
+        return 'How To Run'
+    elif file_name == 'Dockerfile' or file_name.startswith('docker-compose'):
+        return 'Deployment'
+    elif file_type in ['.yml', '.yaml', '.json', '.env', '.conf']:
+        return 'Configuration'
+    elif file_type in ['.py', '.js', '.ts', '.java']:
+        return 'Source Code'
+    elif file_type in ['.md', '.txt']:
+        return 'Documentation'
+    elif file_type in ['.sql', '.puml']:
+        return 'Design Artifacts'
+    elif file_type in ['.sh', '.bat']:
+        return 'Scripts'
+    return 'Other'
+
+def resolve_project_dir(project_name: str) -> Path:
+    """Return an existing project directory or raise 404"""
+    project_dir = OUTPUT_BASE_DIR / sanitize_project_name(project_name)
+    if not project_dir.is_dir():
+        raise HTTPException(status_code=404, detail=f"Project not found: {project_name}")
+    return project_dir
+
+def resolve_project_file(project_dir: Path, relative_path: str) -> Path:
+    """Resolve a project-relative path, refusing anything outside the project"""
+    file_path = (project_dir / relative_path).resolve()
+    if project_dir.resolve() not in file_path.parents or not file_path.is_file():
+        raise HTTPException(status_code=404, detail=f"File not found: {relative_path}")
+    return file_path
+
+def list_project_files(project_dir: Path, stage: str = None, file_type: str = None) -> list:
+    """List project files sorted by path, optionally filtered by stage and category"""
+    root = project_dir / sanitize_project_name(stage) if stage else project_dir
+    if not root.is_dir():
+        return []
+
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        # Skip hidden bookkeeping directories
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            category = classify_file(filename)
+            if file_type and category != file_type:
+                continue
+            file_path = Path(dirpath) / filename
+            relative_path = file_path.relative_to(project_dir)
+            top_level = relative_path.parts[0] if len(relative_path.parts) > 1 else ""
+            try:
+                file_stat = file_path.stat()
+            except OSError:
+                continue
+            entries.append({
+                "path": relative_path.as_posix(),
+                "name": filename,
+                "stage": top_level if top_level in STAGE_ORDER else None,
+                "type": category,
+                "size": file_stat.st_size,
+                "modified": datetime.fromtimestamp(file_stat.st_mtime).isoformat()
+            })
+
+    entries.sort(key=lambda entry: entry["path"])
+    return entries
+
+def read_file_chunk(file_path: Path, offset: int, length: int) -> dict:
+    """Read a byte range of a file and decode it without splitting UTF-8 characters"""
+    with mapped_file(file_path) as mapped:
+        size = len(mapped)
+        if looks_binary(mapped):
+            return {"offset": offset, "size": size, "binary": True, "content": None,
+                    "next_offset": size, "eof": True}
+        data = mapped[offset:offset + length]
+
+    at_end = offset + len(data) >= size
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    content = decoder.decode(data, final=at_end)
+    # Bytes of a character cut off at the chunk boundary are re-read next time
+    pending = len(decoder.getstate()[0])
+    next_offset = offset + len(data) - pending
+
+    return {
+        "offset": offset,
+        "size": size,
+        "binary": False,
+        "content": content,
+        "next_offset": next_offset,
+        "eof": next_offset >= size
+    }
+
+@app.get("/projects/{project_name}/files")
+def get_project_files(
+    project_name: str,
+    stage: str = None,
+    file_type: str = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=FILE_PAGE_SIZE_MAX)
+):
+    """Paginated listing of a project's files, filterable by stage and file type"""
+    project_dir = resolve_project_dir(project_name)
+    entries = list_project_files(project_dir, stage=stage, file_type=file_type)
+    start = (page - 1) * page_size
+    return {
+        "project": project_dir.name,
+        "project_folder": str(project_dir),
+        "stage": stage,
+        "file_type": file_type,
+        "page": page,
+        "page_size": page_size,
+        "total": len(entries),
+        "pages": (len(entries) + page_size - 1) // page_size,
+        "files": entries[start:start + page_size]
+    }
+
+@app.get("/projects/{project_name}/files/content")
+def get_project_file_content(
+    project_name: str,
+    path: str,
+    offset: int = Query(0, ge=0),
+    length: int = Query(FILE_CHUNK_DEFAULT_BYTES, ge=1, le=FILE_CHUNK_MAX_BYTES)
+):
+    """Read a chunk of a project file; follow next_offset until eof to load the rest"""
+    project_dir = resolve_project_dir(project_name)
+    file_path = resolve_project_file(project_dir, path)
+    chunk = read_file_chunk(file_path, offset, length)
+    chunk["path"] = path
+    return chunk
+
+# -----------------------------
+# Project export
+# -----------------------------
+EXPORT_FORMATS = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+}
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_QUEUE_CHUNKS = 16
+EXPORT_STALL_TIMEOUT = 300  # seconds a producer waits on a client that stopped reading
+
+class ArchiveStream(io.RawIOBase):
+    """Write-only file object that hands archive bytes to a reader through a bounded queue.
+
+    The archive writer runs in its own thread and blocks once EXPORT_QUEUE_CHUNKS
+    chunks are waiting, so memory use stays flat regardless of archive size.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+        self._buffer = bytearray()
+        self._cancelled = threading.Event()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= EXPORT_CHUNK_BYTES:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def _put(self, item):
+        waited = 0
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                waited += 1
+                if waited >= EXPORT_STALL_TIMEOUT:
+                    break
+        raise BrokenPipeError("Archive consumer went away")
+
+    def finish(self, error: Exception = None):
+        """Flush remaining bytes and signal the end of the archive (or a failure)"""
+        try:
+            if self._buffer and error is None:
+                self._put(bytes(self._buffer))
+            self._put(error)
+        except BrokenPipeError:
+            pass
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def chunks(self):
+        """Yield archive bytes as the writer produces them"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+def make_tar_info(file_path: Path, arcname: str) -> tarfile.TarInfo:
+    """Build a deterministic tar header so archive sizes can be computed up front"""
+    file_stat = file_path.stat()
+    tarinfo = tarfile.TarInfo(arcname)
+    tarinfo.size = file_stat.st_size
+    tarinfo.mtime = int(file_stat.st_mtime)
+    tarinfo.mode = file_stat.st_mode & 0o777
+    return tarinfo
+
+def compute_tar_size(tar_infos: list) -> int:
+    """Exact size of an uncompressed tar archive built from these headers"""
+    total = 0
+    for tarinfo in tar_infos:
+        total += len(tarinfo.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+        total += (blocks + (1 if remainder else 0)) * tarfile.BLOCKSIZE
+    # End-of-archive marker, then padding to a full record
+    total += 2 * tarfile.BLOCKSIZE
+    records, remainder = divmod(total, tarfile.RECORDSIZE)
+    return (records + (1 if remainder else 0)) * tarfile.RECORDSIZE
+
+def write_archive(fileobj, project_dir: Path, files: list, archive_format: str):
+    """Write the selected project files into an archive on fileobj"""
+    if archive_format == "zip":
+        with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for entry in files:
+                source = project_dir / entry["path"]
+                zinfo = zipfile.ZipInfo.from_file(source, arcname=f"{project_dir.name}/{entry['path']}")
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(source, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                    shutil.copyfileobj(src, dst, EXPORT_CHUNK_BYTES)
+    else:
+        mode = 'w|gz' if archive_format == "tar.gz" else 'w|'
+        with tarfile.open(fileobj=fileobj, mode=mode, format=tarfile.PAX_FORMAT,
+                          encoding="utf-8") as tar:
+            for entry in files:
+                with open(project_dir / entry["path"], 'rb') as src:
+                    tar.addfile(entry["tarinfo"], src)
+
+def stream_archive(project_dir: Path, files: list, archive_format: str):
+    """Generate archive bytes on the fly without building the archive in memory or on disk"""
+    stream = ArchiveStream()
+
+    def produce():
+        try:
+            write_archive(stream, project_dir, files, archive_format)
+        except Exception as e:
+            print(f"Error exporting {project_dir.name}: {str(e)}")
+            stream.finish(e)
+        else:
+            stream.finish()
+
+    threading.Thread(target=produce, name=f"export-{project_dir.name}", daemon=True).start()
+    try:
+        yield from stream.chunks()
+    finally:
+        stream.cancel()
+
+def compute_export_etag(files: list, archive_format: str) -> str:
+    """ETag derived from the archive format and each file's path, size and mtime"""
+    digest = hashlib.sha256(archive_format.encode())
+    for entry in files:
+        digest.update(f"\0{entry['path']}\0{entry['size']}\0{entry['mtime_ns']}".encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+@app.get("/projects/{project_name}/export")
+def export_project(
+    project_name: str,
+    request: Request,
+    format: str = Query("zip", pattern="^(zip|tar|tar\\.gz)$"),
+    stages: Optional[List[str]] = Query(None)
+):
+    """Stream a ZIP or tar(.gz) archive of a project or of selected stages"""
+    project_dir = resolve_project_dir(project_name)
+
+    if stages:
+        unknown = [stage for stage in stages if stage not in STAGE_ORDER]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown stages: {', '.join(unknown)}")
+        entries = [entry for stage in stages for entry in list_project_files(project_dir, stage=stage)]
+    else:
+        entries = list_project_files(project_dir)
+
+    if not entries:
+        raise HTTPException(status_code=404, detail="No files to export")
+
+    files = []
+    for entry in entries:
+        file_path = project_dir / entry["path"]
+        file_stat = file_path.stat()
+        files.append({
+            "path": entry["path"],
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "tarinfo": make_tar_info(file_path, f"{project_dir.name}/{entry['path']}")
+        })
+
+    etag = compute_export_etag(files, format)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    suffix = f"_{'_'.join(stages)}" if stages else ""
+    headers = {
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{project_dir.name}{suffix}.{format}"'
+    }
+    # Only the uncompressed tar has a size we can know before writing it
+    if format == "tar":
+        headers["Content-Length"] = str(compute_tar_size([f["tarinfo"] for f in files]))
+
+    return StreamingResponse(
+        stream_archive(project_dir, files, format),
+        media_type=EXPORT_FORMATS[format],
+        headers=headers
+    )
+
+# -----------------------------
+# Project catalog
+# -----------------------------
+# SQLite index of projects and stages under OUTPUT_BASE_DIR. It is updated
+# whenever a project is registered or a stage is written, and can be rebuilt
+# from disk at any time, so listing never has to walk the output volume.
+CATALOG_PATH = OUTPUT_BASE_DIR / ".catalog.sqlite3"
+CATALOG_PAGE_SIZE_MAX = 200
+
+@contextmanager
+def catalog_connection():
+    """Open a catalog connection that commits on success and always closes"""
+    conn = sqlite3.connect(CATALOG_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+def init_catalog() -> bool:
+    """Create the catalog schema; returns True if the catalog was just created"""
+    is_new = not CATALOG_PATH.exists()
+    with catalog_connection() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS projects (
+                name TEXT PRIMARY KEY,
+                description TEXT,
+                generated_name TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                status TEXT NOT NULL DEFAULT 'new',
+                stage_count INTEGER NOT NULL DEFAULT 0,
+                root_file_count INTEGER NOT NULL DEFAULT 0,
+                root_size_bytes INTEGER NOT NULL DEFAULT 0,
+                file_count INTEGER NOT NULL DEFAULT 0,
+                size_bytes INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                project TEXT NOT NULL REFERENCES projects(name) ON DELETE CASCADE,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated_at TEXT,
+                file_count INTEGER NOT NULL DEFAULT 0,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (project, stage)
+            );
+            CREATE INDEX IF NOT EXISTS idx_projects_updated ON projects(updated_at);
+            CREATE INDEX IF NOT EXISTS idx_projects_status ON projects(status);
+        """)
+        # Columns added after the first release
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(projects)")}
+        if "startup_flag" not in columns:
+            conn.execute("ALTER TABLE projects ADD COLUMN startup_flag TEXT")
+        if "pinned" not in columns:
+            conn.execute("ALTER TABLE projects ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+    return is_new
+
+def measure_directory(directory: Path, recursive: bool = True) -> tuple:
+    """Return (file_count, total_bytes) for a directory, skipping hidden entries.
+
+    Files hard-linked to the same blob count once towards the bytes.
+    """
+    file_count = 0
+    total_bytes = 0
+    inodes = set()
+    if not directory.is_dir():
+        return 0, 0
+    for dirpath, dirnames, filenames in os.walk(directory, followlinks=True):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')] if recursive else []
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            try:
+                file_stat = (Path(dirpath) / filename).stat()
+            except OSError:
+                continue
+            file_count += 1
+            if (file_stat.st_dev, file_stat.st_ino) not in inodes:
+                inodes.add((file_stat.st_dev, file_stat.st_ino))
+                total_bytes += file_stat.st_size
+    return file_count, total_bytes
+
+def write_json_file(file_path: Path, data: dict):
+    """Replace a JSON file atomically, never writing through an existing (possibly linked) inode"""
+    temp_path = file_path.parent / f".{file_path.name}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, file_path)
+
+def read_json_file(file_path: Path) -> dict:
+    """Load a JSON file, returning an empty dict if it is missing or invalid"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def _refresh_project_totals(conn, project_name: str):
+    """Recompute a project's aggregate columns from its stage rows"""
+    completed = conn.execute(
+        "SELECT COUNT(*) FROM stages WHERE project = ? AND status LIKE 'completed%'",
+        (project_name,)
+    ).fetchone()[0]
+    failed = conn.execute(
+        "SELECT COUNT(*) FROM stages WHERE project = ? AND status = 'failed'",
+        (project_name,)
+    ).fetchone()[0]
+    if completed >= len(STAGE_ORDER):
+        status = "completed"
+    elif completed or failed:
+        status = "in_progress"
+    else:
+        status = "new"
+    conn.execute("""
+        UPDATE projects SET
+            status = ?,
+            stage_count = ?,
+            file_count = root_file_count + COALESCE((SELECT SUM(file_count) FROM stages WHERE project = ?), 0),
+            size_bytes = root_size_bytes + COALESCE((SELECT SUM(size_bytes) FROM stages WHERE project = ?), 0)
+        WHERE name = ?
+    """, (status, completed, project_name, project_name, project_name))
+
+def _upsert_project(conn, project_dir: Path, project_info: dict = None):
+    """Insert or refresh the project row from project_info.json and its root files"""
+    info = project_info if project_info is not None else read_json_file(project_dir / "project_info.json")
+    root_files, root_bytes = measure_directory(project_dir, recursive=False)
+    created_at = info.get("created_at")
+    if not created_at and project_dir.exists():
+        created_at = datetime.fromtimestamp(project_dir.stat().st_ctime).isoformat()
+    conn.execute("""
+        INSERT INTO projects (name, description, generated_name, created_at, updated_at,
+                              root_file_count, root_size_bytes, pinned)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            description = COALESCE(excluded.description, description),
+            generated_name = COALESCE(excluded.generated_name, generated_name),
+            created_at = COALESCE(created_at, excluded.created_at),
+            updated_at = excluded.updated_at,
+            root_file_count = excluded.root_file_count,
+            root_size_bytes = excluded.root_size_bytes,
+            pinned = excluded.pinned
+    """, (project_dir.name, info.get("original_description"), info.get("generated_name"),
+          created_at, datetime.now().isoformat(), root_files, root_bytes, int(bool(info.get("pinned")))))
+
+def _upsert_stage(conn, project_dir: Path, stage: str, status: str, updated_at: str = None):
+    """Insert or refresh one stage row from the files on disk"""
+    file_count, size_bytes = measure_directory(project_dir / sanitize_project_name(stage))
+    conn.execute("""
+        INSERT INTO stages (project, stage, status, updated_at, file_count, size_bytes)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(project, stage) DO UPDATE SET
+            status = excluded.status,
+            updated_at = excluded.updated_at,
+            file_count = excluded.file_count,
+            size_bytes = excluded.size_bytes
+    """, (project_dir.name, stage, status, updated_at or datetime.now().isoformat(),
+          file_count, size_bytes))
+
+def catalog_register_project(project_dir: Path, project_info: dict = None):
+    """Record a new or updated project in the catalog"""
+    try:
+        with catalog_connection() as conn:
+            _upsert_project(conn, project_dir, project_info)
+            _refresh_project_totals(conn, project_dir.name)
+    except sqlite3.Error as e:
+        print(f"Failed to update catalog for {project_dir.name}: {str(e)}")
+
+def catalog_record_stage(project_dir: Path, stage: str, status: str):
+    """Record a stage result in the catalog (called after every stage write)"""
+    try:
+        with catalog_connection() as conn:
+            _upsert_project(conn, project_dir)
+            _upsert_stage(conn, project_dir, stage, status)
+            _refresh_project_totals(conn, project_dir.name)
+    except sqlite3.Error as e:
+        print(f"Failed to update catalog for {project_dir.name}/{stage}: {str(e)}")
+
+def catalog_flag_startup(project_dir: Path, flag: str):
+    """Record the latest sandbox verdict (ok, slow or broken) for a project"""
+    try:
+        with catalog_connection() as conn:
+            conn.execute("UPDATE projects SET startup_flag = ? WHERE name = ?", (flag, project_dir.name))
+    except sqlite3.Error as e:
+        print(f"Failed to flag {project_dir.name} in catalog: {str(e)}")
+
+def catalog_index_project(conn, project_dir: Path):
+    """Index a project and all of its stages from disk"""
+    _upsert_project(conn, project_dir)
+    conn.execute("DELETE FROM stages WHERE project = ?", (project_dir.name,))
+    for stage in STAGE_ORDER:
+        stage_dir = project_dir / sanitize_project_name(stage)
+        if not stage_dir.is_dir():
+            continue
+        metadata = read_json_file(stage_dir / STAGE_METADATA_FILE)
+        status = metadata.get("status", "completed") if metadata else "partial"
+        _upsert_stage(conn, project_dir, stage, status, metadata.get("timestamp"))
+        if stage == "Execution_And_Startup" and metadata.get("sandbox", {}).get("flag"):
+            conn.execute("UPDATE projects SET startup_flag = ? WHERE name = ?",
+                         (metadata["sandbox"]["flag"], project_dir.name))
+    # Last activity comes from the files on disk, not from when we happened to index them
+    conn.execute("""
+        UPDATE projects SET updated_at = COALESCE(
+            (SELECT MAX(updated_at) FROM stages WHERE project = ?), created_at, updated_at)
+        WHERE name = ?
+    """, (project_dir.name, project_dir.name))
+    _refresh_project_totals(conn, project_dir.name)
+
+def rebuild_catalog() -> dict:
+    """Rebuild the whole catalog from the project directories on disk"""
+    started = datetime.now()
+    project_dirs = [p for p in OUTPUT_BASE_DIR.iterdir() if p.is_dir() and not p.name.startswith('.')]
+    with catalog_connection() as conn:
+        on_disk = {p.name for p in project_dirs}
+        indexed = {row["name"] for row in conn.execute("SELECT name FROM projects")}
+        removed = indexed - on_disk
+        for name in removed:
+            conn.execute("DELETE FROM stages WHERE project = ?", (name,))
+            conn.execute("DELETE FROM projects WHERE name = ?", (name,))
+        for project_dir in project_dirs:
+            catalog_index_project(conn, project_dir)
+    return {
+        "projects_indexed": len(project_dirs),
+        "projects_removed": len(removed),
+        "duration_seconds": (datetime.now() - started).total_seconds()
+    }
+
+def catalog_reserve_project_name(base_name: str, project_info: dict = None) -> str:
+    """Claim a unique project name using the catalog's primary key instead of probing the disk"""
+    base_name = sanitize_project_name(base_name)[:240]
+    with catalog_connection() as conn:
+        taken = {row["name"] for row in conn.execute(
+            "SELECT name FROM projects WHERE name = ? OR name LIKE ?",
+            (base_name, f"{base_name}_v%")
+        )}
+        candidate = base_name
+        counter = 2
+        while True:
+            # The catalog can lag behind the disk, so the chosen name gets one final check
+            if candidate not in taken and not (OUTPUT_BASE_DIR / candidate).exists():
+                try:
+                    conn.execute(
+                        "INSERT INTO projects (name, created_at, updated_at) VALUES (?, ?, ?)",
+                        (candidate, datetime.now().isoformat(), datetime.now().isoformat())
+                    )
+                    break
+                except sqlite3.IntegrityError:
+                    pass  # claimed concurrently by another request
+            taken.add(candidate)
+            candidate = f"{base_name}_v{counter}"
+            counter += 1
+
+    project_dir = OUTPUT_BASE_DIR / candidate
+    project_dir.mkdir(parents=True, exist_ok=True)
+    if project_info is not None:
+        catalog_register_project(project_dir, project_info)
+    return candidate
+
+def _project_row(row) -> dict:
+    return {key: row[key] for key in row.keys() if key not in ("root_file_count", "root_size_bytes")}
+
+@app.get("/projects")
+def list_projects(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=CATALOG_PAGE_SIZE_MAX),
+    status: str = None,
+    q: str = None,
+    stage: str = None,
+    startup_flag: str = Query(None, pattern="^(ok|slow|broken)$"),
+    sort: str = Query("updated_at", pattern="^(name|created_at|updated_at|size_bytes)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$")
+):
+    """Paginated, filterable project listing served from the catalog index"""
+    clauses = []
+    params = []
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if q:
+        clauses.append("(name LIKE ? OR description LIKE ?)")
+        params.extend([f"%{q}%", f"%{q}%"])
+    if stage:
+        clauses.append("name IN (SELECT project FROM stages WHERE stage = ? AND status LIKE 'completed%')")
+        params.append(stage)
+    if startup_flag:
+        clauses.append("startup_flag = ?")
+        params.append(startup_flag)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    with catalog_connection() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM projects {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM projects {where} ORDER BY {sort} {order.upper()}, name LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size]
+        ).fetchall()
+
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "pages": (total + page_size - 1) // page_size,
+        "projects": [_project_row(row) for row in rows]
+    }
+
+@app.get("/projects/{project_name}")
+def get_project(project_name: str):
+    """Catalog entry for one project, including its stages"""
+    name = sanitize_project_name(project_name)
+    with catalog_connection() as conn:
+        row = conn.execute("SELECT * FROM projects WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Project not found: {project_name}")
+        stages = conn.execute(
+            "SELECT stage, status, updated_at, file_count, size_bytes FROM stages WHERE project = ?",
+            (name,)
+        ).fetchall()
+    project = _project_row(row)
+    order = {stage: index for index, stage in enumerate(STAGE_ORDER)}
+    project["stages"] = sorted((dict(stage) for stage in stages), key=lambda st: order.get(st["stage"], 99))
+    return project
+
+@app.get("/projects/{project_name}/stages/graph")
+def get_stage_graph(project_name: str):
+    """Which stages each built stage was generated from"""
+    return {"project": sanitize_project_name(project_name),
+            "stages": build_stage_graph(resolve_project_dir(project_name))}
+
+@app.get("/projects/{project_name}/stale")
+def get_stale_stages(project_name: str):
+    """Stages whose referenced upstream files changed since they were built"""
+    project_dir = resolve_project_dir(project_name)
+    return {"project": project_dir.name, "stale": find_stale_stages(project_dir)}
+
+@app.post("/projects/{project_name}/invalidate")
+def invalidate_project(project_name: str, rebuild: bool = False):
+    """Mark stale stages, and optionally rebuild only those (in stage order)"""
+    project_dir = resolve_project_dir(project_name)
+    stale = invalidate_downstream(project_dir)
+    response = {"project": project_dir.name, "stale": stale}
+    if rebuild:
+        response["rebuilt"] = rebuild_stale_stages(project_dir)
+    return response
+
+@app.post("/projects/catalog/rebuild")
+def rebuild_project_catalog():
+    """Re-scan OUTPUT_BASE_DIR and rebuild the catalog index"""
+    return rebuild_catalog()
+
+# -----------------------------
+# Retention
+# -----------------------------
+# A background sweeper keeps OUTPUT_BASE_DIR bounded: it drops old stage versions,
+# then whole projects by age or total size (oldest activity first, pinned projects
+# never), then blobs no project links to any more. Ages come from the catalog. Because
+# projects share blobs through hard links, the size budget is checked against the
+# volume's real usage (each inode once), and a deletion is credited only with the
+# inodes that no surviving path still links to.
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))  # 0 = no age limit
+RETENTION_MAX_TOTAL_MB = float(os.getenv("RETENTION_MAX_TOTAL_MB", "0"))  # 0 = no size limit
+RETENTION_KEEP_VERSIONS = int(os.getenv("RETENTION_KEEP_VERSIONS", "5"))  # per stage, 0 = keep all
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))  # 0 = no background sweeps
+RETENTION_BLOB_GRACE_SECONDS = 600  # a blob this new may be about to be linked
+RETENTION_REPORT_KEY = "retention:last_report"
+IOPRIO_SYSCALLS = {"x86_64": 251, "aarch64": 30}
+
+def lower_io_priority():
+    """Move the calling thread to the idle I/O class and lowest CPU priority (Linux, best effort)"""
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except (AttributeError, OSError):
+        pass
+    number = IOPRIO_SYSCALLS.get(platform.machine())
+    if number is None:
+        return
+    try:
+        # ioprio_set(IOPRIO_WHO_PROCESS, tid, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+        ctypes.CDLL(None, use_errno=True).syscall(number, 1, tid, 3 << 13)
+    except (OSError, AttributeError):
+        pass
+
+def retention_policy() -> dict:
+    return {
+        "max_age_days": RETENTION_MAX_AGE_DAYS or None,
+        "max_total_mb": RETENTION_MAX_TOTAL_MB or None,
+        "keep_versions": RETENTION_KEEP_VERSIONS or None,
+        "interval_seconds": RETENTION_INTERVAL_SECONDS or None
+    }
+
+def disk_usage(path: Path) -> int:
+    """Bytes a tree takes on disk, counting each hard-linked inode once"""
+    inodes = {}
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                file_stat = os.lstat(Path(dirpath) / filename)
+            except OSError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode):
+                inodes[(file_stat.st_dev, file_stat.st_ino)] = file_stat.st_size
+    return sum(inodes.values())
+
+class DeletionTally:
+    """The links a set of trees about to be deleted holds to each inode.
+
+    An inode is freed once every link to it is in the set. A blob-backed file also has
+    its link in the blob store, which the orphan sweep removes afterwards.
+    """
+
+    def __init__(self):
+        self.inodes = {}  # (st_dev, st_ino) -> [size, links to delete, links seen]
+        self.paths = set()
+        self.freed_bytes = 0
+
+    def add_tree(self, path: Path) -> int:
+        """Add every file under path to the set, returning the bytes that become free"""
+        before = self.freed_bytes
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                file_path = os.path.join(dirpath, filename)
+                if file_path in self.paths:
+                    continue  # e.g. a pruned version, then the whole project
+                try:
+                    file_stat = os.lstat(file_path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(file_stat.st_mode):
+                    continue
+                self.paths.add(file_path)
+                entry = self.inodes.get((file_stat.st_dev, file_stat.st_ino))
+                if entry is None:
+                    links = file_stat.st_nlink - (1 if is_shareable(file_stat) else 0)
+                    entry = self.inodes[(file_stat.st_dev, file_stat.st_ino)] = [file_stat.st_size, max(links, 1), 0]
+                entry[2] += 1
+                if entry[2] == entry[1]:
+                    self.freed_bytes += entry[0]
+        return self.freed_bytes - before
+
+@contextmanager
+def project_stage_locks(project_name: str):
+    """Hold every stage lock of a project, failing at once if any stage is busy"""
+    with ExitStack() as stack:
+        for stage in STAGE_ORDER:
+            stack.enter_context(get_state_store().lock(f"stage:{project_name}:{stage}"))
+        yield
+
+def prune_stage_versions(project_dir: Path, keep: int, dry_run: bool, tally: DeletionTally = None) -> dict:
+    """Drop all but the newest `keep` versions of each stage; the current one always stays"""
+    tally = tally or DeletionTally()
+    summary = {"removed": 0, "abandoned": 0, "reclaimed_bytes": 0, "busy_stages": []}
+    for stage in STAGE_ORDER:
+        try:
+            with get_state_store().lock(f"stage:{project_dir.name}:{stage}"):
+                current = current_stage_version(project_dir, stage)
+                versions = list_stage_versions(project_dir, stage)
+                # Nothing is building under the lock, so a version without metadata was abandoned
+                complete = [v for v in versions if (v / STAGE_METADATA_FILE).is_file()]
+                keep_names = {v.name for v in complete[-keep:]} if keep else {v.name for v in complete}
+                if current is not None:
+                    keep_names.add(current.name)
+                for version_dir in versions:
+                    if version_dir.name in keep_names:
+                        continue
+                    summary["abandoned" if version_dir not in complete else "removed"] += 1
+                    summary["reclaimed_bytes"] += tally.add_tree(version_dir)
+                    if not dry_run:
+                        discard_stage_version(version_dir)
+        except LockTimeout:
+            summary["busy_stages"].append(stage)
+    return summary
+
+def select_expired_projects(now: datetime, tally: DeletionTally = None, total_bytes: int = None) -> list:
+    """Unpinned projects to delete, oldest activity first, with the policy that selected each.
+
+    The tally holds what is already being deleted (old versions) and total_bytes the
+    volume's usage before any of it was; selected projects are added to the tally, and
+    each reports the bytes its deletion frees on top of the earlier ones.
+    """
+    tally = tally or DeletionTally()
+    with catalog_connection() as conn:
+        rows = conn.execute(
+            "SELECT name, updated_at, pinned FROM projects ORDER BY updated_at, name"
+        ).fetchall()
+    selected = []
+    max_age = timedelta(days=RETENTION_MAX_AGE_DAYS) if RETENTION_MAX_AGE_DAYS else None
+    max_bytes = RETENTION_MAX_TOTAL_MB * 1024 * 1024
+    if max_bytes and total_bytes is None:
+        total_bytes = disk_usage(OUTPUT_BASE_DIR)
+    for row in rows:
+        if row["pinned"]:
+            continue
+        try:
+            updated_at = datetime.fromisoformat(row["updated_at"]) if row["updated_at"] else now
+        except ValueError:
+            updated_at = now
+        if max_age and now - updated_at > max_age:
+            reason = "max_age"
+        elif max_bytes and total_bytes - tally.freed_bytes > max_bytes:
+            reason = "max_total_size"
+        else:
+            continue
+        project_dir = OUTPUT_BASE_DIR / row["name"]
+        reclaimed = tally.add_tree(project_dir) if project_dir.is_dir() else 0
+        selected.append({"name": row["name"], "reason": reason, "updated_at": row["updated_at"],
+                         "reclaimed_bytes": reclaimed})
+    return selected
+
+def delete_project(project_name: str):
+    """Remove a project from disk and from the catalog"""
+    shutil.rmtree(OUTPUT_BASE_DIR / project_name, ignore_errors=True)
+    with catalog_connection() as conn:
+        conn.execute("DELETE FROM stages WHERE project = ?", (project_name,))
+        conn.execute("DELETE FROM projects WHERE name = ?", (project_name,))
+
+def prune_orphan_blobs(dry_run: bool) -> dict:
+    """Delete blobs only the store itself still links to"""
+    summary = {"removed": 0, "reclaimed_bytes": 0}
+    if not BLOB_DIR.is_dir():
+        return summary
+    cutoff = time.time() - RETENTION_BLOB_GRACE_SECONDS
+    for path in BLOB_DIR.glob('??/*'):
+        try:
+            file_stat = path.stat()
+        except OSError:
+            continue
+        # mtime is when the blob (or a stray temp file) was written, unaffected by linking
+        if file_stat.st_mtime > cutoff or (file_stat.st_nlink > 1 and not path.name.startswith('.')):
+            continue
+        summary["removed"] += 1
+        summary["reclaimed_bytes"] += file_stat.st_size
+        if not dry_run:
+            path.unlink(missing_ok=True)
+    return summary
+
+def sweep_output(dry_run: bool = False) -> dict:
+    """Apply the retention policies once and report what was (or would be) reclaimed"""
+    started = datetime.now()
+    report = {
+        "started_at": started.isoformat(),
+        "dry_run": dry_run,
+        "policy": retention_policy(),
+        "projects_removed": [],
+        "projects_busy": [],
+        "versions_removed": 0,
+        "abandoned_versions_removed": 0,
+        "blobs_removed": 0,
+        "reclaimed_bytes": 0
+    }
+    tally = DeletionTally()
+    total_bytes = disk_usage(OUTPUT_BASE_DIR) if RETENTION_MAX_TOTAL_MB else None  # before anything goes
+    project_dirs = [p for p in OUTPUT_BASE_DIR.iterdir() if p.is_dir() and not p.name.startswith('.')]
+    for project_dir in project_dirs:
+        if not (project_dir / VERSIONS_DIR).is_dir():
+            continue
+        pruned = prune_stage_versions(project_dir, RETENTION_KEEP_VERSIONS, dry_run, tally)
+        report["versions_removed"] += pruned["removed"]
+        report["abandoned_versions_removed"] += pruned["abandoned"]
+        report["reclaimed_bytes"] += pruned["reclaimed_bytes"]
+
+    for project in select_expired_projects(started, tally, total_bytes):
+        try:
+            with project_stage_locks(project["name"]):
+                if not dry_run:
+                    delete_project(project["name"])
+        except LockTimeout:
+            report["projects_busy"].append(project["name"])
+            continue
+        report["projects_removed"].append(project)
+        report["reclaimed_bytes"] += project["reclaimed_bytes"]
+
+    if not dry_run:
+        # Blobs orphaned above are counted already; this catches the rest and stray temp files
+        with get_state_store().lock("storage-maintenance", timeout=60):
+            blobs = prune_orphan_blobs(dry_run)
+        report["blobs_removed"] = blobs["removed"]
+    report["duration_seconds"] = (datetime.now() - started).total_seconds()
+    return report
+
+def run_sweep(dry_run: bool = False) -> Optional[dict]:
+    """Run one sweep at low priority in its own thread; None if another worker is sweeping"""
+    outcome = {}
+
+    def sweep():
+        lower_io_priority()  # per thread, so it must not run on a shared request thread
+        try:
+            with get_state_store().lock("retention-sweep"):
+                outcome["report"] = sweep_output(dry_run)
+        except LockTimeout:
+            outcome["report"] = None
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=sweep, name="retention-sweep", daemon=True)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    report = outcome["report"]
+    if report is not None and not dry_run:
+        get_state_store().cache_set(RETENTION_REPORT_KEY, report)
+        print(f"Retention sweep removed {len(report['projects_removed'])} project(s), "
+              f"{report['versions_removed']} version(s), {report['blobs_removed']} blob(s); "
+              f"reclaimed {report['reclaimed_bytes']} bytes")
+    return report
+
+def start_retention_sweeper():
+    """Sweep every RETENTION_INTERVAL_SECONDS; workers share a lock, so only one sweeps at a time"""
+    if not RETENTION_INTERVAL_SECONDS:
+        return
+
+    def loop():
+        while True:
+            time.sleep(RETENTION_INTERVAL_SECONDS)
+            try:
+                run_sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {str(e)}")
+
+    threading.Thread(target=loop, name="retention-sweeper", daemon=True).start()
+
+@app.get("/retention")
+def get_retention():
+    """Retention policy and the last sweep's report"""
+    return {"policy": retention_policy(), "last_report": get_state_store().cache_get(RETENTION_REPORT_KEY)}
+
+@app.post("/retention/sweep")
+def sweep_retention(dry_run: bool = True):
+    """Run a sweep now; by default only reports what it would delete"""
+    report = run_sweep(dry_run)
+    if report is None:
+        raise HTTPException(status_code=409, detail="A retention sweep is already running")
+    return report
+
+def set_project_pinned(project_dir: Path, pinned: bool) -> dict:
+    """Pin state lives in project_info.json so a catalog rebuild keeps it"""
+    info = read_json_file(project_dir / "project_info.json")
+    info["pinned"] = pinned
+    write_json_file(project_dir / "project_info.json", info)
+    with catalog_connection() as conn:
+        conn.execute("UPDATE projects SET pinned = ? WHERE name = ?", (int(pinned), project_dir.name))
+    return {"project": project_dir.name, "pinned": pinned}
+
+@app.post("/projects/{project_name}/pin")
+def pin_project(project_name: str):
+    """Exempt a project from retention"""
+    return set_project_pinned(resolve_project_dir(project_name), True)
+
+@app.delete("/projects/{project_name}/pin")
+def unpin_project(project_name: str):
+    return set_project_pinned(resolve_project_dir(project_name), False)
+
+# -----------------------------
+# Shared state (cross-worker)
+# -----------------------------
+# With several worker processes nothing kept in module globals is shared, so
+# rate limits, caches, job queues and locks live in a store every worker can
+# see: SQLite plus advisory file locks on the output volume by default, or
+# Redis when REDIS_URL is set.
+STATE_PATH = OUTPUT_BASE_DIR / ".state.sqlite3"
+LOCKS_DIR = OUTPUT_BASE_DIR / ".locks"
+REDIS_URL = os.getenv("REDIS_URL")
+# A claimed job not finished in this time is assumed lost with its worker and queued again
+JOB_CLAIM_TIMEOUT = float(os.getenv("JOB_CLAIM_TIMEOUT", "900"))
+# Redis locks expire after this long unless renewed; the holder renews them every third of it,
+# so a lock outlives any build but is freed soon after its worker dies
+REDIS_LOCK_TTL = float(os.getenv("REDIS_LOCK_TTL", "60"))
+
+class LockTimeout(Exception):
+    """Raised when a shared lock cannot be acquired in time"""
+    pass
+
+class SQLiteStateStore:
+    """Shared state backed by a SQLite file and flock() lock files"""
+
+    def __init__(self, path: Path, locks_dir: Path):
+        self.path = path
+        self.locks_dir = locks_dir
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        self._local_locks = {}
+        self._local_locks_guard = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT NOT NULL,
+                    window INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (key, window)
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    queue TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(queue, status, created_at);
+                CREATE TABLE IF NOT EXISTS events (
+                    run_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, seq)
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # Cache
+    def cache_get(self, key: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def cache_set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+
+    def cache_delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    # Rate limiting
+    def rate_limit_hit(self, key: str, limit: int, window_seconds: int) -> float:
+        """Count one hit in the current fixed window; returns 0 if allowed, else seconds to wait"""
+        now = time.time()
+        window = int(now // window_seconds)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT count FROM rate_limits WHERE key = ? AND window = ?", (key, window)
+                ).fetchone()
+                count = row[0] if row else 0
+                if count >= limit:
+                    conn.execute("COMMIT")
+                    return (window + 1) * window_seconds - now
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, window, count) VALUES (?, ?, ?)",
+                    (key, window, count + 1)
+                )
+                conn.execute("DELETE FROM rate_limits WHERE key = ? AND window < ?", (key, window))
+                conn.execute("COMMIT")
+                return 0.0
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    # Job queues
+    def enqueue(self, queue_name: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, queue, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, queue_name, json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def claim(self, queue_name: str):
+        """Atomically claim the oldest queued job; returns (job_id, payload) or None"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Jobs whose worker died while running them go back to the queue first
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE queue = ? AND status = 'running' AND updated_at < ?",
+                (now, queue_name, now - JOB_CLAIM_TIMEOUT)
+            )
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE queue = ? AND status = 'queued' ORDER BY created_at LIMIT 1",
+                (queue_name,)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (now, row[0])
+                )
+            conn.execute("COMMIT")
+        return (row[0], json.loads(row[1])) if row else None
+
+    def finish(self, job_id: str, status: str = "done", result: dict = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, time.time(), job_id)
+            )
+
+    def job(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT queue, payload, status, result FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": job_id, "queue": row[0], "payload": json.loads(row[1]), "status": row[2],
+                "result": json.loads(row[3]) if row[3] else None}
+
+    # Run events
+    def append_event(self, run_id: str, event: dict) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE run_id = ?", (run_id,)
+                ).fetchone()[0]
+                conn.execute("INSERT INTO events (run_id, seq, payload, created_at) VALUES (?, ?, ?, ?)",
+                             (run_id, seq, json.dumps(event), now))
+                if seq == 1:  # prune expired runs once per run
+                    conn.execute("DELETE FROM events WHERE created_at < ?", (now - RUN_EVENT_TTL,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return seq
+
+    def read_events(self, run_id: str, after: int = 0) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, payload FROM events WHERE run_id = ? AND seq > ? ORDER BY seq", (run_id, after)
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    # Locks
+    @contextmanager
+    def lock(self, name: str, timeout: float = 0):
+        """Exclusive lock shared by all workers; timeout=0 fails immediately if held"""
+        lock_path = self.locks_dir / f"{sanitize_project_name(name)}.lock"
+        # flock() is per open file description, so threads in one worker
+        # also need a process-local lock to exclude each other.
+        with self._local_locks_guard:
+            local_lock = self._local_locks.setdefault(lock_path, threading.Lock())
+        acquired = local_lock.acquire(timeout=timeout) if timeout > 0 else local_lock.acquire(blocking=False)
+        if not acquired:
+            raise LockTimeout(f"Lock is held: {name}")
+        try:
+            if fcntl is None:
+                yield
+                return
+            with open(lock_path, 'a') as lock_file:
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise LockTimeout(f"Lock is held: {name}")
+                        time.sleep(0.1)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            local_lock.release()
+
+# Claiming moves the job id from the queue into a per-queue processing set scored by
+# claim time, in one script so a worker dying in between cannot lose the job. Entries
+# older than the claim timeout are pushed back onto the front of the queue first.
+REDIS_CLAIM_SCRIPT = """
+local cutoff = tostring(tonumber(ARGV[1]) - tonumber(ARGV[2]))
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', cutoff)) do
+    redis.call('ZREM', KEYS[2], job_id)
+    redis.call('LPUSH', KEYS[1], job_id)
+    redis.call('HSET', ARGV[3] .. job_id, 'status', 'queued')
+end
+local job_id = redis.call('LPOP', KEYS[1])
+if not job_id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+redis.call('HSET', ARGV[3] .. job_id, 'status', 'running')
+return {job_id, redis.call('HGET', ARGV[3] .. job_id, 'payload')}
+"""
+
+class RedisStateStore:
+    """Shared state backed by Redis, for deployments spanning several hosts"""
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.client.ping()
+        self._claim_script = self.client.register_script(REDIS_CLAIM_SCRIPT)
+
+    def cache_get(self, key: str):
+        value = self.client.get(f"syncro:cache:{key}")
+        return json.loads(value) if value is not None else None
+
+    def cache_set(self, key: str, value, ttl: float = None):
+        self.client.set(f"syncro:cache:{key}", json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def cache_delete(self, key: str):
+        self.client.delete(f"syncro:cache:{key}")
+
+    def rate_limit_hit(self, key: str, limit: int, window_seconds: int) -> float:
+        now = time.time()
+        window = int(now // window_seconds)
+        redis_key = f"syncro:rate:{key}:{window}"
+        pipe = self.client.pipeline()
+        pipe.incr(redis_key)
+        pipe.expire(redis_key, window_seconds * 2)
+        count, _ = pipe.execute()
+        if count > limit:
+            self.client.decr(redis_key)  # denied hits do not count, as in the SQLite store
+            return (window + 1) * window_seconds - now
+        return 0.0
+
+    def enqueue(self, queue_name: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        self.client.hset(f"syncro:job:{job_id}", mapping={
+            "queue": queue_name, "payload": json.dumps(payload), "status": "queued"
+        })
+        self.client.rpush(f"syncro:queue:{queue_name}", job_id)
+        return job_id
+
+    def claim(self, queue_name: str):
+        claimed = self._claim_script(
+            keys=[f"syncro:queue:{queue_name}", f"syncro:processing:{queue_name}"],
+            args=[time.time(), JOB_CLAIM_TIMEOUT, "syncro:job:"]
+        )
+        if claimed is None:
+            return None
+        job_id, payload = claimed
+        return job_id, json.loads(payload)
+
+    def finish(self, job_id: str, status: str = "done", result: dict = None):
+        mapping = {"status": status}
+        if result is not None:
+            mapping["result"] = json.dumps(result)
+        queue_name = self.client.hget(f"syncro:job:{job_id}", "queue")
+        pipe = self.client.pipeline()  # MULTI/EXEC
+        pipe.hset(f"syncro:job:{job_id}", mapping=mapping)
+        if queue_name is not None:
+            pipe.zrem(f"syncro:processing:{queue_name}", job_id)
+        pipe.execute()
+
+    def job(self, job_id: str):
+        data = self.client.hgetall(f"syncro:job:{job_id}")
+        if not data:
+            return None
+        return {"id": job_id, "queue": data["queue"], "payload": json.loads(data["payload"]),
+                "status": data["status"], "result": json.loads(data["result"]) if data.get("result") else None}
+
+    def append_event(self, run_id: str, event: dict) -> int:
+        key = f"syncro:events:{run_id}"
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps(event))
+        pipe.expire(key, RUN_EVENT_TTL)
+        seq, _ = pipe.execute()
+        return seq
+
+    def read_events(self, run_id: str, after: int = 0) -> list:
+        values = self.client.lrange(f"syncro:events:{run_id}", after, -1)
+        return [(after + index + 1, json.loads(value)) for index, value in enumerate(values)]
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 0):
+        # Not thread-local: the renewing thread needs the token the holder acquired with
+        lock = self.client.lock(f"syncro:lock:{name}", timeout=REDIS_LOCK_TTL, blocking=timeout > 0,
+                                blocking_timeout=timeout or None, thread_local=False)
+        if not lock.acquire():
+            raise LockTimeout(f"Lock is held: {name}")
+        released = threading.Event()
+
+        def renew():
+            while not released.wait(REDIS_LOCK_TTL / 3):
+                try:
+                    lock.reacquire()
+                except redis.exceptions.LockError:
+                    print(f"Lock {name} expired before it was renewed; another worker may take it")
+                    return
+                except redis.exceptions.RedisError as e:
+                    print(f"Could not renew lock {name}: {str(e)}")  # retried until the TTL runs out
+
+        renewer = threading.Thread(target=renew, name="redis-lock-renewal", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            released.set()
+            renewer.join()
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                print(f"Lock {name} had already expired when it was released")
+
+_state_store = None
+_state_store_guard = threading.Lock()
+
+def get_state_store():
+    """Return this worker's handle on the shared state store"""
+    global _state_store
+    with _state_store_guard:
+        if _state_store is None:
+            # With REDIS_URL set, other hosts share state through Redis. A per-host SQLite
+            # store would silently split locks, rate limits and queues, so refuse to start.
+            if REDIS_URL and redis is None:
+                raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+            if REDIS_URL:
+                try:
+                    _state_store = RedisStateStore(REDIS_URL)
+                except redis.exceptions.RedisError as e:
+                    raise RuntimeError(f"REDIS_URL is set but Redis is unavailable: {str(e)}") from e
+            else:
+                _state_store = SQLiteStateStore(STATE_PATH, LOCKS_DIR)
+        return _state_store
+
+# -----------------------------
+# Run progress
+# -----------------------------
+# Stage runs append structured events to the shared store under their run_id, so a
+# client connected to any worker can follow a run that another worker is executing:
+# over Server-Sent Events, a WebSocket, or by polling the JSON endpoint.
+RUN_EVENT_TTL = 3600  # seconds events are kept after a run's last event
+RUN_POLL_INTERVAL = 0.25
+RUN_KEEPALIVE_SECONDS = 5
+RUN_STREAM_IDLE_TIMEOUT = float(os.getenv("RUN_STREAM_IDLE_TIMEOUT", "600"))
+RUN_TERMINAL_EVENTS = {"run_completed", "run_failed"}
+CURRENT_RUN = contextvars.ContextVar("current_run", default=None)
+
+def emit_progress(event: str, **data):
+    """Record a progress event for the current run (no-op outside a run)"""
+    run_id = CURRENT_RUN.get()
+    if run_id is None:
+        return
+    try:
+        get_state_store().append_event(run_id, {"event": event, "time": time.time(), **data})
+    except Exception as e:
+        print(f"Could not record progress event {event}: {str(e)}")
+
+@contextmanager
+def track_run(run_id: str, **data):
+    """Make run_id the target of emit_progress for the duration of a run"""
+    token = CURRENT_RUN.set(run_id)
+    emit_progress("run_started", **data)
+    try:
+        yield
+    finally:
+        CURRENT_RUN.reset(token)
+
+def finish_run(run_id: str, result: dict):
+    """Close a run with its outcome; subscribers stop after this event"""
+    token = CURRENT_RUN.set(run_id)
+    try:
+        failed = result.get("status") in ("failed", "terminated", "busy")
+        emit_progress("run_failed" if failed else "run_completed", status=result.get("status"),
+                      error=result.get("error"))
+    finally:
+        CURRENT_RUN.reset(token)
+
+def iter_run_events(run_id: str, after: int = 0):
+    """Yield (seq, event) as they arrive until the run ends; None on each idle keepalive tick"""
+    store = get_state_store()
+    last_activity = time.monotonic()
+    last_keepalive = time.monotonic()
+    while True:
+        events = store.read_events(run_id, after)
+        for seq, event in events:
+            after = seq
+            yield seq, event
+            if event.get("event") in RUN_TERMINAL_EVENTS:
+                return
+        now = time.monotonic()
+        if events:
+            last_activity = last_keepalive = now
+        elif now - last_activity > RUN_STREAM_IDLE_TIMEOUT:
+            return
+        elif now - last_keepalive >= RUN_KEEPALIVE_SECONDS:
+            last_keepalive = now
+            yield None
+        time.sleep(RUN_POLL_INTERVAL)
+
+@app.get("/runs/{run_id}")
+def get_run(run_id: str, after: int = 0):
+    """Events recorded so far for a run"""
+    events = get_state_store().read_events(run_id, after)
+    return {
+        "run_id": run_id,
+        "events": [{"seq": seq, **event} for seq, event in events],
+        "done": any(event.get("event") in RUN_TERMINAL_EVENTS for _, event in events)
+    }
+
+@app.get("/runs/{run_id}/events")
+def stream_run_events(run_id: str, request: Request, after: int = 0):
+    """Server-Sent Events for a run; reconnecting clients resume from Last-Event-ID"""
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+
+    def stream():
+        for item in iter_run_events(run_id, after):
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            seq, event = item
+            yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/runs/{run_id}/ws")
+async def run_events_socket(websocket: WebSocket, run_id: str, after: int = 0):
+    """The same events as JSON messages over a WebSocket"""
+    await websocket.accept()
+    events = iter_run_events(run_id, after)
+    try:
+        while True:
+            item = await run_in_threadpool(next, events, StopIteration)
+            if item is StopIteration:
+                break
+            if item is not None:
+                seq, event = item
+                await websocket.send_json({"seq": seq, **event})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 def sanitize_project_name(name: str) -> str:
     """Sanitize the project name to be file system friendly"""
     # Remove newlines and leading/trailing whitespace
@@ -1446,26 +5297,540 @@ def is_rate_limit_error(exception):
         getattr(exception.error, 'code', None) == 'rate_limit_exceeded'
     )
 
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_RATE_LIMIT_MAX_WAIT = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "120"))
+
+def wait_for_llm_slot(priority: str = "interactive"):
+    """Block until the per-minute LLM budget shared by all workers has room for this class"""
+    if LLM_REQUESTS_PER_MINUTE <= 0:
+        return
+    # Lower classes stop short of the full budget, keeping headroom for interactive calls on any worker
+    limit = max(1, int(LLM_REQUESTS_PER_MINUTE * LLM_PRIORITY_BUDGET.get(priority, 1.0)))
+    deadline = time.monotonic() + LLM_RATE_LIMIT_MAX_WAIT
+    while True:
+        wait = get_state_store().rate_limit_hit("llm", limit, 60)
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimitError("Local LLM rate limit reached. Please try again later.")
+        sleep(wait)
+
+# -----------------------------
+# LLM scheduling
+# -----------------------------
+# Every chat request takes one of LLM_MAX_CONCURRENT slots in this worker first. When the
+# slots are busy, waiters are served by class (interactive, pipeline, batch) in
+# proportion to the class weights. Within a class, tenants (the user, else the project,
+# or the whole batch) take turns by start-time fair queuing, so one tenant with many
+# calls cannot push out another. Across workers, lower classes may only use part of
+# the shared per-minute budget (LLM_PRIORITY_BUDGET).
+PRIORITY_CLASSES = ("interactive", "pipeline", "batch")
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "4"))
+SCHEDULER_WAIT_SAMPLES = 1000  # recent queue waits kept per class for the percentiles
+
+def parse_weight_map(value: str, defaults: dict = None) -> dict:
+    """Parse "name=weight,name=weight" from an env var on top of the defaults"""
+    weights = dict(defaults or {})
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        try:
+            weights[name.strip()] = float(weight)
+        except ValueError:
+            print(f"Ignoring invalid weight {item!r}")
+    return weights
+
+LLM_PRIORITY_WEIGHTS = parse_weight_map(os.getenv("LLM_PRIORITY_WEIGHTS", ""),
+                                        {"interactive": 8.0, "pipeline": 3.0, "batch": 1.0})
+LLM_PRIORITY_BUDGET = parse_weight_map(os.getenv("LLM_PRIORITY_BUDGET", ""),
+                                       {"interactive": 1.0, "pipeline": 0.85, "batch": 0.7})
+LLM_TENANT_WEIGHTS = parse_weight_map(os.getenv("LLM_TENANT_WEIGHTS", ""))  # default 1 per tenant
+
+# (class, tenant) of the LLM calls made in this context; set per request
+LLM_PRIORITY = contextvars.ContextVar("llm_priority", default=("interactive", "anonymous"))
+
+@contextmanager
+def llm_priority(priority: Optional[str], tenant: Optional[str]):
+    """Schedule the LLM calls made inside the block under this class and tenant"""
+    token = LLM_PRIORITY.set((priority or "interactive", tenant or "anonymous"))
+    try:
+        yield
+    finally:
+        LLM_PRIORITY.reset(token)
+
+class FairScheduler:
+    """LLM call slots for this worker, handed out by class weight, then fairly between tenants"""
+
+    def __init__(self, slots: int, class_weights: dict, tenant_weights: dict):
+        self.slots = max(1, slots)
+        self.class_weights = {name: class_weights.get(name, 1.0) for name in PRIORITY_CLASSES}
+        self.tenant_weights = tenant_weights
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.sequence = 0
+        self.virtual_pass = 0.0  # pass of the last class served; idle classes rejoin here
+        self.queues = {name: [] for name in PRIORITY_CLASSES}  # heaps of (tag, seq, waiter)
+        self.class_pass = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.class_vtime = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.tenant_finish = {name: {} for name in PRIORITY_CLASSES}
+        self.waits = {name: deque(maxlen=SCHEDULER_WAIT_SAMPLES) for name in PRIORITY_CLASSES}
+        self.dispatched = {name: 0 for name in PRIORITY_CLASSES}
+
+    @contextmanager
+    def slot(self, priority: str, tenant: str):
+        """Hold one slot for the duration of the block, queueing while all slots are busy"""
+        priority = priority if priority in self.queues else "interactive"
+        queued_at = time.monotonic()
+        with self.condition:
+            if self.in_flight < self.slots and not any(self.queues.values()):
+                self.in_flight += 1
+                self.dispatched[priority] += 1
+            else:
+                waiter = self._enqueue(priority, tenant)
+                while not waiter["granted"]:
+                    self.condition.wait()
+            self.waits[priority].append(time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self._dispatch()
+
+    def _enqueue(self, priority: str, tenant: str) -> dict:
+        queue = self.queues[priority]
+        if not queue:
+            # A class that was idle starts level with the others instead of with saved-up credit
+            self.class_pass[priority] = max(self.class_pass[priority], self.virtual_pass)
+        finish = self.tenant_finish[priority]
+        tag = max(self.class_vtime[priority], finish.get(tenant, 0.0))
+        finish[tenant] = tag + 1.0 / self.tenant_weights.get(tenant, 1.0)
+        waiter = {"granted": False, "tenant": tenant}
+        self.sequence += 1
+        heapq.heappush(queue, (tag, self.sequence, waiter))
+        return waiter
+
+    def _dispatch(self):
+        while self.in_flight < self.slots:
+            active = [name for name in PRIORITY_CLASSES if self.queues[name]]
+            if not active:
+                return
+            # Ties go to the more interactive class (PRIORITY_CLASSES order)
+            priority = min(active, key=lambda name: self.class_pass[name])
+            tag, _, waiter = heapq.heappop(self.queues[priority])
+            self.class_vtime[priority] = tag
+            self.virtual_pass = self.class_pass[priority]
+            self.class_pass[priority] += 1.0 / self.class_weights[priority]
+            if not self.queues[priority]:
+                self.tenant_finish[priority].clear()  # nobody waiting, so no history to keep
+            self.in_flight += 1
+            self.dispatched[priority] += 1
+            waiter["granted"] = True
+            self.condition.notify_all()
+
+    def snapshot(self) -> dict:
+        with self.condition:
+            classes = {}
+            for name in PRIORITY_CLASSES:
+                waits = sorted(self.waits[name])
+                tenants = {}
+                for _, _, waiter in self.queues[name]:
+                    tenants[waiter["tenant"]] = tenants.get(waiter["tenant"], 0) + 1
+                classes[name] = {
+                    "weight": self.class_weights[name],
+                    "budget_share": LLM_PRIORITY_BUDGET.get(name, 1.0),
+                    "waiting": len(self.queues[name]),
+                    "waiting_by_tenant": tenants,
+                    "dispatched": self.dispatched[name],
+                    "wait_ms": {
+                        "p50": round(waits[int(0.50 * (len(waits) - 1))] * 1000, 1) if waits else None,
+                        "p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else None,
+                        "max": round(waits[-1] * 1000, 1) if waits else None,
+                        "samples": len(waits)
+                    }
+                }
+            return {"slots": self.slots, "in_flight": self.in_flight, "classes": classes}
+
+LLM_SCHEDULER = FairScheduler(LLM_MAX_CONCURRENT, LLM_PRIORITY_WEIGHTS, LLM_TENANT_WEIGHTS)
+
+@app.get("/metrics/scheduler")
+async def scheduler_metrics():
+    """Queue wait percentiles and current queue per scheduling class in this worker"""
+    return {"worker_pid": os.getpid(), **LLM_SCHEDULER.snapshot()}
+
+# Truncated generations are resumed with continuation calls until the output ends
+# naturally or the total token budget for the call is spent
+LLM_CONTINUATION_TOKEN_BUDGET = int(os.getenv("LLM_CONTINUATION_TOKEN_BUDGET", "12000"))
+LLM_MAX_CONTINUATIONS = int(os.getenv("LLM_MAX_CONTINUATIONS", "4"))
+# Stages whose files routinely run long get a larger total budget
+STAGE_TOKEN_BUDGETS = {"Execution_And_Startup": 16000}
+CONTINUATION_OVERLAP_CHARS = 400
+# Shorter repeats are usually coincidence ("x = 1" + "1 + 2") unless they span whole lines
+CONTINUATION_MIN_OVERLAP_CHARS = 32
+CONTINUATION_PROMPT = (
+    "Your previous answer was cut off. Continue exactly where it stopped, starting with "
+    "the next character. Do not repeat earlier text and do not add any commentary."
+)
+
+# Set per stage build so the stage metadata can report continuations per prompt
+LLM_CONTINUATIONS = contextvars.ContextVar("llm_continuations", default=None)
+
+@contextmanager
+def track_continuations():
+    """Collect continuation counts for every LLM call made inside the block"""
+    token = LLM_CONTINUATIONS.set({"continuations": 0, "by_prompt": {}, "truncated": []})
+    try:
+        yield LLM_CONTINUATIONS.get()
+    finally:
+        LLM_CONTINUATIONS.reset(token)
+
+def is_whole_line_overlap(text: str, addition: str, size: int) -> bool:
+    """Whether the repeated text starts a line in the previous part and ends one in the continuation"""
+    overlap = addition[:size]
+    starts_line = size == len(text) or text[-size - 1] == '\n'
+    ends_line = overlap.endswith('\n') or addition[size:size + 1] == '\n'
+    return starts_line and ends_line and bool(overlap.strip())  # a repeated blank line may be real
+
+def stitch_continuation(text: str, addition: str) -> str:
+    """Append a continuation, dropping any text it repeats from the end of the previous part"""
+    limit = min(len(text), len(addition), CONTINUATION_OVERLAP_CHARS)
+    for size in range(limit, 0, -1):
+        if not text.endswith(addition[:size]):
+            continue
+        if size >= CONTINUATION_MIN_OVERLAP_CHARS or is_whole_line_overlap(text, addition, size):
+            return text + addition[size:]
+    return text + addition
+
+def record_continuations(messages: list, continuations: int, truncated: bool):
+    """Add one call's continuation count to the current stage tracker, if any"""
+    tracker = LLM_CONTINUATIONS.get()
+    if tracker is None or (continuations == 0 and not truncated):
+        return
+    template = find_prompt_template(messages)
+    name = template.name if template else "untemplated"
+    tracker["continuations"] += continuations
+    tracker["by_prompt"][name] = tracker["by_prompt"].get(name, 0) + continuations
+    if truncated:
+        tracker["truncated"].append(name)
+
 @retry(
     wait=wait_exponential(multiplier=1, min=4, max=10),
     stop=stop_after_attempt(1),
     retry=retry_if_exception(is_rate_limit_error)
 )
-def make_llm_call(messages, model=None, temperature=0.3, max_tokens=2000):
-    """Make LLM API call with single retry attempt"""
+def request_completion(messages, model, temperature, max_tokens, top_p):
+    """Send one chat completion request and return the content and finish reason"""
     try:
-        # Use the global model if none specified
-        model_to_use = model or DEFAULT_MODEL
-        
-        completion = client.chat.completions.create(
-            model=model_to_use,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return completion.choices[0].message.content
+        batcher = BULK_BATCHER.get()
+        if batcher is not None:
+            return batcher.complete(messages, model, temperature, max_tokens, top_p)
+        if client is None:
+            raise RuntimeError("GROQ_API_KEY is not set; use generation_mode 'template'")
+        priority, tenant = LLM_PRIORITY.get()
+        # Budget first: a slot held while sleeping on the budget would block higher classes
+        wait_for_llm_slot(priority)
+        with LLM_SCHEDULER.slot(priority, tenant):
+            options = {"top_p": top_p} if top_p is not None else {}
+            completion = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **options
+            )
+        record_prompt_usage(messages, getattr(completion, "usage", None))
+        choice = completion.choices[0]
+        return choice.message.content or "", getattr(choice, "finish_reason", None)
     except Exception as e:
         if 'rate_limit' in str(e).lower():
             print(f"Rate limit reached. Process terminated.")
             raise RateLimitError("Rate limit reached. Please try again later.")
         raise e
+
+def make_llm_call(messages, model=None, temperature=0.3, max_tokens=2000, top_p=None, token_budget=None):
+    """Make LLM API call, continuing truncated output until it finishes or the token budget runs out"""
+    # Use the global model if none specified
+    model_to_use = model or DEFAULT_MODEL
+    budget = max(token_budget or LLM_CONTINUATION_TOKEN_BUDGET, max_tokens)
+
+    content, finish_reason = request_completion(messages, model_to_use, temperature, max_tokens, top_p)
+    spent = max_tokens
+    continuations = 0
+    while finish_reason == "length" and continuations < LLM_MAX_CONTINUATIONS and spent < budget:
+        chunk_tokens = min(max_tokens, budget - spent)
+        follow_up = messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUATION_PROMPT}
+        ]
+        addition, finish_reason = request_completion(follow_up, model_to_use, temperature, chunk_tokens, top_p)
+        content = stitch_continuation(content, addition)
+        spent += chunk_tokens
+        continuations += 1
+
+    truncated = finish_reason == "length"
+    if continuations or truncated:
+        print(f"LLM output needed {continuations} continuation(s){', still truncated' if truncated else ''}")
+    record_continuations(messages, continuations, truncated)
+    return content
+
+# -----------------------------
+# Bulk generation
+# -----------------------------
+# For overnight runs the calls of many project builds are sent through the provider's
+# batch API instead of one chat request each. Every build runs on its own thread inside
+# BulkBatcher.participant(). Its LLM calls block while the batcher collects them into
+# one job file per wave. A wave is sent once BULK_WAVE_SIZE calls are waiting, once
+# every participant is waiting (nothing more can arrive) or BULK_COLLECT_SECONDS after
+# its first call, so one slow build never holds up the rest. The batcher polls the job and hands each thread its completion,
+# so the normal parsing and file-writing code runs unchanged. LocalBatchAPI mimics the
+# provider's job and result files offline for tests.
+BULK_DIR = OUTPUT_BASE_DIR / ".bulk"
+BULK_COLLECT_SECONDS = float(os.getenv("BULK_COLLECT_SECONDS", "30"))
+BULK_POLL_SECONDS = float(os.getenv("BULK_POLL_SECONDS", "30"))
+BULK_MAX_REQUESTS = int(os.getenv("BULK_MAX_REQUESTS", "1000"))  # per job file
+BULK_WAVE_SIZE = int(os.getenv("BULK_WAVE_SIZE", "50"))  # waiting calls that send a wave right away
+BULK_COMPLETION_WINDOW = os.getenv("BULK_COMPLETION_WINDOW", "24h")
+BULK_ENDPOINT = "/v1/chat/completions"
+BULK_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+LOCAL_BATCH_GENERATOR = "local-batch"  # stands in for the model in fingerprints, like TEMPLATE_GENERATOR
+
+# Set on build threads that take part in a bulk run; request_completion routes through it
+BULK_BATCHER = contextvars.ContextVar("bulk_batcher", default=None)
+
+class ProviderBatchAPI:
+    """The provider's batch endpoints: upload a job file, create a batch, poll, download results"""
+
+    def __init__(self, batch_client):
+        self.client = batch_client
+
+    def submit(self, job_path: Path) -> str:
+        with open(job_path, 'rb') as f:
+            uploaded = self.client.files.create(file=(job_path.name, f), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BULK_ENDPOINT,
+            completion_window=BULK_COMPLETION_WINDOW
+        )
+        return batch.id
+
+    def retrieve(self, batch_id: str) -> dict:
+        batch = self.client.batches.retrieve(batch_id)
+        return {"status": batch.status, "output_file_id": batch.output_file_id, "error_file_id": batch.error_file_id}
+
+    def download(self, file_id: str) -> str:
+        return self.client.files.content(file_id).text()
+
+def local_batch_response(messages: list) -> str:
+    """Deterministic offline answer: a short document, plus one file block for file prompts"""
+    template = find_prompt_template(messages)
+    if template is BREAKDOWN_PROMPT:
+        return "[]"  # no custom stages, so the breakdown falls back to the standard ones
+    name = template.name if template else "untemplated"
+    content = f"# Bulk response\n\nAnswered offline by the local batch stand-in for the {name} prompt.\n"
+    if "[FILE:" in (messages[0].get("content") or ""):
+        content += f"[FILE: BULK_NOTES.md]\n{content}[END FILE]\n"
+    return content
+
+class LocalBatchAPI:
+    """Offline stand-in for the provider batch API with the same job and result file formats"""
+
+    def __init__(self, responder=local_batch_response):
+        self.responder = responder
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job_path: Path) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        with self.lock:
+            self.batches[batch_id] = {"status": "validating", "output_file_id": None, "error_file_id": None}
+        threading.Thread(target=self._process, args=(batch_id, job_path), daemon=True).start()
+        return batch_id
+
+    def _process(self, batch_id: str, job_path: Path):
+        with self.lock:
+            self.batches[batch_id]["status"] = "in_progress"
+        output_path = job_path.with_name(f"{batch_id}_output.jsonl")
+        with open(job_path, encoding='utf-8') as job, open(output_path, 'w', encoding='utf-8') as out:
+            for line in job:
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"]["messages"])
+                    response = {"status_code": 200, "body": {
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0}
+                    }}
+                    error = None
+                except Exception as e:
+                    response, error = None, {"message": str(e)}
+                out.write(json.dumps({"custom_id": request["custom_id"], "response": response, "error": error}) + "\n")
+        with self.lock:
+            self.batches[batch_id].update(status="completed", output_file_id=output_path.name)
+
+    def retrieve(self, batch_id: str) -> dict:
+        with self.lock:
+            return dict(self.batches[batch_id])
+
+    def download(self, file_id: str) -> str:
+        return (BULK_DIR / file_id).read_text(encoding='utf-8')
+
+def bulk_batch_api(name: str):
+    """'provider' uses the configured client's batch API, 'local' the offline stand-in"""
+    if name == "local":
+        return LocalBatchAPI()
+    if client is None:
+        raise RuntimeError("GROQ_API_KEY is not set; use the local batch API")
+    return ProviderBatchAPI(client)
+
+def usage_from_dict(usage: Optional[dict]):
+    """Attribute view of a usage dict from a batch result, as record_prompt_usage expects"""
+    if not usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    return types.SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        prompt_tokens_details=types.SimpleNamespace(cached_tokens=details.get("cached_tokens", 0))
+    )
+
+class BulkBatcher:
+    """Collects the blocking LLM calls of many build threads into batch jobs, one wave at a time"""
+
+    def __init__(self, api, collect_seconds: float = BULK_COLLECT_SECONDS, poll_seconds: float = BULK_POLL_SECONDS,
+                 wave_size: int = BULK_WAVE_SIZE):
+        self.api = api
+        self.collect_seconds = collect_seconds
+        self.wave_size = max(1, min(wave_size, BULK_MAX_REQUESTS))
+        self.poll_seconds = poll_seconds
+        self.condition = threading.Condition()
+        self.participants = 0
+        self.pending = []  # (custom_id, body, messages, future)
+        self.first_pending_at = None
+        self.closed = False
+        self.stats = {"waves": 0, "requests": 0, "failed": 0}
+        self.thread = threading.Thread(target=self._run, name="bulk-batcher", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    @contextmanager
+    def participant(self):
+        """Route this thread's LLM calls through the batcher for the duration of the block"""
+        with self.condition:
+            self.participants += 1
+        token = BULK_BATCHER.set(self)
+        try:
+            yield self
+        finally:
+            BULK_BATCHER.reset(token)
+            with self.condition:
+                self.participants -= 1
+                self.condition.notify_all()  # the others may now all be waiting
+
+    def complete(self, messages, model, temperature, max_tokens, top_p) -> tuple:
+        """Queue one chat completion for the next wave and block until its result arrives"""
+        body = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        if top_p is not None:
+            body["top_p"] = top_p
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Bulk batcher is closed")
+            if not self.pending:
+                self.first_pending_at = time.monotonic()
+            self.pending.append((uuid.uuid4().hex, body, messages, future))
+            self.condition.notify_all()
+        return future.result()
+
+    def _wave_ready(self) -> bool:
+        if not self.pending:
+            return False
+        return (len(self.pending) >= self.wave_size
+                or len(self.pending) >= self.participants
+                or self.closed
+                or time.monotonic() - self.first_pending_at >= self.collect_seconds)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self._wave_ready():
+                    if self.closed and not self.pending:
+                        return
+                    remaining = (self.first_pending_at + self.collect_seconds - time.monotonic()
+                                 if self.pending else None)
+                    self.condition.wait(timeout=remaining)
+                wave, self.pending = self.pending[:BULK_MAX_REQUESTS], self.pending[BULK_MAX_REQUESTS:]
+                self.first_pending_at = time.monotonic() if self.pending else None
+            self._run_wave(wave)
+
+    def _run_wave(self, wave: list):
+        """Submit one job file, wait for the batch and resolve every caller's future"""
+        BULK_DIR.mkdir(parents=True, exist_ok=True)
+        job_path = BULK_DIR / f"job_{uuid.uuid4().hex[:12]}.jsonl"
+        result_files = []
+        try:
+            with open(job_path, 'w', encoding='utf-8') as f:
+                for custom_id, body, _, _ in wave:
+                    f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": BULK_ENDPOINT, "body": body}) + "\n")
+            batch_id = self.api.submit(job_path)
+            print(f"Bulk wave {self.stats['waves'] + 1}: {len(wave)} requests submitted as {batch_id}")
+            info = self.api.retrieve(batch_id)
+            while info["status"] not in BULK_FINAL_STATUSES:
+                sleep(self.poll_seconds)
+                info = self.api.retrieve(batch_id)
+
+            results = {}
+            for file_id in (info.get("output_file_id"), info.get("error_file_id")):
+                if not file_id:
+                    continue
+                result_files.append(file_id)
+                for line in self.api.download(file_id).splitlines():
+                    if line.strip():
+                        item = json.loads(line)
+                        results[item["custom_id"]] = item
+
+            for custom_id, _, messages, future in wave:
+                item = results.get(custom_id) or {}
+                response = item.get("response") or {}
+                if response.get("status_code") == 200:
+                    body = response["body"]
+                    choice = body["choices"][0]
+                    record_prompt_usage(messages, usage_from_dict(body.get("usage")))
+                    future.set_result(((choice.get("message") or {}).get("content") or "", choice.get("finish_reason")))
+                else:
+                    error = (item.get("error") or {}).get("message") or (response.get("body") or {}).get("error") \
+                        or f"batch {info['status']} without a result"
+                    self.stats["failed"] += 1
+                    future.set_exception(RuntimeError(f"Bulk request failed: {error}"))
+            print(f"Bulk wave {self.stats['waves'] + 1} {info['status']}")
+        except Exception as e:
+            print(f"Bulk wave failed: {str(e)}")
+            for _, _, _, future in wave:
+                if not future.done():
+                    self.stats["failed"] += 1
+                    future.set_exception(e)
+        finally:
+            self.stats["waves"] += 1
+            self.stats["requests"] += len(wave)
+            job_path.unlink(missing_ok=True)
+            if isinstance(self.api, LocalBatchAPI):
+                for file_id in result_files:
+                    (BULK_DIR / file_id).unlink(missing_ok=True)
+
+# -----------------------------
+# Startup
+# -----------------------------
+# Every worker runs this on import; the lock keeps them from indexing twice
+try:
+    with get_state_store().lock("catalog-init", timeout=60):
+        if init_catalog():
+            rebuild_catalog()
+except (LockTimeout, OSError, sqlite3.Error) as e:
+    print(f"Initial catalog build failed: {str(e)}")
+
+start_retention_sweeper()
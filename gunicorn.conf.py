@@ -0,0 +1,26 @@
+# Gunicorn configuration for running the backend with several uvicorn workers.
+#
+#   gunicorn app:app -c gunicorn.conf.py
+#
+# Shared state (rate limits, caches, job queues, locks) lives in
+# output/.state.sqlite3 or Redis (REDIS_URL), so every worker sees the same view.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# One worker per core. Each worker also starts its own validation pool
+# (VALIDATION_WORKERS processes, up to 4), a retention sweeper thread and an LLM
+# scheduler, so a host runs about WEB_CONCURRENCY x (1 + VALIDATION_WORKERS)
+# processes. LLM calls wait on the network and are shared fairly by the scheduler,
+# so more workers rarely help; override with WEB_CONCURRENCY.
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Generating a stage can take several minutes
+timeout = int(os.getenv("WORKER_TIMEOUT", "600"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
@@ -1,25 +1,39 @@
 import streamlit as st
 import requests
-from groq import Groq
 import os
-from datetime import datetime
 import re
 import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Output directory configuration
-OUTPUT_BASE_DIR = Path("/sync_space/output")
-OUTPUT_BASE_DIR.mkdir(parents=True, exist_ok=True)
+st.set_page_config(page_title="Project Breakdown", page_icon="🛠️", layout="wide")
+
+# --------------------------
+# Process-wide resources
+# --------------------------
+# Streamlit re-executes this script on every interaction, so anything that
+# only needs to happen once per process (env loading, client construction)
+# lives behind st.cache_resource.
+@st.cache_resource
+def load_config():
+    """Load environment configuration once per process"""
+    load_dotenv()
+    return {
+        # Backend address as seen from the user's browser (for direct downloads)
+        "public_api_base": os.getenv("PUBLIC_API_BASE", "http://localhost:8000"),
+        # A stage build answers only when it finishes, so its read timeout is longer
+        "build_timeout": float(os.getenv("BUILD_TIMEOUT_SECONDS", "900")),
+    }
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session so backend calls reuse pooled connections"""
+    return requests.Session()
 
-# Add Groq client setup
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    st.error("⚠️ GROQ_API_KEY environment variable is not set!")
-    client = None
-else:
-    client = Groq(api_key=GROQ_API_KEY)
+CONFIG = load_config()
+http = get_http_session()
 
 def sanitize_project_name(name):
     """Sanitize the project name to be file system friendly"""
@@ -43,79 +57,9 @@ def sanitize_project_name(name):
         
     return sanitized
 
-def generate_unique_project_name(project_description):
-    """Generate a unique project name with better error handling and file saving"""
-    if not client:
-        return "Unnamed_Project"
-    
-    prompt = f"""Given this project description: '{project_description}'
-    Generate a unique, memorable, and professional project name that is:
-    - Maximum 3 words
-    - No special characters or symbols
-    - Only use letters, numbers, and single spaces
-    - Easy to remember
-    - Related to the project's purpose
-    Return only the name, nothing else."""
-    
-    try:
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=50
-        )
-        
-        generated_name = chat_completion.choices[0].message.content.strip()
-        sanitized_name = sanitize_project_name(generated_name)
-        
-        # Create unique name by checking if directory exists
-        unique_name = sanitized_name
-        counter = 2
-        while (OUTPUT_BASE_DIR / unique_name).exists():
-            unique_name = f"{sanitized_name}_v{counter}"
-            counter += 1
-        
-        # Ensure the name isn't too long for file systems
-        if len(unique_name) > 240:
-            unique_name = unique_name[:240]
-        
-        # Create project directory in the output directory
-        project_dir = OUTPUT_BASE_DIR / unique_name
-        project_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Save project info
-        project_info = {
-            "name": unique_name,
-            "original_description": project_description,
-            "generated_name": generated_name,
-            "created_at": datetime.now().isoformat(),
-            "sanitized_name": sanitized_name
-        }
-        
-        # Save project info to JSON file
-        info_file = project_dir / "project_info.json"
-        with open(info_file, 'w', encoding='utf-8') as f:
-            json.dump(project_info, f, indent=2)
-            
-        # Save project description
-        desc_file = project_dir / "description.md"
-        with open(desc_file, 'w', encoding='utf-8') as f:
-            f.write(f"# {unique_name}\n\n## Project Description\n\n{project_description}")
-        
-        return unique_name
-    except Exception as e:
-        st.warning(f"Failed to generate name using Groq: {str(e)}")
-        fallback_name = "Unnamed_Project"
-        counter = 2
-        while (OUTPUT_BASE_DIR / fallback_name).exists():
-            fallback_name = f"Unnamed_Project_v{counter}"
-            counter += 1
-        fallback_dir = OUTPUT_BASE_DIR / fallback_name
-        fallback_dir.mkdir(parents=True, exist_ok=True)
-        return fallback_name
-
 # FastAPI endpoints
-API_BREAKDOWN = "http://backend:8000/breakdown"
+API_BASE = "http://backend:8000"
+API_BREAKDOWN = f"{API_BASE}/breakdown"
 API_ENDPOINTS = {
     "Requirements_GatheringAnd_Analysis": "http://backend:8000/Requirements_GatheringAnd_Analysis/",
     "Design": "http://backend:8000/Design/",
@@ -126,7 +70,16 @@ API_ENDPOINTS = {
     "Execution_And_Startup": "http://backend:8000/Execution_And_Startup/"
 }
 
-st.set_page_config(page_title="Project Breakdown", page_icon="🛠️", layout="wide")
+STAGE_ORDER = [
+    "Requirements_GatheringAnd_Analysis",
+    "Design",
+    "Implementation_Development",
+    "Testing_Quality_Assurance",
+    "Deployment",
+    "Maintenance",
+    "Execution_And_Startup"
+]
+
 st.title("🛠️ Project Breakdown & Agent Assignment")
 
 # --------------------------
@@ -154,6 +107,17 @@ def validate_project_description(description):
         return False, "Project description is too long. Please be more concise."
     return True, ""
 
+GENERATION_MODE_LABELS = {
+    "Server default": None,
+    "LLM": "llm",
+    "Templates (offline, instant)": "template",
+    "LLM, templates if it fails": "auto"
+}
+generation_mode = GENERATION_MODE_LABELS[st.selectbox(
+    "Generation mode", list(GENERATION_MODE_LABELS), key="generation_mode_label",
+    help="Templates build every stage deterministically from the breakdown, without the LLM"
+)]
+
 if st.button("🔍 Breakdown Project"):
     is_valid, error_message = validate_project_description(project_desc)
     
@@ -162,17 +126,16 @@ if st.button("🔍 Breakdown Project"):
     else:
         with st.spinner("Breaking down project..."):
             try:
-                # Generate unique project name first
-                unique_project_name = generate_unique_project_name(project_desc)
-                
-                response = requests.post(
+                # The backend names the project while it generates the breakdown
+                response = http.post(
                     API_BREAKDOWN, 
-                    json={"project_description": project_desc},  # Simplified payload
+                    json={"project_description": project_desc, "generation_mode": generation_mode},
                     timeout=30
                 )
                 
                 if response.status_code == 200:
                     data = response.json()
+                    unique_project_name = data.get("project_name", "Unnamed_Project")
                     st.session_state.subtasks = data.get("subtasks", [])
                     st.session_state.project_name = unique_project_name
                     st.success("✅ Project breakdown completed!")
@@ -189,8 +152,184 @@ if st.button("🔍 Breakdown Project"):
 # --------------------------
 # File Display Function
 # --------------------------
+FILE_PAGE_SIZE = 20
+PREVIEW_CHUNK_BYTES = 32 * 1024
+
+# File type configurations
+FILE_TYPES = {
+    # Documentation
+    '.md': {'icon': '📝', 'display': 'markdown', 'mime': 'text/markdown'},
+    '.txt': {'icon': '📄', 'display': 'text', 'mime': 'text/plain'},
+    
+    # Code
+    '.py': {'icon': '🐍', 'display': 'code', 'mime': 'text/x-python'},
+    '.js': {'icon': '🟨', 'display': 'code', 'mime': 'text/javascript'},
+    '.ts': {'icon': '📘', 'display': 'code', 'mime': 'text/typescript'},
+    '.java': {'icon': '☕', 'display': 'code', 'mime': 'text/x-java'},
+    '.html': {'icon': '🌐', 'display': 'code', 'mime': 'text/html'},
+    '.css': {'icon': '🎨', 'display': 'code', 'mime': 'text/css'},
+    
+    # Configuration
+    '.yaml': {'icon': '⚙️', 'display': 'code', 'mime': 'text/yaml'},
+    '.yml': {'icon': '⚙️', 'display': 'code', 'mime': 'text/yaml'},
+    '.json': {'icon': '📊', 'display': 'json', 'mime': 'application/json'},
+    '.env': {'icon': '🔐', 'display': 'code', 'mime': 'text/plain'},
+    '.conf': {'icon': '⚙️', 'display': 'code', 'mime': 'text/plain'},
+    
+    # Database
+    '.sql': {'icon': '🗄️', 'display': 'code', 'mime': 'text/x-sql'},
+    
+    # Diagrams
+    '.puml': {'icon': '📊', 'display': 'code', 'mime': 'text/plain'},
+    
+    # Scripts
+    '.sh': {'icon': '⚡', 'display': 'code', 'mime': 'text/x-sh'},
+    '.bat': {'icon': '⚡', 'display': 'code', 'mime': 'text/plain'},
+    
+    # Monitoring
+    '.log': {'icon': '📝', 'display': 'text', 'mime': 'text/plain'},
+}
+
+FILE_CATEGORIES = [
+    'Documentation', 'Source Code', 'Tests', 'Configuration', 'Deployment',
+    'Scripts', 'Startup Scripts', 'How To Run', 'Design Artifacts', 'Other'
+]
+
+def get_file_type(file_name):
+    """Look up display settings for a file name"""
+    if file_name == 'Dockerfile':
+        return {'icon': '🐳', 'display': 'code', 'mime': 'text/plain'}
+    if file_name in ['start.sh', 'start.bat', 'run.py']:
+        return {**FILE_TYPES.get(Path(file_name).suffix, FILE_TYPES['.sh']), 'icon': '🚀'}
+    if file_name.endswith('_test.py') or file_name.endswith('.spec.js'):
+        return {**FILE_TYPES.get(Path(file_name).suffix, FILE_TYPES['.py']), 'icon': '🧪'}
+    return FILE_TYPES.get(Path(file_name).suffix.lower(),
+                          {'icon': '📄', 'display': 'text', 'mime': 'text/plain'})
+
+def fetch_file_page(project_name, stage, file_type, page):
+    """Fetch one page of the project file listing from the backend"""
+    params = {"page": page, "page_size": FILE_PAGE_SIZE}
+    if stage:
+        params["stage"] = stage
+    if file_type:
+        params["file_type"] = file_type
+    response = http.get(f"{API_BASE}/projects/{project_name}/files", params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+def fetch_file_chunk(project_name, path, offset):
+    """Fetch a byte range of a project file from the backend"""
+    response = http.get(
+        f"{API_BASE}/projects/{project_name}/files/content",
+        params={"path": path, "offset": offset, "length": PREVIEW_CHUNK_BYTES},
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.json()
+
+def display_file_preview(project_name, entry, key):
+    """Show an opened file, loading further chunks on demand"""
+    state_key = f"{key}_preview"
+    preview = st.session_state.get(state_key)
+    if not preview or preview["path"] != entry["path"]:
+        chunk = fetch_file_chunk(project_name, entry["path"], 0)
+        preview = {"path": entry["path"], "content": chunk["content"] or "",
+                   "binary": chunk["binary"], "next_offset": chunk["next_offset"],
+                   "eof": chunk["eof"], "size": chunk["size"]}
+        st.session_state[state_key] = preview
+
+    file_type = get_file_type(entry["name"])
+    if preview["binary"]:
+        st.info("Binary file - preview not available.")
+    elif not preview["eof"]:
+        # Partial content is always shown raw; rendering half a document is misleading
+        st.code(preview["content"], language=Path(entry["name"]).suffix.lstrip('.') or None)
+        st.caption(f"Showing {preview['next_offset']/1024:.1f} KB of {preview['size']/1024:.1f} KB")
+        if st.button("⏬ Load more", key=f"{key}_more"):
+            chunk = fetch_file_chunk(project_name, entry["path"], preview["next_offset"])
+            preview["content"] += chunk["content"] or ""
+            preview["next_offset"] = chunk["next_offset"]
+            preview["eof"] = chunk["eof"]
+            st.rerun(scope="fragment")
+    elif file_type['display'] == 'markdown':
+        st.markdown(preview["content"])
+    elif file_type['display'] == 'json':
+        try:
+            st.json(json.loads(preview["content"]))
+        except json.JSONDecodeError:
+            st.code(preview["content"], language='json')
+    elif file_type['display'] == 'code':
+        st.code(preview["content"], language=Path(entry["name"]).suffix.lstrip('.') or None)
+    else:
+        st.text(preview["content"])
+
+    st.caption(f"Last modified: {entry['modified'][:19].replace('T', ' ')} · Size: {entry['size']/1024:.2f} KB")
+
+    # Only offer a download once the whole file has been fetched
+    if preview["eof"] and not preview["binary"]:
+        st.download_button(
+            label=f"⬇️ Download {entry['name']}",
+            data=preview["content"].encode('utf-8'),
+            file_name=entry["name"],
+            mime=file_type['mime'],
+            key=f"{key}_download"
+        )
+
+def render_file_browser(project_name, stage=None, key="browser"):
+    """Paginated file browser backed by the backend directory listing API"""
+    filter_cols = st.columns([2, 2, 1])
+    if stage is None:
+        stage_filter = filter_cols[0].selectbox(
+            "Stage", ["All stages"] + STAGE_ORDER, key=f"{key}_stage"
+        )
+        stage_filter = None if stage_filter == "All stages" else stage_filter
+    else:
+        stage_filter = stage
+        filter_cols[0].markdown(f"**Stage:** `{stage}`")
+    type_filter = filter_cols[1].selectbox(
+        "File type", ["All types"] + FILE_CATEGORIES, key=f"{key}_type"
+    )
+    type_filter = None if type_filter == "All types" else type_filter
+    page = filter_cols[2].number_input("Page", min_value=1, value=1, step=1, key=f"{key}_page")
+
+    try:
+        listing = fetch_file_page(project_name, stage_filter, type_filter, page)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            st.warning("No files have been generated for this project yet.")
+        else:
+            st.error(f"Failed to list files: {e}")
+        return
+    except requests.RequestException as e:
+        st.error(f"Failed to list files: {e}")
+        return
+
+    if listing["total"] == 0:
+        st.warning("No files match the current filters.")
+        return
+
+    st.caption(f"{listing['total']} file(s) · page {listing['page']} of {max(listing['pages'], 1)}")
+    entries = {entry["path"]: entry for entry in listing["files"]}
+    if not entries:
+        st.info("No files on this page.")
+        return
+
+    selected = st.radio(
+        "Files",
+        list(entries.keys()),
+        format_func=lambda p: f"{get_file_type(entries[p]['name'])['icon']} {p} ({entries[p]['size']/1024:.1f} KB)",
+        index=None,
+        key=f"{key}_selected",
+        label_visibility="collapsed"
+    )
+    if selected:
+        try:
+            display_file_preview(project_name, entries[selected], key)
+        except requests.RequestException as e:
+            st.error(f"Error displaying file {selected}: {e}")
+
 def display_generated_files(exec_data):
-    """Display generated files with comprehensive file type handling"""
+    """Browse the files generated for a stage"""
     if not exec_data:
         return
     
@@ -201,157 +340,251 @@ def display_generated_files(exec_data):
     if not project_folder_str:
         st.error("No project folder specified")
         return
-    
-    # Handle path based on whether we're in Docker or local
-    project_folder = Path(project_folder_str)
-    
-    # If path doesn't exist as-is, try relative to /sync_space/output (Docker mount)
-    if not project_folder.exists():
-        # Try docker path
-        docker_path = Path("/sync_space/output") / project_folder_str.split('/')[-1]
-        if docker_path.exists():
-            project_folder = docker_path
-        else:
-            st.error(f"Project folder not found: {project_folder_str}")
-            st.info(f"Tried paths: {project_folder}, {docker_path}")
-            return
 
-    # File type configurations
-    FILE_TYPES = {
-        # Documentation
-        '.md': {'icon': '📝', 'display': 'markdown', 'mime': 'text/markdown'},
-        '.txt': {'icon': '📄', 'display': 'text', 'mime': 'text/plain'},
-        
-        # Code
-        '.py': {'icon': '🐍', 'display': 'code', 'mime': 'text/x-python'},
-        '.js': {'icon': '🟨', 'display': 'code', 'mime': 'text/javascript'},
-        '.ts': {'icon': '📘', 'display': 'code', 'mime': 'text/typescript'},
-        '.java': {'icon': '☕', 'display': 'code', 'mime': 'text/x-java'},
-        '.html': {'icon': '🌐', 'display': 'code', 'mime': 'text/html'},
-        '.css': {'icon': '🎨', 'display': 'code', 'mime': 'text/css'},
-        
-        # Tests
-        '_test.py': {'icon': '🧪', 'display': 'code', 'mime': 'text/x-python'},
-        '.spec.js': {'icon': '🧪', 'display': 'code', 'mime': 'text/javascript'},
-        
-        # Configuration
-        '.yaml': {'icon': '⚙️', 'display': 'code', 'mime': 'text/yaml'},
-        '.yml': {'icon': '⚙️', 'display': 'code', 'mime': 'text/yaml'},
-        '.json': {'icon': '📊', 'display': 'json', 'mime': 'application/json'},
-        '.env': {'icon': '🔐', 'display': 'code', 'mime': 'text/plain'},
-        '.conf': {'icon': '⚙️', 'display': 'code', 'mime': 'text/plain'},
-        
-        # Deployment
-        'Dockerfile': {'icon': '🐳', 'display': 'code', 'mime': 'text/plain'},
-        'docker-compose.yml': {'icon': '🐋', 'display': 'code', 'mime': 'text/yaml'},
-        
-        # Database
-        '.sql': {'icon': '🗄️', 'display': 'code', 'mime': 'text/x-sql'},
-        
-        # Diagrams
-        '.puml': {'icon': '📊', 'display': 'code', 'mime': 'text/plain'},
-        
-        # Scripts
-        '.sh': {'icon': '⚡', 'display': 'code', 'mime': 'text/x-sh'},
-        '.bat': {'icon': '⚡', 'display': 'code', 'mime': 'text/plain'},
-        
-        # Startup Scripts
-        'start.sh': {'icon': '🚀', 'display': 'code', 'mime': 'text/x-sh'},
-        'start.bat': {'icon': '🚀', 'display': 'code', 'mime': 'text/plain'},
-        'run.py': {'icon': '🏃', 'display': 'code', 'mime': 'text/x-python'},
-        'setup_env.sh': {'icon': '⚙️', 'display': 'code', 'mime': 'text/x-sh'},
-        
-        # Monitoring
-        '.log': {'icon': '📝', 'display': 'text', 'mime': 'text/plain'},
-    }
-    
-    # Group files by type
-    files_by_type = {}
     files_created = exec_data.get('files_created', [])
-    
     if not files_created:
         st.warning("No files were created for this task.")
         return
+
+    render_file_browser(
+        Path(project_folder_str).name,
+        stage=exec_data.get('stage'),
+        key=f"browser_{sanitize_project_name(exec_data.get('stage', 'stage'))}"
+    )
+    st.info(f"📁 Files are stored in: `{project_folder_str}`")
+
+# --------------------------
+# Stage panels
+# --------------------------
+def display_exec_result(exec_data):
+    """Render the outcome of a stage build"""
+    # Show information about stage dependencies
+    if 'previous_files_referenced' in exec_data and exec_data['previous_files_referenced']:
+        with st.expander("🔗 Previous Stage Files Used", expanded=False):
+            st.markdown("**This stage built upon the following files from previous stages:**")
+            for ref_file in exec_data['previous_files_referenced']:
+                st.markdown(f"- `{ref_file}`")
+            st.caption(f"Total: {len(exec_data['previous_files_referenced'])} files referenced")
     
-    st.info(f"Found {len(files_created)} file(s) to display")
-    
-    for file_path in files_created:
-        file = Path(file_path)
-        if not file.exists():
-            st.warning(f"File not found: {file_path}")
-            continue
-            
-        file_type = file.suffix.lower()
-        if '_test' in file.name:
-            type_key = 'Tests'
-        elif file.name in ['start.sh', 'start.bat', 'run.py', 'setup_env.sh', 'setup_env.bat']:
-            type_key = 'Startup Scripts'
-        elif file.name in ['README_RUN.md', 'QUICK_START.md', 'HOW_TO_RUN.md']:
-            type_key = '🚀 How To Run'
-        elif file.name == 'Dockerfile':
-            type_key = 'Deployment'
-        elif file_type in ['.yml', '.yaml', '.json', '.env', '.conf']:
-            type_key = 'Configuration'
-        elif file_type in ['.py', '.js', '.ts', '.java']:
-            type_key = 'Source Code'
-        elif file_type in ['.md', '.txt']:
-            type_key = 'Documentation'
-        else:
-            type_key = 'Other'
-            
-        if type_key not in files_by_type:
-            files_by_type[type_key] = []
-        files_by_type[type_key].append(file)
-
-    # Display files by group
-    for group, files in files_by_type.items():
-        st.markdown(f"#### {group}")
-        for file in sorted(files):
-            file_type = FILE_TYPES.get(file.suffix.lower(), 
-                                    {'icon': '📄', 'display': 'text', 'mime': 'text/plain'})
-            
-            with st.expander(f"{file_type['icon']} {file.name}"):
-                try:
-                    if file_type['display'] == 'markdown':
-                        content = file.read_text(encoding='utf-8')
-                        st.markdown(content)
-                    
-                    elif file_type['display'] == 'code':
-                        content = file.read_text(encoding='utf-8')
-                        st.code(content, language=file.suffix.lstrip('.'))
-                    
-                    elif file_type['display'] == 'json':
-                        content = file.read_text(encoding='utf-8')
-                        st.json(json.loads(content))
-                    
-                    else:  # Default text display
-                        content = file.read_text(encoding='utf-8')
-                        st.text(content)
-                    
-                    # File metadata
-                    file_stat = file.stat()
-                    st.caption(f"""
-                    Last modified: {datetime.fromtimestamp(file_stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')}
-                    Size: {file_stat.st_size/1024:.2f} KB
-                    """)
+    # Display the generated files
+    display_generated_files(exec_data)
+
+PROGRESS_LABELS = {
+    "run_started": "Starting build",
+    "context_collected": "Collected previous stage outputs",
+    "memoized": "Inputs unchanged - reusing stored result",
+    "required_files_checked": "Checked required input files",
+    "document_generated": "Stage document generated",
+    "generating_files": "Generating files",
+    "validating": "Validating generated files",
+    "validated": "Validation finished",
+    "file_repaired": "Repaired file",
+    "version_committed": "Committed new stage version",
+    "sandbox_started": "Starting sandbox check",
+    "sandbox_finished": "Sandbox check finished",
+    "benchmark_started": "Running benchmark",
+    "benchmark_finished": "Benchmark finished",
+}
+
+def post_with_progress(endpoint_url, payload, title):
+    """Run a stage build while following its progress events over SSE"""
+    run_id = uuid.uuid4().hex
+    payload = {**payload, "run_id": run_id}
+    status = st.status(f"Building {title}...", expanded=True)
+    progress = status.progress(0.0)
+    # The build request blocks until the stage finishes, so it runs on a
+    # worker thread while this thread renders the event stream.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(http.post, endpoint_url, json=payload, timeout=(30, CONFIG["build_timeout"]))
+        try:
+            with http.get(f"{API_BASE}/runs/{run_id}/events", stream=True, timeout=(5, 30)) as stream:
+                for line in stream.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        if future.done():
+                            break
+                        continue
+                    event = json.loads(line[5:])
+                    name = event.get("event")
+                    if name == "file_written":
+                        if event.get("total"):
+                            progress.progress(min(event["index"] / event["total"], 1.0))
+                        status.write(f"📝 {event.get('file')} ({event.get('outcome', 'written')})")
+                    elif name in PROGRESS_LABELS:
+                        detail = event.get("file") or ""
+                        status.write(f"{PROGRESS_LABELS[name]} {detail}".strip())
+                    if name in ("run_completed", "run_failed"):
+                        break
+        except (requests.RequestException, ValueError) as e:
+            # Progress is best-effort; the build result still arrives below
+            status.write(f"Progress stream unavailable: {e}")
+        response = future.result()
+    failed = response.status_code != 200 or response.json().get("status") in ("failed", "terminated", "busy")
+    status.update(label=f"{title}: {'build failed' if failed else 'done'}", state="error" if failed else "complete", expanded=False)
+    return response
+
+@st.fragment
+def render_stage_panel(s):
+    """Render a single stage panel.
+
+    Runs as an isolated fragment: clicking this stage's build button only
+    reruns this function, not the whole script or the other stage panels.
+    """
+    with st.expander(f"📌 {s['title']}"):
+        st.write(f"**Description:** {s['description']}")
+        st.write(f"**How to Build:** {s['how_to_build']}")
+        st.write(f"**Agent Name:** {s['Agent_Name']}")
+        if 'required_files' in s:
+            st.write("**Required Files:**", ', '.join(s['required_files']))
+        if 'dependencies' in s:
+            st.write("**Dependencies:**", ', '.join(s['dependencies']))
+        if 'acceptance_criteria' in s:
+            st.write("**Acceptance Criteria:**")
+            for criterion in s['acceptance_criteria']:
+                st.write(f"- {criterion}")
+
+        # Execute subtask
+        endpoint_url = API_ENDPOINTS.get(s["title"], None)
+        
+        # Show stage dependencies
+        if s["title"] in STAGE_ORDER:
+            stage_index = STAGE_ORDER.index(s["title"])
+            if stage_index > 0:
+                previous_stages = STAGE_ORDER[:stage_index]
+                st.info(f"ℹ️ This stage will build upon: {', '.join(previous_stages)}")
+        
+        if not endpoint_url:
+            st.warning("No API endpoint configured for this subtask.")
+            return
+
+        option_cols = st.columns(2)
+        force = option_cols[0].checkbox(
+            "Force regenerate", key=f"force_{s['id']}",
+            help="Rebuild even if this stage's inputs have not changed since the last build"
+        )
+        update_mode = option_cols[1].checkbox(
+            "Update existing files", key=f"update_{s['id']}",
+            help="Patch the files from the previous build instead of rewriting every file"
+        )
+        benchmark = s["title"] == "Testing_Quality_Assurance" and st.checkbox(
+            "Generate and run a benchmark", key=f"benchmark_{s['id']}",
+            help="Load-test the Design stage's API endpoints in a sandbox and report throughput and latency"
+        )
+        if st.button(f"⚡ Build Subtask: {s['title']}", key=f"build_{s['id']}"):
+            # Safer ID handling
+            try:
+                task_id = int(str(s["id"]).replace("task_", ""))
+            except (ValueError, TypeError):
+                task_id = 0  # fallback ID
                     
-                    # Download button
-                    with open(file, 'rb') as f:
-                        st.download_button(
-                            label=f"⬇️ Download {file.name}",
-                            data=f.read(),
-                            file_name=file.name,
-                            mime=file_type['mime']
+            # Ensure how_to_build is a string
+            if isinstance(s["how_to_build"], (dict, list)):
+                how_to_build = json.dumps(s["how_to_build"])
+            else:
+                how_to_build = str(s["how_to_build"])
+                
+            payload = {
+                "id": task_id,
+                "title": s["title"],
+                "description": s["description"],
+                "how_to_build": how_to_build,
+                "Agent_Name": s["Agent_Name"],
+                "project_name": st.session_state.project_name,
+                "force": force,
+                "mode": "update" if update_mode else "full",
+                "benchmark": bool(benchmark),
+                "required_files": [str(f) for f in s.get("required_files") or []]
+                if isinstance(s.get("required_files"), list) else [],
+                "generation_mode": GENERATION_MODE_LABELS[st.session_state.generation_mode_label]
+            }
+                
+            try:
+                exec_response = post_with_progress(endpoint_url, payload, s['title'])
+                exec_data = exec_response.json() if exec_response.status_code == 200 else None
+                if exec_data and exec_data.get("status") == "busy":
+                    st.warning(f"⏳ {exec_data.get('error')}")
+                elif exec_data and exec_data.get("status") in ("failed", "terminated"):
+                    st.error(f"Build failed: {exec_data.get('error', 'unknown error')}")
+                elif exec_data:
+                    st.session_state.exec_results[s['id']] = exec_data
+                        
+                    # Files are already accessible via shared volume mount
+                    if exec_data.get("cached"):
+                        st.success("♻️ Inputs unchanged - returned the stored result.")
+                    else:
+                        st.success(f"✅ Subtask completed successfully!")
+                    update_summary = exec_data.get("update_summary")
+                    if update_summary:
+                        st.info(
+                            f"✏️ Patched: {len(update_summary['patched'])} · "
+                            f"Rewritten: {len(update_summary['regenerated'])} · "
+                            f"New: {len(update_summary['new'])} · "
+                            f"Unchanged: {len(update_summary['unchanged'])}"
                         )
-                    
-                except Exception as e:
-                    st.error(f"Error displaying file {file.name}: {str(e)}")
-    
-    # Display summary
-    total_files = sum(len(files) for files in files_by_type.values())
-    if total_files > 0:
-        st.success(f"✅ Successfully displayed {total_files} file(s) in {len(files_by_type)} categories")
-        st.info(f"📁 Files are stored in: `{project_folder}`")
+                    validation = exec_data.get("validation") or {}
+                    repaired = (validation.get("repairs") or {}).get("repaired", [])
+                    if repaired:
+                        st.info("🔧 Regenerated files that failed validation: " + ", ".join(repaired))
+                    for entry in validation.get("invalid", []):
+                        st.error(f"❌ {entry['file']}: {entry['error']}")
+                    for entry in validation.get("warnings", []):
+                        st.caption(f"⚠️ {entry['file']} imports unlisted modules: {', '.join(entry['unresolved_imports'])}")
+                    sandbox = exec_data.get("sandbox")
+                    if sandbox and sandbox.get("flag") == "broken":
+                        st.error(f"🧪 Startup check failed ({sandbox['status']}): {sandbox.get('error') or sandbox.get('stderr_tail', '')[-300:]}")
+                    elif sandbox and sandbox.get("time_to_ready") is not None:
+                        st.info(
+                            f"🧪 Startup ready in {sandbox['time_to_ready']}s · "
+                            f"peak memory {sandbox['peak_rss_mb']} MB"
+                            + (" · slow" if sandbox.get("flag") == "slow" else "")
+                        )
+                    bench = exec_data.get("benchmark")
+                    if bench and bench.get("status") == "completed":
+                        st.dataframe([
+                            {
+                                "endpoint": f"{e['method']} {e['path']}",
+                                "req/s": e["throughput_rps"],
+                                "p50 ms": e["latency_ms"]["p50"],
+                                "p95 ms": e["latency_ms"]["p95"],
+                                "errors": e["errors"]
+                            }
+                            for e in bench["endpoints"]
+                        ])
+                    elif bench:
+                        st.warning(f"📈 Benchmark {bench.get('status')}: {bench.get('error', '')}")
+                    if exec_data.get("invalidated_stages"):
+                        st.warning(
+                            "⚠️ These stages were built from the previous output and are now stale: "
+                            + ", ".join(exec_data["invalidated_stages"])
+                        )
+                else:
+                    st.error(f"Build failed: {exec_response.text}")
+            except requests.Timeout:
+                st.error("The build did not answer in time. It may still finish; check the project files.")
+            except Exception as e:
+                st.error(f"Failed to execute subtask: {e}")
+
+        exec_data = st.session_state.exec_results.get(s['id'])
+        if exec_data:
+            display_exec_result(exec_data)
+
+@st.fragment
+def render_project_browser():
+    """Project-wide file browser, rerun independently of the stage panels"""
+    st.subheader("🗂️ Project Files")
+    export_url = f"{CONFIG['public_api_base']}/projects/{st.session_state.project_name}/export"
+    export_cols = st.columns(2)
+    export_cols[0].link_button("📦 Download project (.zip)", f"{export_url}?format=zip")
+    export_cols[1].link_button("📦 Download project (.tar.gz)", f"{export_url}?format=tar.gz")
+    pin_url = f"{API_BASE}/projects/{st.session_state.project_name}/pin"
+    pinned = st.toggle("📌 Keep this project (exempt from automatic cleanup)",
+                       value=st.session_state.get("project_pinned", False))
+    if pinned != st.session_state.get("project_pinned", False):
+        response = http.post(pin_url, timeout=30) if pinned else http.delete(pin_url, timeout=30)
+        if response.status_code == 200:
+            st.session_state.project_pinned = pinned
+        else:
+            st.error(f"Could not update pin: {response.text}")
+    render_file_browser(st.session_state.project_name, key="project_browser")
 
 # --------------------------
 # Show Subtasks
@@ -359,86 +592,10 @@ def display_generated_files(exec_data):
 if st.session_state.subtasks:
     st.subheader("📝 Subtasks")
     for s in st.session_state.subtasks:
-        with st.expander(f"📌 {s['title']}"):
-            st.write(f"**Description:** {s['description']}")
-            st.write(f"**How to Build:** {s['how_to_build']}")
-            st.write(f"**Agent Name:** {s['Agent_Name']}")
-            if 'required_files' in s:
-                st.write("**Required Files:**", ', '.join(s['required_files']))
-            if 'dependencies' in s:
-                st.write("**Dependencies:**", ', '.join(s['dependencies']))
-            if 'acceptance_criteria' in s:
-                st.write("**Acceptance Criteria:**")
-                for criterion in s['acceptance_criteria']:
-                    st.write(f"- {criterion}")
-
-            # Execute subtask
-            endpoint_url = API_ENDPOINTS.get(s["title"], None)
-            
-            # Show stage dependencies
-            stage_order = [
-                "Requirements_GatheringAnd_Analysis",
-                "Design",
-                "Implementation_Development",
-                "Testing_Quality_Assurance",
-                "Deployment",
-                "Maintenance",
-                "Execution_And_Startup"
-            ]
-            
-            if s["title"] in stage_order:
-                stage_index = stage_order.index(s["title"])
-                if stage_index > 0:
-                    previous_stages = stage_order[:stage_index]
-                    st.info(f"ℹ️ This stage will build upon: {', '.join(previous_stages)}")
-            
-            if endpoint_url:
-                if st.button(f"⚡ Build Subtask: {s['title']}", key=f"build_{s['id']}"):
-                    with st.spinner(f"Building {s['title']}..."):
-                        # Safer ID handling
-                        try:
-                            task_id = int(str(s["id"]).replace("task_", ""))
-                        except (ValueError, TypeError):
-                            task_id = 0  # fallback ID
-                            
-                        # Ensure how_to_build is a string
-                        if isinstance(s["how_to_build"], (dict, list)):
-                            how_to_build = json.dumps(s["how_to_build"])
-                        else:
-                            how_to_build = str(s["how_to_build"])
-                        
-                        payload = {
-                            "id": task_id,
-                            "title": s["title"],
-                            "description": s["description"],
-                            "how_to_build": how_to_build,
-                            "Agent_Name": s["Agent_Name"],
-                            "project_name": st.session_state.project_name
-                        }
-                        
-                        try:
-                            exec_response = requests.post(endpoint_url, json=payload)
-                            if exec_response.status_code == 200:
-                                exec_data = exec_response.json()
-                                st.session_state.exec_results[s['id']] = exec_data
-                                
-                                # Files are already accessible via shared volume mount
-                                st.success(f"✅ Subtask completed successfully!")
-                                
-                                # Show information about stage dependencies
-                                if 'previous_files_referenced' in exec_data and exec_data['previous_files_referenced']:
-                                    with st.expander("🔗 Previous Stage Files Used", expanded=False):
-                                        st.markdown("**This stage built upon the following files from previous stages:**")
-                                        for ref_file in exec_data['previous_files_referenced']:
-                                            st.markdown(f"- `{ref_file}`")
-                                        st.caption(f"Total: {len(exec_data['previous_files_referenced'])} files referenced")
-                                
-                                # Display the generated files
-                                display_generated_files(exec_data)
-                            else:
-                                st.error(f"Build failed: {exec_response.text}")
-                        except Exception as e:
-                            st.error(f"Failed to execute subtask: {e}")
-            else:
-                st.warning("No API endpoint configured for this subtask.")
+        render_stage_panel(s)
 
+    # --------------------------
+    # Project file browser
+    # --------------------------
+    if st.session_state.project_name:
+        render_project_browser()
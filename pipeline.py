@@ -0,0 +1,374 @@
+"""Headless pipeline runner: breakdown plus all seven stages, without the Streamlit UI.
+
+    python -m pipeline "A REST API for a book library"
+    python -m pipeline --file backlog.jsonl --workers 4
+    python -m pipeline --file backlog.jsonl --in-process --generation-mode template
+    python -m pipeline --file backlog.jsonl --in-process --bulk provider
+
+Progress is checkpointed after every stage, so rerunning the same command after an
+interruption skips finished projects and resumes the others at their first
+unfinished stage.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from pathlib import Path
+
+import requests
+
+DEFAULT_API_BASE = os.getenv("PIPELINE_API_BASE", "http://localhost:8000")
+DEFAULT_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+BULK_MAX_PARTICIPANTS = int(os.getenv("BULK_MAX_PARTICIPANTS", "64"))  # bulk build threads, whatever the backlog size
+STAGE_TIMEOUT = 900  # seconds one HTTP stage build may take
+BUSY_RETRIES = 5  # a stage locked by another build is retried this many times
+BUSY_RETRY_SECONDS = 10
+CHECKPOINT_VERSION = 1
+
+# -----------------------------
+# Input
+# -----------------------------
+def project_key(item_id, description: str) -> str:
+    """Stable checkpoint key: the line's id, else a hash of the description"""
+    if item_id not in (None, ""):
+        return str(item_id)
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()[:12]
+
+def read_jobs(args) -> list:
+    """Return [{key, description, options}] from the description argument or a JSONL file"""
+    if args.description:
+        return [{"key": project_key(None, args.description), "description": args.description, "options": {}}]
+
+    jobs = []
+    with open(args.file, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number}: invalid JSON ({e})")
+                continue
+            # Same fields as POST /breakdown/batch; backlog entries carry title/body
+            description = item.get("project_description") or item.get("description") or "\n\n".join(
+                str(item[key]).strip() for key in ("title", "body") if item.get(key)
+            )
+            if not description:
+                print(f"Skipping line {line_number}: no description")
+                continue
+            jobs.append({
+                "key": project_key(item.get("id") or item.get("request_id"), description),
+                "description": description,
+                "options": {key: item[key] for key in ("generate_name", "generation_mode") if key in item}
+            })
+    return jobs
+
+# -----------------------------
+# Checkpoint
+# -----------------------------
+class Checkpoint:
+    """Per-project progress on disk, rewritten atomically after every change"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"version": CHECKPOINT_VERSION, "projects": {}}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def project(self, key: str) -> dict:
+        with self.lock:
+            return json.loads(json.dumps(self.data["projects"].get(key, {})))
+
+    def update(self, key: str, **fields):
+        with self.lock:
+            self.data["projects"].setdefault(key, {}).update(fields)
+            self._save()
+
+    def record_stage(self, key: str, stage: str, entry: dict):
+        with self.lock:
+            self.data["projects"].setdefault(key, {}).setdefault("stages", {})[stage] = entry
+            self._save()
+
+    def _save(self):
+        temp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+# -----------------------------
+# Backends
+# -----------------------------
+class HttpBackend:
+    """Runs the pipeline against a running backend, exactly like the UI does"""
+
+    def __init__(self, api_base: str):
+        self.api_base = api_base.rstrip("/")
+        self.local = threading.local()  # requests sessions are not shared across threads
+
+    @property
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def breakdown(self, payload: dict) -> dict:
+        response = self.session.post(f"{self.api_base}/breakdown", json=payload, timeout=STAGE_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def execute(self, payload: dict) -> dict:
+        response = self.session.post(f"{self.api_base}/{payload['title']}/", json=payload, timeout=STAGE_TIMEOUT)
+        if response.status_code != 200:
+            return {"status": "failed", "error": f"HTTP {response.status_code}: {response.text[:300]}"}
+        return response.json()
+
+    def project_exists(self, project_name: str) -> bool:
+        return self.session.get(f"{self.api_base}/projects/{project_name}", timeout=30).status_code == 200
+
+    def participant(self):
+        return nullcontext()
+
+    def close(self):
+        pass
+
+class InProcessBackend:
+    """Runs the pipeline inside this process; needs the backend's environment and output volume"""
+
+    def __init__(self, bulk: str = None):
+        import app  # deferred: importing it starts the backend's catalog and sweeper
+        self.app = app
+        # In bulk mode every project thread's LLM calls are collected into provider batch jobs
+        self.batcher = app.BulkBatcher(app.bulk_batch_api(bulk)) if bulk else None
+
+    def breakdown(self, payload: dict) -> dict:
+        return self.app.breakdown_project(self.app.ProjectRequest(**payload))
+
+    def execute(self, payload: dict) -> dict:
+        return self.app.execute_subtask(self.app.SubtaskRequest(**payload))
+
+    def project_exists(self, project_name: str) -> bool:
+        return (self.app.OUTPUT_BASE_DIR / project_name).is_dir()
+
+    def participant(self):
+        return self.batcher.participant() if self.batcher else nullcontext()
+
+    def close(self):
+        if self.batcher:
+            self.batcher.__exit__(None, None, None)
+            stats = self.batcher.stats
+            print(f"Bulk: {stats['requests']} requests in {stats['waves']} batch jobs, {stats['failed']} failed")
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+def stage_payload(subtask: dict, project_name: str, args) -> dict:
+    """Build a stage request from a breakdown subtask, as the UI does"""
+    try:
+        task_id = int(str(subtask.get("id")).replace("task_", ""))
+    except (ValueError, TypeError):
+        task_id = 0
+    how_to_build = subtask.get("how_to_build", "")
+    if not isinstance(how_to_build, str):
+        how_to_build = json.dumps(how_to_build)
+    required_files = subtask.get("required_files")
+    payload = {
+        "id": task_id,
+        "title": subtask["title"],
+        "description": str(subtask.get("description", "")),
+        "how_to_build": how_to_build,
+        "Agent_Name": str(subtask.get("Agent_Name", "")),
+        "project_name": project_name,
+        "force": args.force,
+        "required_files": [str(f) for f in required_files] if isinstance(required_files, list) else [],
+        "priority": "pipeline",
+        "user": args.user
+    }
+    if args.generation_mode:
+        payload["generation_mode"] = args.generation_mode
+    return payload
+
+def execute_stage(backend, payload: dict) -> dict:
+    """Run one stage, waiting out builds of the same stage that hold its lock"""
+    for attempt in range(BUSY_RETRIES + 1):
+        result = backend.execute(payload)
+        if result.get("status") != "busy" or attempt == BUSY_RETRIES:
+            return result
+        time.sleep(BUSY_RETRY_SECONDS)
+    return result
+
+def run_project(job: dict, backend, checkpoint: Checkpoint, args, stop: threading.Event) -> dict:
+    """Build one project on this worker thread, taking part in the bulk batch if there is one"""
+    with backend.participant():
+        return build_project(job, backend, checkpoint, args, stop)
+
+def build_project(job: dict, backend, checkpoint: Checkpoint, args, stop: threading.Event) -> dict:
+    """Break down one project and build its stages in order, resuming from the checkpoint"""
+    key = job["key"]
+    state = checkpoint.project(key)
+    timings = []
+
+    if state.get("status") == "completed" and not args.force:
+        print(f"[{key}] already completed as {state['project_name']}, skipping")
+        return {"key": key, "status": "skipped", "project_name": state["project_name"], "timings": timings}
+
+    project_name = state.get("project_name")
+    if project_name and not backend.project_exists(project_name):
+        print(f"[{key}] {project_name} no longer exists, starting over")
+        project_name = None
+        checkpoint.update(key, stages={})
+        state["stages"] = {}
+
+    if not project_name:
+        started = time.monotonic()
+        payload = {"project_description": job["description"], **job["options"], "priority": "pipeline", "user": args.user}
+        if args.generation_mode and "generation_mode" not in job["options"]:
+            payload["generation_mode"] = args.generation_mode
+        if args.bulk:
+            # Naming runs on the backend's own thread pool, outside the batch; use keyword names
+            payload.update(generation_mode="llm", generate_name=False)
+        breakdown = backend.breakdown(payload)
+        project_name = breakdown["project_name"]
+        timings.append({"stage": "breakdown", "seconds": time.monotonic() - started, "cached": False})
+        checkpoint.update(key, description=job["description"], project_name=project_name,
+                          subtasks=breakdown["subtasks"], stages={}, status="running")
+        state = checkpoint.project(key)
+        print(f"[{key}] broken down as {project_name}")
+
+    completed = state.get("stages", {})
+    for subtask in state["subtasks"]:
+        stage = subtask["title"]
+        if stop.is_set():
+            return {"key": key, "status": "interrupted", "project_name": project_name, "timings": timings}
+        if completed.get(stage, {}).get("status") == "completed" and not args.force:
+            continue
+        started = time.monotonic()
+        result = execute_stage(backend, stage_payload(subtask, project_name, args))
+        seconds = time.monotonic() - started
+        status = result.get("status", "failed")
+        checkpoint.record_stage(key, stage, {
+            "status": status,
+            "seconds": round(seconds, 3),
+            "version": result.get("version"),
+            "cached": bool(result.get("cached")),
+            "error": result.get("error")
+        })
+        timings.append({"stage": stage, "seconds": seconds, "cached": bool(result.get("cached"))})
+        if status != "completed":
+            # Later stages read this one's output, so the project stops here
+            print(f"[{key}] {stage} {status}: {result.get('error', 'unknown error')}")
+            checkpoint.update(key, status="failed", error=f"{stage}: {result.get('error')}")
+            return {"key": key, "status": "failed", "project_name": project_name, "timings": timings}
+        print(f"[{key}] {stage} done in {seconds:.1f}s{' (cached)' if result.get('cached') else ''}")
+
+    checkpoint.update(key, status="completed", error=None)
+    return {"key": key, "status": "completed", "project_name": project_name, "timings": timings}
+
+def print_summary(outcomes: list, elapsed: float):
+    """Per-stage timing table for the work done in this run, then per-project outcomes"""
+    by_stage = {}
+    for outcome in outcomes:
+        for timing in outcome["timings"]:
+            by_stage.setdefault(timing["stage"], []).append(timing)
+
+    print("\n" + "=" * 72)
+    print(f"{'Stage':<36}{'runs':>6}{'cached':>8}{'mean s':>10}{'max s':>10}")
+    print("-" * 72)
+    for stage, timings in by_stage.items():
+        seconds = [t["seconds"] for t in timings]
+        print(f"{stage:<36}{len(timings):>6}{sum(t['cached'] for t in timings):>8}"
+              f"{sum(seconds) / len(seconds):>10.2f}{max(seconds):>10.2f}")
+    print("-" * 72)
+    for outcome in outcomes:
+        print(f"{outcome['status']:<12}{outcome['key']:<24}{outcome.get('project_name') or ''}")
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+    print("=" * 72)
+    print(f"{len(outcomes)} projects in {elapsed:.1f}s: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pipeline", description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("description", nargs="?", help="a single project description")
+    source.add_argument("--file", type=Path, help="JSONL file with one project per line")
+    parser.add_argument("--workers", type=int,
+                        help=f"projects built in parallel (default: {DEFAULT_WORKERS}, "
+                             f"in bulk mode all of them up to {BULK_MAX_PARTICIPANTS})")
+    parser.add_argument("--checkpoint", type=Path,
+                        help="progress file (default: <file>.checkpoint.json or pipeline.checkpoint.json)")
+    parser.add_argument("--api", default=DEFAULT_API_BASE, help="backend URL (default: %(default)s)")
+    parser.add_argument("--in-process", action="store_true", help="run the backend code in this process")
+    parser.add_argument("--generation-mode", choices=["llm", "template", "auto"])
+    parser.add_argument("--force", action="store_true", help="rebuild every stage, ignoring the checkpoint")
+    parser.add_argument("--user", default=os.getenv("PIPELINE_USER", "pipeline"),
+                        help="tenant the backend's LLM scheduler shares capacity by (default: %(default)s)")
+    parser.add_argument("--bulk", choices=["provider", "local"],
+                        help="send LLM calls through the provider batch API (or its offline stand-in); needs --in-process")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.bulk:
+        if not args.in_process:
+            parser.error("--bulk needs --in-process")
+        if args.generation_mode not in (None, "llm"):
+            parser.error("--bulk generates with the LLM; drop --generation-mode")
+        args.generation_mode = "llm"
+    if args.checkpoint is None:
+        args.checkpoint = args.file.with_suffix(".checkpoint.json") if args.file else Path("pipeline.checkpoint.json")
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    jobs = read_jobs(args)
+    if not jobs:
+        print("Nothing to run")
+        return 1
+
+    if args.workers is None:
+        args.workers = min(len(jobs), BULK_MAX_PARTICIPANTS) if args.bulk else DEFAULT_WORKERS
+    backend = InProcessBackend(args.bulk) if args.in_process else HttpBackend(args.api)
+    checkpoint = Checkpoint(args.checkpoint)
+    stop = threading.Event()
+    started = time.monotonic()
+    outcomes = []
+    print(f"Running {len(jobs)} project(s) with {args.workers} worker(s), checkpoint {args.checkpoint}")
+
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="pipeline")
+    futures = {executor.submit(run_project, job, backend, checkpoint, args, stop): job for job in jobs}
+    def collect(future):
+        job = futures.pop(future)
+        try:
+            outcomes.append(future.result())
+        except Exception as e:
+            print(f"[{job['key']}] failed: {e}")
+            checkpoint.update(job["key"], status="failed", error=str(e))
+            outcomes.append({"key": job["key"], "status": "failed", "timings": []})
+
+    try:
+        for future in as_completed(list(futures)):
+            collect(future)
+    except KeyboardInterrupt:
+        # Running stages finish and are checkpointed; nothing new starts
+        print("\nInterrupted, waiting for running stages to finish. Rerun the same command to resume.")
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in [f for f in futures if not f.cancelled()]:
+            collect(future)
+        backend.close()
+        print_summary(outcomes, time.monotonic() - started)
+        return 130
+    executor.shutdown()
+    backend.close()
+
+    print_summary(outcomes, time.monotonic() - started)
+    return 0 if all(o["status"] in ("completed", "skipped") for o in outcomes) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
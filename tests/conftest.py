@@ -0,0 +1,55 @@
+"""Shared fixtures: an offline backend (template generation) writing to a temp output directory."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app.py reads its configuration at import time, so this has to run before it is imported
+os.environ["OUTPUT_BASE_DIR"] = tempfile.mkdtemp(prefix="syncro-tests-")
+os.environ["GENERATION_MODE"] = "template"
+os.environ["GROQ_API_KEY"] = ""  # set but empty, so a local .env cannot supply a key
+os.environ["RETENTION_INTERVAL_SECONDS"] = "0"
+os.environ["SANDBOX_ENABLED"] = "0"
+os.environ.pop("REDIS_URL", None)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as backend
+
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(backend.app)
+
+
+@pytest.fixture
+def project(client):
+    """A new project broken down in template mode"""
+    response = client.post("/breakdown", json={"project_description": "A books API with /books and /authors"})
+    assert response.status_code == 200
+    data = response.json()
+    data["dir"] = backend.OUTPUT_BASE_DIR / data["project_name"]
+    return data
+
+
+@pytest.fixture
+def build_stage(project):
+    """Build one stage of the project fixture; extra keyword arguments go into the request"""
+    subtasks = {task["title"]: task for task in project["subtasks"]}
+
+    def build(title, **fields):
+        task = subtasks[title]
+        request = backend.SubtaskRequest(
+            id=int(str(task["id"]).replace("task_", "")),
+            title=title,
+            description=task["description"],
+            how_to_build=str(task["how_to_build"]),
+            Agent_Name=task["Agent_Name"],
+            project_name=project["project_name"],
+            **fields
+        )
+        return backend.execute_subtask(request)
+
+    return build
@@ -0,0 +1,76 @@
+"""Content-addressed artifact store: what is shared between projects and how."""
+import os
+import stat
+
+import app as backend
+
+
+def test_identical_files_share_a_read_only_blob(tmp_path):
+    first, second = tmp_path / "a" / "notes.md", tmp_path / "b" / "notes.md"
+    backend.write_artifact(first, b"same body\n")
+    backend.write_artifact(second, b"same body\n")
+    assert os.path.samefile(first, second)
+    assert stat.S_IMODE(first.stat().st_mode) == backend.BLOB_MODE
+
+
+def test_saved_code_has_no_timestamp_and_is_shared(tmp_path):
+    first, second = tmp_path / "a" / "app.py", tmp_path / "b" / "app.py"
+    assert backend.save_content_to_file(first, "print('hello')\n", "py")
+    assert backend.save_content_to_file(second, "print('hello')\n", "py")
+    assert first.read_text(encoding="utf-8") == "print('hello')\n"
+    assert os.path.samefile(first, second)
+
+
+def test_scripts_share_an_executable_blob(tmp_path):
+    first, second = tmp_path / "a" / "start.sh", tmp_path / "b" / "start.sh"
+    assert backend.save_content_to_file(first, "echo hi\n", "sh")
+    assert backend.save_content_to_file(second, "echo hi\n", "sh")
+    assert os.path.samefile(first, second)
+    assert stat.S_IMODE(first.stat().st_mode) == backend.EXECUTABLE_BLOB_MODE
+
+    # The same bytes under a non-script name stay a read-only blob of their own
+    notes = tmp_path / "c" / "start.txt"
+    backend.write_artifact(notes, b"echo hi\n")
+    assert not os.path.samefile(first, notes)
+    assert stat.S_IMODE(notes.stat().st_mode) == backend.BLOB_MODE
+
+
+def test_detach_copies_out_before_mode_change(tmp_path):
+    first, second = tmp_path / "a" / "run.md", tmp_path / "b" / "run.md"
+    backend.write_artifact(first, b"shared\n")
+    backend.write_artifact(second, b"shared\n")
+    backend.detach_from_store(first, 0o755)
+    assert not os.path.samefile(first, second)
+    assert stat.S_IMODE(first.stat().st_mode) == 0o755
+    assert stat.S_IMODE(second.stat().st_mode) == backend.BLOB_MODE
+    assert first.read_bytes() == b"shared\n"
+
+
+def test_new_version_copies_private_files(project, build_stage):
+    build_stage("Deployment")
+    current = backend.current_stage_version(project["dir"], "Deployment")
+    private = current / "local.env"
+    backend.write_private_file(private, b"DEBUG=1\n")
+    script = current / "deploy.sh"
+    backend.write_artifact(script, b"#!/bin/sh\n")
+
+    version_dir = backend.begin_stage_version(project["dir"], "Deployment", carry_over=True)
+    assert not os.path.samefile(private, version_dir / "local.env")
+    assert os.path.samefile(script, version_dir / "deploy.sh")
+
+
+def test_dedupe_relinks_scripts_as_executable_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "OUTPUT_BASE_DIR", tmp_path)
+    monkeypatch.setattr(backend, "BLOB_DIR", tmp_path / ".blobs")
+    old_link = tmp_path / "Shop" / "setup_env.sh"
+    old_link.parent.mkdir()
+    # What an earlier release left behind: the script linked to a read-only blob
+    os.link(backend.store_blob(b"echo setup\n"), old_link)
+    private = tmp_path / "Shop" / "start.sh"
+    backend.write_private_file(private, b"echo start\n", backend.EXECUTABLE_FILE_MODE)
+
+    summary = backend.dedupe_existing_files()
+    assert summary["files"] == 2
+    for script in (old_link, private):
+        assert stat.S_IMODE(script.stat().st_mode) == backend.EXECUTABLE_BLOB_MODE
+        assert script.stat().st_nlink == 2
@@ -0,0 +1,88 @@
+"""BulkBatcher waves against the offline LocalBatchAPI."""
+import threading
+
+import pytest
+
+import app as backend
+
+
+def run_participants(batcher, prompts):
+    """Each prompt is one participant making one call; returns {prompt: result or exception}"""
+    results = {}
+    ready = threading.Barrier(len(prompts))
+
+    def participant(prompt):
+        with batcher.participant():
+            ready.wait()
+            try:
+                results[prompt] = backend.request_completion(
+                    [{"role": "user", "content": prompt}], "model", 0.0, 10, None
+                )
+            except Exception as e:
+                results[prompt] = e
+
+    threads = [threading.Thread(target=participant, args=(prompt,)) for prompt in prompts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_calls_of_all_participants_share_one_wave():
+    api = backend.LocalBatchAPI(lambda messages: messages[-1]["content"].upper())
+    with backend.BulkBatcher(api, collect_seconds=5, poll_seconds=0.01) as batcher:
+        results = run_participants(batcher, ["a", "b", "c"])
+    assert results == {"a": ("A", "stop"), "b": ("B", "stop"), "c": ("C", "stop")}
+    assert batcher.stats == {"waves": 1, "requests": 3, "failed": 0}
+
+
+def test_full_wave_is_sent_without_waiting_for_idle_participants():
+    api = backend.LocalBatchAPI(lambda messages: "ok")
+    with backend.BulkBatcher(api, collect_seconds=60, poll_seconds=0.01, wave_size=2) as batcher:
+        # A third build is still busy elsewhere and makes no call
+        with batcher.participant():
+            results = run_participants(batcher, ["a", "b"])
+    assert results == {"a": ("ok", "stop"), "b": ("ok", "stop")}
+    assert batcher.stats["waves"] == 1
+
+
+def test_failed_request_only_fails_its_caller():
+    def responder(messages):
+        if messages[-1]["content"] == "bad":
+            raise ValueError("refused")
+        return "ok"
+
+    with backend.BulkBatcher(backend.LocalBatchAPI(responder), collect_seconds=5, poll_seconds=0.01) as batcher:
+        results = run_participants(batcher, ["good", "bad"])
+    assert results["good"] == ("ok", "stop")
+    assert isinstance(results["bad"], RuntimeError) and "refused" in str(results["bad"])
+    assert batcher.stats["failed"] == 1
+
+
+def test_job_files_are_cleaned_up():
+    with backend.BulkBatcher(backend.LocalBatchAPI(), collect_seconds=5, poll_seconds=0.01) as batcher:
+        run_participants(batcher, ["x"])
+    assert list(backend.BULK_DIR.glob("*.jsonl")) == []
+
+
+def test_local_stand_in_answers_file_prompts_with_a_file_block():
+    messages = [{"role": "system", "content": "Format your response as:\n[FILE: name]\n...\n[END FILE]"},
+                {"role": "user", "content": "task"}]
+    assert "[FILE: BULK_NOTES.md]" in backend.local_batch_response(messages)
+
+
+def test_stand_in_output_is_fingerprinted_separately(monkeypatch):
+    request = backend.SubtaskRequest(id=1, title="Design", description="d", how_to_build="h",
+                                     Agent_Name="A", project_name="p", generation_mode="llm")
+    assert backend.stage_generator_id(request) == backend.DEFAULT_MODEL
+    with backend.BulkBatcher(backend.LocalBatchAPI(), poll_seconds=0.01) as batcher:
+        with batcher.participant():
+            assert backend.stage_generator_id(request) == backend.LOCAL_BATCH_GENERATOR
+
+
+def test_closed_batcher_rejects_calls():
+    batcher = backend.BulkBatcher(backend.LocalBatchAPI(), poll_seconds=0.01)
+    batcher.__exit__(None, None, None)
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.complete([{"role": "user", "content": "x"}], "model", 0.0, 10, None)
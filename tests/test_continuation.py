@@ -0,0 +1,32 @@
+"""Stitching continuation calls onto truncated output."""
+import app as backend
+
+
+def test_coincidental_short_overlap_is_kept():
+    assert backend.stitch_continuation("x = 1", "1 + 2") == "x = 11 + 2"
+    assert backend.stitch_continuation("items = [", "[1, 2]") == "items = [[1, 2]"
+
+
+def test_blank_lines_are_kept():
+    assert backend.stitch_continuation("a = 1\n", "\nb = 2") == "a = 1\n\nb = 2"
+    assert backend.stitch_continuation("a = 1\n\n", "\n\nb = 2") == "a = 1\n\n\n\nb = 2"
+
+
+def test_long_repeat_is_dropped():
+    tail = "def handler(request):\n    return render(request, 'index.html')"
+    text = "import os\n\n" + tail
+    assert backend.stitch_continuation(text, tail + "\n\nurls = []") == text + "\n\nurls = []"
+
+
+def test_repeated_whole_line_is_dropped():
+    assert backend.stitch_continuation("a = 1\nb = 2\n", "b = 2\nc = 3\n") == "a = 1\nb = 2\nc = 3\n"
+    # The model restarted the partial last line and finished it
+    assert backend.stitch_continuation("a = 1\nreturn x", "return x\n") == "a = 1\nreturn x\n"
+
+
+def test_partial_line_repeat_is_kept():
+    assert backend.stitch_continuation("total = count", "count + 1\n") == "total = countcount + 1\n"
+
+
+def test_no_overlap_appends_verbatim():
+    assert backend.stitch_continuation("first", " second") == "first second"
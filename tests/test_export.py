@@ -0,0 +1,48 @@
+"""Project export archives and their ETag handling."""
+import io
+import tarfile
+import zipfile
+
+
+def test_tar_export_has_exact_length_and_etag(client, project, build_stage):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    response = client.get(f"/projects/{project['project_name']}/export", params={"format": "tar"})
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+    names = tarfile.open(fileobj=io.BytesIO(response.content)).getnames()
+    assert f"{project['project_name']}/Requirements_GatheringAnd_Analysis/requirements.json" in names
+    assert response.headers["etag"]
+
+
+def test_matching_etag_returns_304(client, project, build_stage):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    url = f"/projects/{project['project_name']}/export"
+    etag = client.get(url).headers["etag"]
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    # The ETag covers the format, so another format is never a 304
+    assert client.get(url, params={"format": "tar"}, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_etag_changes_with_content(client, project, build_stage):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    url = f"/projects/{project['project_name']}/export"
+    before = client.get(url)
+    build_stage("Design")
+    after = client.get(url, headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.headers["etag"] != before.headers["etag"]
+    assert any(name.startswith(f"{project['project_name']}/Design/") for name in zipfile.ZipFile(io.BytesIO(after.content)).namelist())
+
+
+def test_stage_filter_and_unknown_stage(client, project, build_stage):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    build_stage("Design")
+    url = f"/projects/{project['project_name']}/export"
+    names = zipfile.ZipFile(io.BytesIO(client.get(url, params={"stages": "Design"}).content)).namelist()
+    assert names and all(name.startswith(f"{project['project_name']}/Design/") for name in names)
+    assert client.get(url, params={"stages": "Nope"}).status_code == 400
@@ -0,0 +1,23 @@
+"""Stage memoization: identical upstream content keeps downstream stages cached."""
+from datetime import datetime, timedelta
+
+import app as backend
+
+
+class OneHourLater(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + timedelta(hours=1)
+
+
+def test_identical_upstream_rebuild_keeps_downstream_cached(project, build_stage, monkeypatch):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    build_stage("Design")
+    build_stage("Implementation_Development")
+
+    # Same content, written at a different time
+    monkeypatch.setattr(backend, "datetime", OneHourLater)
+    rebuilt = build_stage("Design", force=True)
+    assert rebuilt["status"] == "completed" and not rebuilt.get("cached")
+
+    assert build_stage("Implementation_Development")["cached"] is True
@@ -0,0 +1,32 @@
+"""Search/replace edits used by update-mode builds."""
+import pytest
+
+from app import apply_search_replace
+
+
+def test_applies_edits_in_order():
+    content = "a = 1\nb = 2\n"
+    edits = [("a = 1", "a = 10"), ("a = 10\nb = 2", "a = 10\nb = 20")]
+    assert apply_search_replace(content, edits) == "a = 10\nb = 20\n"
+
+
+def test_tolerates_surrounding_blank_lines():
+    content = "def f():\n    return 1\n"
+    assert apply_search_replace(content, [("\n\n    return 1\n\n", "    return 2")]) == "def f():\n    return 2\n"
+
+
+def test_missing_search_is_rejected():
+    with pytest.raises(ValueError, match="matched 0 times"):
+        apply_search_replace("x = 1\n", [("y = 2", "y = 3")])
+
+
+def test_ambiguous_search_is_rejected():
+    with pytest.raises(ValueError, match="matched 2 times"):
+        apply_search_replace("x = 1\nx = 1\n", [("x = 1", "x = 2")])
+
+
+def test_failed_edit_leaves_input_untouched():
+    content = "x = 1\n"
+    with pytest.raises(ValueError):
+        apply_search_replace(content, [("x = 1", "x = 2"), ("missing", "")])
+    assert content == "x = 1\n"
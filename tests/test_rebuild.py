@@ -0,0 +1,64 @@
+"""Downstream invalidation and rebuilding stale stages."""
+from datetime import datetime, timedelta
+
+import app as backend
+
+
+class OneHourLater(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + timedelta(hours=1)
+
+
+def test_identical_rebuild_leaves_downstream_fresh(project, build_stage, monkeypatch):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    build_stage("Design")
+    build_stage("Implementation_Development")
+
+    monkeypatch.setattr(backend, "datetime", OneHourLater)
+    build_stage("Design", force=True)
+    assert backend.find_stale_stages(project["dir"]) == []
+
+
+def test_raw_hashes_from_older_builds_still_match(project, build_stage):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    build_stage("Design")
+    build_stage("Implementation_Development")
+    metadata_file = project["dir"] / "Implementation_Development" / backend.STAGE_METADATA_FILE
+    metadata = backend.read_json_file(metadata_file)
+    metadata["previous_files_hashes"] = {
+        path: backend.hash_file(project["dir"] / path) for path in metadata["previous_files_hashes"]
+    }
+    backend.write_json_file(metadata_file, metadata)
+    assert backend.find_stale_stages(project["dir"]) == []
+
+
+def test_stale_rebuild_replays_stored_request(project, build_stage, monkeypatch):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    build_stage("Design", generation_mode="template", priority="batch", user="ci")
+
+    stored = backend.read_json_file(project["dir"] / "Design" / backend.STAGE_METADATA_FILE)["request"]
+    assert {key: stored[key] for key in ("generation_mode", "mode", "priority", "user")} == {
+        "generation_mode": "template", "mode": "full", "priority": "batch", "user": "ci"
+    }
+
+    # Change an upstream file so Design is stale; replace it, the old inode may be a shared blob
+    upstream = next(path for path in (project["dir"] / "Requirements_GatheringAnd_Analysis").iterdir()
+                    if path.name != backend.STAGE_METADATA_FILE and path.is_file())
+    content = upstream.read_bytes()
+    upstream.unlink()
+    upstream.write_bytes(content + b"\nchanged\n")
+
+    replayed = []
+    original = backend.execute_subtask
+
+    def recording(request):
+        replayed.append(request)
+        return original(request)
+
+    monkeypatch.setattr(backend, "execute_subtask", recording)
+    results = backend.rebuild_stale_stages(project["dir"])
+
+    assert "Design" in [result["stage"] for result in results if result["status"] == "completed"]
+    design = next(request for request in replayed if request.title == "Design")
+    assert (design.generation_mode, design.mode, design.priority, design.user) == ("template", "full", "batch", "ci")
@@ -0,0 +1,93 @@
+"""Retention decisions on blob-linked output: each inode is counted once."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as backend
+
+KB = 1024
+
+
+@pytest.fixture
+def output(tmp_path, monkeypatch):
+    """An empty output volume with its own catalog and blob store"""
+    monkeypatch.setattr(backend, "OUTPUT_BASE_DIR", tmp_path)
+    monkeypatch.setattr(backend, "BLOB_DIR", tmp_path / ".blobs")
+    monkeypatch.setattr(backend, "CATALOG_PATH", tmp_path / ".catalog.sqlite3")
+    backend.init_catalog()
+    return tmp_path
+
+
+def add_project(output, name, files, days_idle):
+    """Write a project's files through the blob store and register it in the catalog"""
+    project_dir = output / name
+    for relative, data in files.items():
+        backend.write_artifact(project_dir / relative, data)
+    backend.catalog_register_project(project_dir, {})
+    with backend.catalog_connection() as conn:
+        updated_at = (datetime.now() - timedelta(days=days_idle)).isoformat()
+        conn.execute("UPDATE projects SET updated_at = ? WHERE name = ?", (updated_at, name))
+    return project_dir
+
+
+def test_shared_blob_is_freed_only_with_its_last_link(output):
+    shared = b"s" * (8 * KB)
+    first = add_project(output, "First", {"a.md": shared, "own.md": b"1" * KB}, 3)
+    second = add_project(output, "Second", {"b.md": shared}, 2)
+
+    tally = backend.DeletionTally()
+    assert tally.add_tree(first) == KB
+    assert tally.add_tree(second) == 8 * KB
+
+
+def test_links_inside_one_project_count_once(output):
+    body = b"v" * (4 * KB)
+    # The same file carried over into two versions: three links with the blob
+    project = add_project(output, "Shop", {"v1/app.py": body, "v2/app.py": body}, 1)
+    assert (project / "v1" / "app.py").stat().st_nlink == 3
+    assert backend.DeletionTally().add_tree(project) == 4 * KB
+    assert backend.measure_directory(project) == (2, 4 * KB)
+
+
+def test_usage_counts_each_inode_once(output):
+    shared = b"s" * (16 * KB)
+    for name in ("A", "B", "C"):
+        add_project(output, name, {"same.md": shared}, 1)
+    catalog = sum(p.stat().st_size for p in output.glob(".catalog.sqlite3*"))
+    assert backend.disk_usage(output) - catalog == 16 * KB
+
+
+def test_size_budget_deletes_oldest_until_it_fits(output, monkeypatch):
+    shared = b"s" * (64 * KB)
+    add_project(output, "Oldest", {"shared.md": shared, "own.md": b"o" * (64 * KB)}, 9)
+    add_project(output, "Middle", {"shared.md": shared, "own.md": b"m" * (64 * KB)}, 5)
+    add_project(output, "Newest", {"shared.md": shared, "own.md": b"n" * (64 * KB)}, 1)
+    usage = backend.disk_usage(output)
+    # Room for everything but one project's own file; the shared blob stays in use
+    monkeypatch.setattr(backend, "RETENTION_MAX_TOTAL_MB", (usage - 60 * KB) / (1024 * 1024))
+
+    selected = backend.select_expired_projects(datetime.now())
+    assert [(p["name"], p["reason"], p["reclaimed_bytes"]) for p in selected] == [
+        ("Oldest", "max_total_size", 64 * KB)
+    ]
+
+
+def test_dry_run_reports_without_deleting(output, monkeypatch):
+    add_project(output, "Stale", {"notes.md": b"x" * KB}, 30)
+    add_project(output, "Fresh", {"notes.md": b"x" * KB}, 0)
+    monkeypatch.setattr(backend, "RETENTION_MAX_AGE_DAYS", 7)
+    monkeypatch.setattr(backend, "RETENTION_MAX_TOTAL_MB", 0)
+
+    report = backend.sweep_output(dry_run=True)
+    assert [(p["name"], p["reason"], p["reclaimed_bytes"]) for p in report["projects_removed"]] == [
+        ("Stale", "max_age", 0)
+    ]
+    assert (output / "Stale").is_dir()
+
+
+def test_pinned_projects_are_kept(output, monkeypatch):
+    add_project(output, "Keep", {"notes.md": b"k" * KB}, 30)
+    with backend.catalog_connection() as conn:
+        conn.execute("UPDATE projects SET pinned = 1 WHERE name = 'Keep'")
+    monkeypatch.setattr(backend, "RETENTION_MAX_AGE_DAYS", 7)
+    assert backend.select_expired_projects(datetime.now()) == []
@@ -0,0 +1,70 @@
+"""FairScheduler: class weights between priority classes, fair turns between tenants."""
+import threading
+import time
+
+from app import FairScheduler
+
+WEIGHTS = {"interactive": 8.0, "pipeline": 3.0, "batch": 1.0}
+
+
+def queued(scheduler):
+    return sum(entry["waiting"] for entry in scheduler.snapshot()["classes"].values())
+
+
+def run_in_order(scheduler, calls):
+    """Queue (priority, tenant) calls one by one behind a held slot, then return the grant order"""
+    granted = []
+    threads = []
+
+    def call(priority, tenant):
+        with scheduler.slot(priority, tenant):
+            granted.append((priority, tenant))
+
+    with scheduler.slot("interactive", "holder"):
+        for priority, tenant in calls:
+            before = queued(scheduler)
+            thread = threading.Thread(target=call, args=(priority, tenant))
+            thread.start()
+            threads.append(thread)
+            deadline = time.monotonic() + 5
+            while queued(scheduler) == before and time.monotonic() < deadline:
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join(timeout=5)
+    return granted
+
+
+def test_free_slot_is_granted_without_queueing():
+    scheduler = FairScheduler(2, WEIGHTS, {})
+    with scheduler.slot("batch", "a"), scheduler.slot("batch", "b"):
+        assert scheduler.snapshot()["in_flight"] == 2
+    snapshot = scheduler.snapshot()
+    assert snapshot["in_flight"] == 0
+    assert snapshot["classes"]["batch"]["dispatched"] == 2
+    assert snapshot["classes"]["batch"]["wait_ms"]["samples"] == 2
+
+
+def test_interactive_overtakes_queued_batch():
+    scheduler = FairScheduler(1, WEIGHTS, {})
+    order = run_in_order(scheduler, [("batch", "bulk")] * 3 + [("interactive", "alice")])
+    assert order[0] == ("interactive", "alice")
+    assert order[1:] == [("batch", "bulk")] * 3
+
+
+def test_tenants_take_turns_within_a_class():
+    scheduler = FairScheduler(1, WEIGHTS, {})
+    order = run_in_order(scheduler, [("batch", "big")] * 3 + [("batch", "small")])
+    assert [tenant for _, tenant in order] == ["big", "small", "big", "big"]
+
+
+def test_tenant_weights():
+    scheduler = FairScheduler(1, WEIGHTS, {"ci": 2.0})
+    order = run_in_order(scheduler, [("pipeline", "ci")] * 4 + [("pipeline", "dev")] * 2)
+    assert [tenant for _, tenant in order] == ["ci", "dev", "ci", "ci", "dev", "ci"]
+
+
+def test_class_weights_share_slots():
+    scheduler = FairScheduler(1, {"interactive": 1.0, "pipeline": 3.0, "batch": 1.0}, {})
+    order = run_in_order(scheduler, [("batch", "b")] * 4 + [("pipeline", "p")] * 4)
+    # Pipeline has three times the weight, so it gets three grants for each batch grant
+    assert [priority for priority, _ in order[:4]].count("pipeline") == 3
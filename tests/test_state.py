@@ -0,0 +1,77 @@
+"""SQLite state store job queue: atomic claims and requeueing jobs of dead workers."""
+import threading
+import time
+
+import app as backend
+
+
+def make_store(tmp_path):
+    return backend.SQLiteStateStore(tmp_path / "state.sqlite3", tmp_path / "locks")
+
+
+def test_each_job_is_claimed_once(tmp_path):
+    store = make_store(tmp_path)
+    ids = {store.enqueue("q", {"n": n}) for n in range(20)}
+    claimed = []
+
+    def worker():
+        while (job := store.claim("q")) is not None:
+            claimed.append(job[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_unfinished_claim_is_requeued_after_timeout(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    job_id = store.enqueue("q", {"file": "app.py"})
+    assert store.claim("q") == (job_id, {"file": "app.py"})
+    assert store.claim("q") is None  # still within its claim timeout
+
+    monkeypatch.setattr(backend, "JOB_CLAIM_TIMEOUT", -1)
+    assert store.claim("q") == (job_id, {"file": "app.py"})
+    store.finish(job_id)
+    assert store.claim("q") is None
+    assert store.job(job_id)["status"] == "done"
+
+
+def test_redis_url_without_package_refuses_to_start(monkeypatch):
+    monkeypatch.setattr(backend, "REDIS_URL", "redis://redis:6379/0")
+    monkeypatch.setattr(backend, "redis", None)
+    monkeypatch.setattr(backend, "_state_store", None)
+    try:
+        backend.get_state_store()
+    except RuntimeError as e:
+        assert "redis package" in str(e)
+    else:
+        raise AssertionError("fell back to a per-host store")
+
+
+class FakeRedisLock:
+    def __init__(self):
+        self.renewals = 0
+        self.released = False
+
+    def acquire(self):
+        return True
+
+    def reacquire(self):
+        self.renewals += 1
+
+    def release(self):
+        self.released = True
+
+
+def test_redis_lock_is_renewed_while_held(monkeypatch):
+    fake = FakeRedisLock()
+    store = backend.RedisStateStore.__new__(backend.RedisStateStore)
+    store.client = type("Client", (), {"lock": lambda self, *args, **kwargs: fake})()
+    monkeypatch.setattr(backend, "REDIS_LOCK_TTL", 0.15)
+    with store.lock("stage:Shop:Deployment"):
+        time.sleep(0.4)  # several TTLs: an unrenewed lock would have expired
+    assert fake.renewals >= 3
+    assert fake.released
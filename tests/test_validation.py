@@ -0,0 +1,57 @@
+"""Generated file validation: the worker pool, its shared deadline and syntax checks."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as backend
+import validators
+
+
+def test_syntax_checks():
+    assert validators.check_file_syntax("ok.py", "import os\nfrom json import loads\n") == {
+        "error": None, "imports": ["json", "os"]
+    }
+    assert validators.check_file_syntax("bad.py", "def broken(:\n")["error"].startswith("SyntaxError")
+    assert validators.check_file_syntax("bad.json", "{")["error"]
+    assert validators.check_file_syntax("schema.sql", "CREATE EXTENSION x;\nSELECT * FROM missing;\n")["error"] is None
+    assert validators.check_file_syntax("bad.sql", "SELEC 1;\n")["error"]
+
+
+def test_pool_does_not_fork(tmp_path):
+    executor = backend.get_validation_executor()
+    assert executor._mp_context.get_start_method() in ("spawn", "forkserver")
+    path = tmp_path / "module.py"
+    path.write_text("import requests\n", encoding="utf-8")
+    report = backend.validate_generated_files(tmp_path, [str(path)])
+    assert report["valid"] == ["module.py"]
+    assert report["warnings"] == [{"file": "module.py", "unresolved_imports": ["requests"]}]
+
+
+def test_one_deadline_for_the_batch_and_pool_recycled(tmp_path, monkeypatch):
+    release = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=4)
+    recycled = []
+
+    def stuck(filename, content):
+        release.wait(5)
+        return {"error": None, "imports": []}
+
+    monkeypatch.setattr(backend, "check_file_syntax", stuck)
+    monkeypatch.setattr(backend, "get_validation_executor", lambda: pool)
+    monkeypatch.setattr(backend, "recycle_validation_executor", recycled.append)
+    monkeypatch.setattr(backend, "VALIDATION_TIMEOUT", 0.3)
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"slow_{index}.py"
+        path.write_text(f"x = {index}  # {time.time()}\n", encoding="utf-8")
+        paths.append(str(path))
+
+    started = time.monotonic()
+    report = backend.validate_generated_files(tmp_path, paths)
+    elapsed = time.monotonic() - started
+    release.set()
+    pool.shutdown()
+
+    assert elapsed < 0.9  # not 3 x 0.3s
+    assert [entry["error"] for entry in report["invalid"]] == ["Validation timed out"] * 3
+    assert recycled == [pool]
@@ -0,0 +1,107 @@
+"""Versioned stage snapshots: builds, rollback, discarded failures and repairs inside versions."""
+import os
+from pathlib import Path
+
+import app as backend
+
+
+def test_rebuild_creates_new_version(client, project, build_stage):
+    first = build_stage("Requirements_GatheringAnd_Analysis")
+    second = build_stage("Requirements_GatheringAnd_Analysis", force=True)
+    assert (first["status"], second["status"]) == ("completed", "completed")
+    assert (first["version"], second["version"]) == (1, 2)
+
+    stage_dir = project["dir"] / "Requirements_GatheringAnd_Analysis"
+    assert stage_dir.is_symlink()
+    assert os.readlink(stage_dir) == ".versions/Requirements_GatheringAnd_Analysis/v0002"
+
+    versions = client.get(f"/projects/{project['project_name']}/stages/Requirements_GatheringAnd_Analysis/versions").json()
+    assert [(v["version"], v["current"]) for v in versions["versions"]] == [(1, False), (2, True)]
+
+
+def test_memoized_build_keeps_version(project, build_stage):
+    build_stage("Design")
+    again = build_stage("Design")
+    assert again["cached"] is True
+    assert backend.list_stage_versions(project["dir"], "Design")[-1].name == "v0001"
+
+
+def test_full_rebuild_shares_unchanged_files_with_previous_version(project, build_stage):
+    build_stage("Design")
+    first = backend.current_stage_version(project["dir"], "Design")
+    # A read-only copy outside the blob store, as left by an older release
+    schema = next(first.glob("*.sql"))
+    data = schema.read_bytes()
+    schema.unlink()
+    backend.write_private_file(schema, data, backend.BLOB_MODE)
+
+    build_stage("Design", force=True)
+    second = backend.current_stage_version(project["dir"], "Design")
+    assert second.name == "v0002"
+    for source in first.rglob("*"):
+        if source.is_file() and source.name != backend.STAGE_METADATA_FILE:
+            assert os.path.samefile(source, second / source.relative_to(first)), source.name
+
+
+def test_rollback_and_diff(client, project, build_stage):
+    build_stage("Requirements_GatheringAnd_Analysis")
+    build_stage("Requirements_GatheringAnd_Analysis", force=True)
+    base = f"/projects/{project['project_name']}/stages/Requirements_GatheringAnd_Analysis"
+
+    diff = client.get(f"{base}/diff", params={"from_version": 1}).json()
+    assert diff["from_version"] == 1 and diff["to_version"] == 2
+    assert "requirements.json" in diff["changed"] + diff["unchanged"]
+
+    response = client.post(f"{base}/rollback", params={"version": 1})
+    assert response.status_code == 200
+    assert backend.current_stage_version(project["dir"], "Requirements_GatheringAnd_Analysis").name == "v0001"
+    assert (project["dir"] / "Requirements_GatheringAnd_Analysis" / "requirements.json").is_file()
+
+    assert client.post(f"{base}/rollback", params={"version": 9}).status_code == 404
+
+
+def test_failed_build_is_discarded(project, build_stage, monkeypatch):
+    build_stage("Design")
+
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(backend, "point_stage_at", broken)
+    result = build_stage("Design", force=True)
+    assert result["status"] == "failed"
+    assert [v.name for v in backend.list_stage_versions(project["dir"], "Design")] == ["v0001"]
+    assert backend.current_stage_version(project["dir"], "Design").name == "v0001"
+
+
+def test_stage_relative_path_accepts_both_forms(tmp_path):
+    project_dir = tmp_path / "Shop"
+    assert backend.stage_relative_path(project_dir, project_dir / "Design" / "api" / "spec.yaml") == "api/spec.yaml"
+    version_path = project_dir / ".versions" / "Design" / "v0003" / "api" / "spec.yaml"
+    assert backend.stage_relative_path(project_dir, version_path) == "api/spec.yaml"
+
+
+def test_repair_inside_version_directory(project, build_stage, monkeypatch):
+    build_stage("Implementation_Development")
+    version_dir = backend.current_stage_version(project["dir"], "Implementation_Development")
+    broken = version_dir / "app.py"
+    # Replace rather than write in place: the file may share its inode with the blob store
+    broken.unlink()
+    broken.write_text("def broken(:\n", encoding="utf-8")
+
+    asked_for = []
+
+    def regenerate(subtask, base_content, filename, current, problem=""):
+        asked_for.append(filename)
+        return "def fixed():\n    return 1\n"
+
+    monkeypatch.setattr(backend, "regenerate_file_in_full", regenerate)
+    subtask = backend.SubtaskRequest(
+        id=3, title="Implementation_Development", description="d", how_to_build="h",
+        Agent_Name="Developer", project_name=project["project_name"]
+    )
+    validation = backend.validate_and_repair(subtask, "", project["dir"], [str(broken)])
+
+    assert asked_for == ["app.py"]
+    assert validation["repairs"]["repaired"] == [str(Path(".versions") / "Implementation_Development" / version_dir.name / "app.py")]
+    assert validation["invalid"] == []
+    assert "def fixed" in (project["dir"] / "Implementation_Development" / "app.py").read_text(encoding="utf-8")
@@ -0,0 +1,67 @@
+"""Syntax checks for generated files.
+
+Kept apart from app.py because they run in the validation worker processes, which are
+started fresh (spawn/forkserver) and import only this module, not the backend with its
+catalog, sweeper and LLM client.
+"""
+import ast
+import json
+import re
+import sqlite3
+from pathlib import Path
+
+try:
+    import yaml  # optional, used to validate generated YAML
+except ImportError:
+    yaml = None
+
+# SQLite only vouches for syntax; statements it does not support at all are skipped
+SQL_SYNTAX_ERRORS = ("syntax error", "incomplete input", "unrecognized token")
+SQL_UNSUPPORTED_STATEMENT = re.compile(
+    r'^\s*(CREATE\s+(OR\s+REPLACE\s+)?(EXTENSION|TYPE|FUNCTION|PROCEDURE|SCHEMA|ROLE|USER|DATABASE|SEQUENCE|DOMAIN)'
+    r'|GRANT|REVOKE|SET|USE|DO|COMMENT\s+ON|DELIMITER)\b',
+    re.IGNORECASE
+)
+
+def check_sql_syntax(content: str):
+    """Run each statement against an empty in-memory database, failing only on syntax errors"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        statement = ""
+        for line in content.splitlines(keepends=True):
+            statement += line
+            if not sqlite3.complete_statement(statement):
+                continue
+            if not SQL_UNSUPPORTED_STATEMENT.match(statement):
+                try:
+                    conn.execute(statement)
+                except sqlite3.Error as e:
+                    # Missing tables and the like are fine; the script only has to parse
+                    if any(marker in str(e).lower() for marker in SQL_SYNTAX_ERRORS):
+                        raise ValueError(f"{str(e)} in: {statement.strip()[:120]}")
+            statement = ""
+        if statement.strip() and not re.fullmatch(r'(\s|--[^\n]*)*', statement):
+            raise ValueError(f"incomplete statement at end of file: {statement.strip()[:120]}")
+    finally:
+        conn.close()
+
+def check_file_syntax(filename: str, content: str) -> dict:
+    """Parse one file; returns its error (or None) and the top-level modules it imports"""
+    suffix = Path(filename).suffix.lower()
+    imports = set()
+    try:
+        if suffix == '.py':
+            for node in ast.walk(ast.parse(content, filename=filename)):
+                if isinstance(node, ast.Import):
+                    imports.update(alias.name.split('.')[0] for alias in node.names)
+                elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                    imports.add(node.module.split('.')[0])
+        elif suffix == '.json':
+            json.loads(content)
+        elif suffix in ['.yaml', '.yml'] and yaml is not None:
+            list(yaml.safe_load_all(content))  # compose and k8s files may hold several documents
+        elif suffix == '.sql':
+            check_sql_syntax(content)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {str(e)}", "imports": []}
+    return {"error": None, "imports": sorted(imports)}